@@ -6,7 +6,7 @@ import { Clock, User, CalendarDays, AlertTriangle, BriefcaseMedical } from 'luci
 export default function WaitingTimePredictor() {
     const [inputs, setInputs] = useState({
         hour: 14,
-        dayOfWeek: 2,
+        dayOfWeek: 1,
         month: 3,
         queueLength: 5,
         serviceTime: 10,
@@ -115,7 +115,7 @@ export default function WaitingTimePredictor() {
                                 required
                             >
                                 {['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'].map((day, i) => (
-                                    <option key={i} value={i + 1}>{day}</option>
+                                    <option key={i} value={i}>{day}</option>
                                 ))}
                             </select>
                         </div>
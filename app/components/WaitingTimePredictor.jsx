@@ -29,7 +29,7 @@ export default function WaitingTimePredictor() {
       // Make sure dayOfWeek is 0-indexed (0-6) as the model expects
       const adjustedInputs = {
         ...inputs,
-        dayOfWeek: parseInt(inputs.dayOfWeek), // Convert 1-7 to 0-6
+        dayOfWeek: parseInt(inputs.dayOfWeek) - 1, // Convert 1-7 to 0-6
       };
       
       const response = await fetch('/api/predictwaitingtime', {
@@ -1,150 +1,1270 @@
 # python/app.py
-from flask import Flask, request, jsonify
-import pickle
+from flask import Flask, Response, g, request, jsonify
 import pandas as pd
 import numpy as np
+import time
+import warnings
 from datetime import datetime
+from types import SimpleNamespace
+
+from features import (WaitingTimeEncoder, ResourceEncoder, MAX_HORIZON_DAYS, WAITING_TIME_FEATURES, resource_schema,
+                      shared_preprocessor)
+from flat_trees import JointRegressors
+from model_server import ModelServer, final_step, serves
+from registry import ModelRegistry, ModelUnavailable, load_compiled
+from cache import PredictionCache, cached_predict
+from lookup import WaitingTimeLookup
+from batching import MicroBatcher, inference_pool
+from metrics import BATCH_SIZE_BUCKETS, MetricsRegistry, SlowRequestProfiler, StageTimer
+from schemas import Choice, Date, Identifier, Number, RequestError, Schema, Text
+from matching import assign, expected_minutes
+from queues import PatientQueues
+import simulation
+from calendars import HolidayCalendars
+from events import EventStore, LiveFlowInputs, MAX_REPORTED_ERRORS, read_events, validate_events
 
 app = Flask(__name__)
 
 import os
 
+# Models fitted on DataFrames warn on every ndarray predict; the encoders guarantee column order
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+
+# 0 never unpickles anything from MODELS_DIR: models load from their exported artifacts only
+# (python python/artifacts.py), and batches too large for the flat arrays get no sklearn fallback
+ALLOW_PICKLE_MODELS = os.environ.get('ALLOW_PICKLE_MODELS', '1') == '1'
+
+# Load every model at import instead of on first request (e.g. gunicorn --preload)
+PRELOAD_MODELS = os.environ.get('PRELOAD_MODELS', '0') == '1'
+# Seconds between checks of models/ for retrained pickles, 0 = reload only via the admin route
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 0))
+# Required in the X-Admin-Token header of admin routes; unset means loopback callers only
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Prediction caches, keyed on the normalized inputs each model actually sees
+CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 0))  # seconds, 0 = no expiry
+# serviceTime is rounded to this step (minutes) before prediction so kiosk requests share entries
+SERVICE_TIME_STEP = float(os.environ.get('PREDICTION_CACHE_SERVICE_TIME_STEP', 1.0))
+
+# Serving mode: >0 offloads all model inference to a bounded pool of this many threads and
+# merges concurrent single-record requests arriving within MICRO_BATCH_WINDOW_MS into one predict
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0))
+MICRO_BATCH_WINDOW_MS = float(os.environ.get('MICRO_BATCH_WINDOW_MS', 2))
+MICRO_BATCH_MAX = int(os.environ.get('MICRO_BATCH_MAX', 256))
+# Run the tree ensembles in this many inference processes (-1: one per core), handed encoded
+# feature blocks through shared memory (see model_server.py); 0 predicts in this process
+MODEL_SERVER_WORKERS = int(os.environ.get('MODEL_SERVER_WORKERS', 0))
+
+# Answer waiting-time requests from the precomputed table built by `python python/lookup.py`
+USE_WAITING_TIME_LOOKUP = os.environ.get('WAITING_TIME_LOOKUP', '0') == '1'
+
+# Largest clinic session /api/matchappointments accepts in one request
+MAX_SESSION_PATIENTS = int(os.environ.get('MAX_SESSION_PATIENTS', 10000))
+MAX_SESSION_DOCTORS = int(os.environ.get('MAX_SESSION_DOCTORS', 1000))
+
+# What-if simulation limits per /api/simulate request, and its worker processes per serving
+# process (0 = the cores divided among the SERVE_WORKERS processes serve.py forks)
+MAX_SIMULATION_SCENARIOS = int(os.environ.get('MAX_SIMULATION_SCENARIOS', 10))
+MAX_SIMULATION_REPLICATIONS = int(os.environ.get('MAX_SIMULATION_REPLICATIONS', 1000))
+SIMULATION_WORKERS = (int(os.environ.get('SIMULATION_WORKERS', 0))
+                      or max(1, (os.cpu_count() or 1) // int(os.environ.get('SERVE_WORKERS', 1))))
+
+# Arrival / completion event store behind the live queueLength and serviceTime inputs
+EVENT_STORE_DIR = os.environ.get('EVENT_STORE_DIR', os.path.join(BASE_DIR, 'data', 'events'))
+EVENT_STORE_FORMAT = os.environ.get('EVENT_STORE_FORMAT') or None  # parquet / npz, default parquet if available
+ROLLING_SERVICE_WINDOW = int(os.environ.get('ROLLING_SERVICE_WINDOW', 50))  # completions averaged
+MAX_INGEST_EVENTS = int(os.environ.get('MAX_INGEST_EVENTS', 100_000))
+
+# One holiday calendar file per region (see calendars.py); requests without a region use HOLIDAY_REGION
+HOLIDAY_DIR = os.environ.get('HOLIDAY_DIR', os.path.join(BASE_DIR, 'holidays'))
+HOLIDAY_REGION = os.environ.get('HOLIDAY_REGION', 'IN')
+
+# Requests slower than this (milliseconds) are stack-sampled and their profile logged, 0 = off
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+SLOW_REQUEST_SAMPLE_MS = float(os.environ.get('SLOW_REQUEST_SAMPLE_MS', 5))
+
+waiting_time_cache = PredictionCache(CACHE_SIZE, CACHE_TTL)
+appointment_cache = PredictionCache(CACHE_SIZE, CACHE_TTL)
+resource_cache = PredictionCache(CACHE_SIZE, CACHE_TTL)
+
+holiday_calendars = HolidayCalendars(HOLIDAY_DIR)
+
+model_server = ModelServer(MODEL_SERVER_WORKERS) if MODEL_SERVER_WORKERS else None
+
+# Rolling per-department inputs, restored from the event store at startup. Like the patient
+# queues they live in this process: post events to every worker, or run a single one.
+live_flow = LiveFlowInputs(EventStore(EVENT_STORE_DIR, EVENT_STORE_FORMAT), ROLLING_SERVICE_WINDOW)
+
+# Served on /metrics in the Prometheus text format. Prediction routes mark their stages:
+# parse (JSON body), features (record validation), inference (caches, batching and the
+# model calls) and serialize (building the response); model calls time their own stages.
+metrics = MetricsRegistry()
+REQUESTS = metrics.counter('api_requests_total', 'Requests handled', ['endpoint', 'method', 'status'])
+REQUEST_ERRORS = metrics.counter('api_request_errors_total', 'Requests answered with a 4xx or 5xx status',
+                                 ['endpoint'])
+REQUEST_SECONDS = metrics.histogram('api_request_duration_seconds', 'Request handling time', ['endpoint'])
+REQUEST_STAGE_SECONDS = metrics.histogram('api_request_stage_seconds', 'Request handling time by stage',
+                                          ['endpoint', 'stage'])
+REQUEST_RECORDS = metrics.histogram('api_request_records', 'Records per prediction request', ['endpoint'],
+                                    BATCH_SIZE_BUCKETS)
+MODEL_STAGE_SECONDS = metrics.histogram('model_stage_seconds', 'Model call time by stage (lookup, encode, predict)',
+                                        ['model', 'stage'])
+MODEL_BATCH_ROWS = metrics.histogram('model_batch_rows', 'Rows per model call, after caching and micro-batching',
+                                     ['model'], BATCH_SIZE_BUCKETS)
+EVENTS_INGESTED = metrics.counter('flow_events_ingested_total', 'Arrival and completion events stored')
+
+slow_request_profiler = None
+if SLOW_REQUEST_MS > 0:
+    slow_request_profiler = SlowRequestProfiler(
+        SLOW_REQUEST_MS / 1000, SLOW_REQUEST_SAMPLE_MS / 1000,
+        on_slow=lambda profile: app.logger.warning(
+            'slow request %s took %.1f ms; hottest stack (%d of %d samples): %s', profile['request'],
+            profile['durationMs'], profile['stacks'][0]['samples'] if profile['stacks'] else 0,
+            profile['samples'], profile['stacks'][0]['stack'] if profile['stacks'] else '-'))
+
+
+def model_predict(entry, name, model, X, method='predict'):
+    # model.<method>(X) for the registry entry's model `name`; with the model server on,
+    # pipelines preprocess here and their flat tree evaluator runs in the inference processes.
+    # Load-time probes run before the entry has a version, so always in this process.
+    final = getattr(model, 'final', model)
+    version = getattr(entry, 'version', None)
+    if model_server is None or version is None or not serves(final):
+        return getattr(model, method)(X)
+    final, X = final_step(model, X)
+    key = (name, version)
+    if method == 'predict' and hasattr(final, 'classes_'):
+        return final.classes_.take(model_server.predict(key, final, X, 'predict_proba').argmax(axis=1))
+    return model_server.predict(key, final, X, method)
+
+
+def load_model(name):
+    # Compiled into flat array evaluators, kept next to the pickle as a pickle-free artifact
+    return load_compiled(model_path(name), artifact_path(name), ALLOW_PICKLE_MODELS)
+
+
+def model_path(name):
+    return os.path.join(MODELS_DIR, f"{name}.pkl")
+
+
+def artifact_path(name):
+    return os.path.join(MODELS_DIR, f"{name}.artifact")
+
+
+def model_source(name):
+    # The file a model's version and hot reloads follow: its pickle, or its artifact's manifest
+    path = model_path(name)
+    if ALLOW_PICKLE_MODELS and os.path.exists(path):
+        return path
+    return os.path.join(artifact_path(name), 'manifest.json')
+
+
+# Quantile models behind ?intervals=1 on the waiting-time routes (trained by PatientFlowPrediction.py
+# or train.py); optional, but if one is installed all must be. Installing them needs a restart.
+WAITING_TIME_QUANTILES = {'p10': 'patient_flow_p10_model', 'p50': 'patient_flow_p50_model',
+                          'p90': 'patient_flow_p90_model'}
+INSTALLED_QUANTILES = [name for name in WAITING_TIME_QUANTILES.values() if os.path.exists(model_source(name))]
+
+
+# Known-good inputs every freshly loaded model must answer before it is swapped in
+PROBE_WAITING_TIME = (14.0, 2.0, 3.0, 5.0, 10.0, 'Routine', 'General')
+PROBE_APPOINTMENT = {'Age': 65.0, 'Gender': 'M', 'VisitType': 'New', 'Urgency': 'High', 'Department': 'Cardiology'}
+PROBE_RESOURCES = (2023, 5, 0, 'Emergency', 250.0, 45.0, 3.5, 0)
+
+
+def load_patient_flow():
+    model = load_model("patient_flow_model")
+
+    lookup = None
+    if USE_WAITING_TIME_LOOKUP and os.path.exists(model_path("patient_flow_model")):
+        lookup = WaitingTimeLookup.load(model_path("patient_flow_model"))
+        if lookup is None:
+            app.logger.warning('WAITING_TIME_LOOKUP is set but no lookup table matches patient_flow_model.pkl')
+
+    # Column slots are resolved once here instead of back-filling a DataFrame per request
+    encoder = WaitingTimeEncoder(getattr(model, 'feature_names_in_', None))
+    flow = SimpleNamespace(model=model, encoder=encoder, lookup=lookup, queue_schema=queue_schema(encoder),
+                           intervals=waiting_time_intervals(model))
+    if not np.isfinite(waiting_time_results(flow, [PROBE_WAITING_TIME])[0]['waitingTime']):
+        raise ValueError('probe prediction is not finite')
+    if flow.intervals is not None:
+        probe = waiting_time_interval_results(flow, [PROBE_WAITING_TIME])[0]
+        if not np.isfinite(list(probe['quantiles'].values())).all():
+            raise ValueError('probe quantiles are not finite')
+    return flow
+
+
+def waiting_time_intervals(model):
+    # The point and quantile models as one evaluator over a shared feature matrix (the union
+    # of their fitted features, encoded once), or None without quantile models
+    if not INSTALLED_QUANTILES:
+        return None
+    if len(INSTALLED_QUANTILES) != len(WAITING_TIME_QUANTILES):
+        missing = sorted(set(WAITING_TIME_QUANTILES.values()) - set(INSTALLED_QUANTILES))
+        raise ValueError(f'waiting-time quantile models are incomplete; missing {missing}')
+    models = [model] + [load_model(name) for name in INSTALLED_QUANTILES]
+    model_features = [list(getattr(m, 'feature_names_in_', WAITING_TIME_FEATURES)) for m in models]
+    encoder = WaitingTimeEncoder(list(dict.fromkeys(name for names in model_features for name in names)))
+    slots = {name: i for i, name in enumerate(encoder.feature_names)}
+    return SimpleNamespace(encoder=encoder,
+                           models=JointRegressors(models, [[slots[name] for name in names] for names in model_features]))
+
+
+def load_appointment_scheduling():
+    model = load_model("appointment_scheduling_model")
+    scheduling = SimpleNamespace(model=model, schema=appointment_schema(fitted_categories(model)))
+    appointment_results(scheduling, [PROBE_APPOINTMENT])
+    return scheduling
+
+
+def load_resource_allocation():
+    bed_model = load_model("resource_allocation_bed_model")
+    staff_model = load_model("resource_allocation_staff_model")
+    bed_encoder, staff_encoder = resource_encoders(bed_model, staff_model)
+    # Only departments both regressors were fitted on are accepted
+    departments = [dept for dept in bed_encoder.categories['Department']
+                   if dept in staff_encoder.categories['Department']]
+    resources = SimpleNamespace(bed_model=bed_model, staff_model=staff_model,
+                                bed_encoder=bed_encoder, staff_encoder=staff_encoder,
+                                departments=departments, schema=resource_schema(departments))
+    bed_occupancy, staff_needed = predict_resource_columns(resources, ResourceEncoder.row_columns([PROBE_RESOURCES]))
+    if not (np.isfinite(bed_occupancy).all() and np.isfinite(staff_needed).all()):
+        raise ValueError('probe prediction is not finite')
+    return resources
+
+
+# Each model loads on first use; a missing or broken one only disables its own endpoints.
+# Handlers fetch their entry once and use it throughout, so a hot reload never mixes
+# versions inside one request. Cache keys carry the version; a load just frees old entries.
+registry = ModelRegistry()
+registry.register('patient_flow', load_patient_flow,
+                  [model_source("patient_flow_model")] + [model_source(name) for name in INSTALLED_QUANTILES],
+                  on_load=waiting_time_cache.invalidate)
+registry.register('appointment_scheduling', load_appointment_scheduling, [model_source("appointment_scheduling_model")],
+                  on_load=appointment_cache.invalidate)
+registry.register('resource_allocation', load_resource_allocation,
+                  [model_source("resource_allocation_bed_model"), model_source("resource_allocation_staff_model")],
+                  on_load=resource_cache.invalidate)
+
+
+metrics.collected('model_loaded', 'Whether a model is loaded, labelled with its version', ['model', 'version'],
+                  lambda: {(name, status['version'] or ''): int(status['state'] == 'loaded')
+                           for name, status in registry.status().items()})
+CACHES = {'predictwaitingtime': waiting_time_cache, 'scheduleappointment': appointment_cache,
+          'predictresources': resource_cache}
+metrics.collected('prediction_cache_hits_total', 'Prediction cache hits', ['cache'],
+                  lambda: {(name,): cache.hits for name, cache in CACHES.items()}, kind='counter')
+metrics.collected('prediction_cache_misses_total', 'Prediction cache misses', ['cache'],
+                  lambda: {(name,): cache.misses for name, cache in CACHES.items()}, kind='counter')
+
+
+@app.errorhandler(ModelUnavailable)
+def model_unavailable(e):
+    return jsonify({'error': str(e)}), 503
+
+
+@app.errorhandler(RequestError)
+def invalid_request(e):
+    return jsonify(e.body()), 400
+
+
+@app.before_request
+def start_request_timer():
+    g.timer = StageTimer()
+    if slow_request_profiler is not None:
+        slow_request_profiler.begin()
+
+
+def stage(name):
+    # Charge the time since the previous stage of this request to `name`
+    g.timer.mark(name)
+
+
+def record_count(n):
+    # Records in this request, for batch routes; other prediction routes count as one
+    g.records = n
+
+
+@app.after_request
+def record_request(response):
+    timer = g.get('timer')
+    if timer is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    if timer.stages:
+        timer.mark('serialize')
+        for name, seconds in timer.stages:
+            REQUEST_STAGE_SECONDS.observe(seconds, endpoint, name)
+        REQUEST_RECORDS.observe(g.get('records', 1), endpoint)
+    REQUEST_SECONDS.observe(time.perf_counter() - timer.started, endpoint)
+    REQUESTS.inc(endpoint, request.method, response.status_code)
+    if response.status_code >= 400:
+        REQUEST_ERRORS.inc(endpoint)
+    return response
+
+
+@app.teardown_request
+def profile_slow_request(exc):
+    timer = g.get('timer')
+    if slow_request_profiler is not None and timer is not None:
+        slow_request_profiler.end(time.perf_counter() - timer.started, f'{request.method} {request.path}')
+
+
+def json_body():
+    data = request.get_json(silent=True)
+    if data is None:
+        raise RequestError({}, 'request body must be JSON (Content-Type: application/json)')
+    return data
+
+
+def batch_records(payload):
+    # A batch is either a JSON array of records or a columnar object of equal-length lists
+    if isinstance(payload, list):
+        return payload
+
+    if isinstance(payload, dict) and payload:
+        columns = list(payload.values())
+        if not all(isinstance(column, list) for column in columns):
+            raise ValueError('columnar batch values must all be lists')
+        n_records = len(columns[0])
+        if any(len(column) != n_records for column in columns):
+            raise ValueError('columnar batch lists must all have the same length')
+        return [dict(zip(payload.keys(), values)) for values in zip(*columns)]
+
+    raise ValueError('batch must be a JSON array of records or a columnar JSON object')
+
+
+def build_batch(records, build_features):
+    # Build features record by record so one bad record only fails itself
+    rows, errors = [], {}
+    for i, record in enumerate(records):
+        try:
+            rows.append(build_features(record))
+        except RequestError as e:
+            errors[i] = e.body()
+    return rows, errors
+
+
+def merge_batch(n_records, errors, results):
+    # Put predictions back in input order, interleaved with the per-record errors
+    results = iter(results)
+    return [errors[i] if i in errors else next(results) for i in range(n_records)]
+
 
-# Load models with absolute paths
-with open(os.path.join(BASE_DIR, "models/patient_flow_model.pkl"), "rb") as f:
-    patient_flow_model = pickle.load(f)
+def versioned(entry, keys):
+    return [(entry.version, key) for key in keys]
 
-with open(os.path.join(BASE_DIR, "models/appointment_scheduling_model.pkl"), "rb") as f:
-    appointment_scheduling_model = pickle.load(f)
 
-with open(os.path.join(BASE_DIR, "models/resource_allocation_bed_model.pkl"), "rb") as f:
-    resource_allocation_bed_model = pickle.load(f)
+def run_inference(predict, *args):
+    if INFERENCE_THREADS > 0:
+        return inference_pool(INFERENCE_THREADS).submit(predict, *args).result()
+    return predict(*args)
 
-with open(os.path.join(BASE_DIR, "models/resource_allocation_staff_model.pkl"), "rb") as f:
-    resource_allocation_staff_model = pickle.load(f)
+
+def micro_batcher(predict_rows):
+    # Single-record endpoints share one vectorized predict when requests arrive together
+    if INFERENCE_THREADS <= 0 or MICRO_BATCH_WINDOW_MS <= 0:
+        return None
+
+    def predict_batch(rows):
+        version, results = predict_rows(rows)
+        return [(version, result) for result in results]
+
+    return MicroBatcher(predict_batch, INFERENCE_THREADS, MICRO_BATCH_WINDOW_MS / 1000, MICRO_BATCH_MAX)
+
+
+def predict_one(batcher, predict_rows, row):
+    if batcher is not None:
+        return batcher(row)
+    version, results = run_inference(predict_rows, [row])
+    return version, results[0]
+
+
+def holiday_calendar(region):
+    # The calendar of a request's region, or of HOLIDAY_REGION when it names none (None if
+    # that has no file: IsHoliday stays 0)
+    if region is None:
+        return holiday_calendars.get(HOLIDAY_REGION)
+    calendar = holiday_calendars.get(region)
+    if calendar is None:
+        raise RequestError({'region': f'no holiday calendar; known regions are {holiday_calendars.regions()}'})
+    return calendar
+
+
+def is_holiday(day, region):
+    calendar = holiday_calendar(region)
+    return calendar.is_holiday(day) if calendar is not None and day is not None else 0
+
+
+def parse_waiting_time(flow, data):
+    # queueLength and serviceTime default to the department's live values, once it has events;
+    # IsHoliday comes from the optional date
+    (hour, day_of_week, month, queue_length, service_time, patient_type, department, day,
+     region) = flow.encoder.parse(live_flow.fill(data))
+    if SERVICE_TIME_STEP > 0:
+        service_time = round(service_time / SERVICE_TIME_STEP) * SERVICE_TIME_STEP
+    return (hour, day_of_week, month, queue_length, service_time, patient_type, department,
+            is_holiday(day, region))
+
+
+def waiting_time_results(flow, rows):
+    MODEL_BATCH_ROWS.observe(len(rows), 'patient_flow')
+    waiting_times = np.full(len(rows), np.nan)
+    answered = np.zeros(len(rows), dtype=bool)
+    if flow.lookup is not None:
+        with MODEL_STAGE_SECONDS.time('patient_flow', 'lookup'):
+            waiting_times, answered = flow.lookup.predict(rows)
+
+    # Make prediction for whatever the lookup table could not answer
+    missing = np.flatnonzero(~answered)
+    if len(missing):
+        with MODEL_STAGE_SECONDS.time('patient_flow', 'encode'):
+            X = flow.encoder.encode([rows[i] for i in missing])
+        with MODEL_STAGE_SECONDS.time('patient_flow', 'predict'):
+            waiting_times[missing] = model_predict(flow, 'patient_flow', flow.model, X)
+    return [{'waitingTime': float(w)} for w in waiting_times]
+
+
+def waiting_time_interval_results(flow, rows):
+    # Point and quantile predictions from one encode and one tree traversal. The lookup
+    # table only holds point predictions, so it is not consulted here.
+    MODEL_BATCH_ROWS.observe(len(rows), 'patient_flow')
+    with MODEL_STAGE_SECONDS.time('patient_flow', 'encode'):
+        X = flow.intervals.encoder.encode(rows)
+    with MODEL_STAGE_SECONDS.time('patient_flow', 'predict'):
+        predictions = model_predict(flow, 'patient_flow_intervals', flow.intervals.models, X)
+    # The quantile models are fitted independently and can cross; sorting restores p10 <= p50 <= p90
+    quantiles = np.sort(predictions[:, 1:], axis=1)
+    return [{'waitingTime': float(point), 'quantiles': dict(zip(WAITING_TIME_QUANTILES, q.tolist()))}
+            for point, q in zip(predictions[:, 0], quantiles)]
+
+
+def predict_waiting_times(rows):
+    flow = registry.get('patient_flow')
+    results = cached_predict(waiting_time_cache, versioned(flow, rows), rows,
+                             lambda missing: waiting_time_results(flow, missing))
+    return flow.version, results
+
+
+def predict_waiting_time_intervals(rows):
+    flow = registry.get('patient_flow')
+    keys = [(flow.version, 'intervals', row) for row in rows]
+    results = cached_predict(waiting_time_cache, keys, rows,
+                             lambda missing: waiting_time_interval_results(flow, missing))
+    return flow.version, results
+
+
+def intervals_requested(flow):
+    # ?intervals=1 adds p10 / p50 / p90 waiting times to each prediction
+    value = request.args.get('intervals', '0').lower()
+    if value not in ('0', '1', 'false', 'true'):
+        raise RequestError({'intervals': 'must be 0, 1, false or true'})
+    if value in ('1', 'true') and flow.intervals is None:
+        raise RequestError({'intervals': 'no waiting-time quantile models are installed'})
+    return value in ('1', 'true')
+
+
+waiting_time_batcher = micro_batcher(predict_waiting_times)
+waiting_time_interval_batcher = micro_batcher(predict_waiting_time_intervals)
 
 
 @app.route('/api/predictwaitingtime', methods=['POST'])
 def predict_waiting_time():
     try:
-        data = request.json
-        
-        # Extract inputs
-        hour = data['hour']
-        day_of_week = data['dayOfWeek']
-        month = data['month']
-        queue_length = data['queueLength']
-        service_time = data['serviceTime']  # Added missing required input
-        patient_type = data['patientType']
-        department = data['department']
-        
-        # Create feature vector with cyclic encoding
-        input_data = {
-            'Hour_sin': np.sin(2 * np.pi * hour/24),
-            'Hour_cos': np.cos(2 * np.pi * hour/24),
-            'DayOfWeek_sin': np.sin(2 * np.pi * day_of_week/7),
-            'DayOfWeek_cos': np.cos(2 * np.pi * day_of_week/7),
-            'Month_sin': np.sin(2 * np.pi * month/12),
-            'Month_cos': np.cos(2 * np.pi * month/12),
-            'IsHoliday': 0,  # Assume not holiday
-            'QueueLength': queue_length,
-            'ServiceTime': service_time  # Added missing required input
-        }
-        
-        # Add one-hot encoded columns
-        for pt in ['Emergency', 'Routine', 'Follow-up']:
-            input_data[f'PatientType_{pt}'] = 1 if patient_type == pt else 0
-            
-        for dept in ['General', 'Cardiology', 'Orthopedics', 'Pediatrics', 'OB-GYN']:
-            input_data[f'Department_{dept}'] = 1 if department == dept else 0
-        
-        # Create DataFrame
-        input_df = pd.DataFrame([input_data])
-        
-        # Ensure all features are present
-        features = patient_flow_model.feature_names_in_ if hasattr(patient_flow_model, 'feature_names_in_') else None
-        
-        if features is not None:
-            for feature in features:
-                if feature not in input_df.columns:
-                    input_df[feature] = 0
-            # Use only the features used in training
-            input_df = input_df[features]
-        
-        # Make prediction
-        waiting_time = float(patient_flow_model.predict(input_df)[0])
-        
-        return jsonify({
-            'waitingTime': waiting_time
-        })
+        data = json_body()
+        stage('parse')
+
+        flow = registry.get('patient_flow')
+        row = parse_waiting_time(flow, data)
+        stage('features')
+        if intervals_requested(flow):
+            version, result = predict_one(waiting_time_interval_batcher, predict_waiting_time_intervals, row)
+        else:
+            version, result = predict_one(waiting_time_batcher, predict_waiting_times, row)
+        stage('inference')
+
+        return jsonify(dict(result, modelVersion=version))
+    except (ModelUnavailable, RequestError):
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/predictwaitingtime/batch', methods=['POST'])
+def predict_waiting_time_batch():
+    try:
+        records = batch_records(json_body())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    stage('parse')
+    record_count(len(records))
+
+    flow = registry.get('patient_flow')
+    rows, errors = build_batch(records, lambda record: parse_waiting_time(flow, record))
+    stage('features')
+    version, results = run_inference(
+        predict_waiting_time_intervals if intervals_requested(flow) else predict_waiting_times, rows)
+    stage('inference')
+
+    return jsonify({
+        'modelVersion': version,
+        'results': merge_batch(len(records), errors, results)
+    })
+
+
+@app.route('/api/events', methods=['POST'])
+def ingest_events():
+    # Bulk arrival / completion events as JSON lines, a JSON array or CSV (Content-Type text/csv):
+    # {"eventType": "arrival"|"completion", "timestamp", "department", "patientId",
+    #  "patientType", "serviceTime": <minutes, completions only>}
+    # Valid events are stored and applied; invalid rows are reported by 0-based position.
+    try:
+        frame = read_events(request.get_data(), request.content_type)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise RequestError({}, f'could not read events: {e}')
+    if len(frame) > MAX_INGEST_EVENTS:
+        raise RequestError({}, f'at most {MAX_INGEST_EVENTS} events per request')
+    stage('parse')
+    record_count(len(frame))
+
+    try:
+        events, problems = validate_events(frame, registry.get('patient_flow').encoder.departments)
+    except ValueError as e:
+        raise RequestError({}, str(e))
+    stage('features')
+    live_flow.ingest(events)
+    EVENTS_INGESTED.inc(amount=len(events))
+    stage('store')
+
+    return jsonify({
+        'accepted': len(events),
+        'rejected': len(problems),
+        'errors': [{'row': row, 'error': problem} for row, problem in list(problems.items())[:MAX_REPORTED_ERRORS]]
+    })
+
+
+@app.route('/api/events/departments', methods=['GET'])
+def live_departments():
+    # The live inputs waiting-time requests are filled from
+    return jsonify(live_flow.rolling.snapshot())
+
+
+urgency_score = {'Low': 1, 'Medium': 2, 'High': 3}
+service_score = {'Short': 1, 'Medium': 2, 'Long': 3}
+
+
+APPOINTMENT_COLUMNS = ['Age', 'Gender', 'VisitType', 'Urgency', 'Department']
+
+
+def fitted_categories(model):
+    # Categories of each one-hot encoded column of a pipeline's fitted ColumnTransformer
+    categories = {}
+    for _, transformer, columns in model.named_steps['preprocessor'].transformers_:
+        for column, values in zip(columns, getattr(transformer, 'categories_', [])):
+            categories[column] = [str(value) for value in values]
+    return categories
+
+
+def appointment_schema(categories):
+    # Parses to the APPOINTMENT_COLUMNS values; urgencies must also have a priority score
+    return Schema(
+        Number('age', 0, 120),
+        Choice('gender', categories['Gender']),
+        Choice('visitType', categories['VisitType']),
+        Choice('urgency', [urgency for urgency in categories['Urgency'] if urgency in urgency_score]),
+        Choice('department', categories['Department'])
+    )
+
+
+def appointment_features(scheduling, data):
+    return dict(zip(APPOINTMENT_COLUMNS, scheduling.schema.parse(data)))
+
+
+def appointment_results(scheduling, patients):
+    MODEL_BATCH_ROWS.observe(len(patients), 'appointment_scheduling')
+    with MODEL_STAGE_SECONDS.time('appointment_scheduling', 'encode'):
+        frame = pd.DataFrame(patients)
+    # Predict service time category
+    with MODEL_STAGE_SECONDS.time('appointment_scheduling', 'predict'):
+        service_categories = model_predict(scheduling, 'appointment_scheduling', scheduling.model, frame)
+
+    # Calculate priority score
+    return [{
+        'serviceCategory': service_category,
+        'priorityScore': urgency_score[patient['Urgency']] * service_score[service_category]
+    } for patient, service_category in zip(patients, service_categories)]
+
+
+def schedule_appointments(patients):
+    scheduling = registry.get('appointment_scheduling')
+    keys = [tuple(patient.values()) for patient in patients]
+    results = cached_predict(appointment_cache, versioned(scheduling, keys), patients,
+                             lambda missing: appointment_results(scheduling, missing))
+    return scheduling.version, results
+
+
+appointment_batcher = micro_batcher(schedule_appointments)
 
 
 @app.route('/api/scheduleappointment', methods=['POST'])
 def schedule_appointment():
-    data = request.json
-    
+    data = json_body()
+    stage('parse')
+
     # Extract inputs
-    patient_info = {
-        'Age': data['age'],
-        'Gender': data['gender'],
-        'VisitType': data['visitType'],
-        'Urgency': data['urgency'],
-        'Department': data['department']
+    patient_info = appointment_features(registry.get('appointment_scheduling'), data)
+    stage('features')
+    version, result = predict_one(appointment_batcher, schedule_appointments, patient_info)
+    stage('inference')
+
+    return jsonify(dict(result, modelVersion=version))
+
+
+@app.route('/api/scheduleappointment/batch', methods=['POST'])
+def schedule_appointment_batch():
+    try:
+        records = batch_records(json_body())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    stage('parse')
+    record_count(len(records))
+
+    scheduling = registry.get('appointment_scheduling')
+    patients, errors = build_batch(records, lambda record: appointment_features(scheduling, record))
+    stage('features')
+    version, results = run_inference(schedule_appointments, patients)
+    stage('inference')
+
+    return jsonify({
+        'modelVersion': version,
+        'results': merge_batch(len(records), errors, results)
+    })
+
+
+SESSION_SCHEMA = Schema(Number('sessionMinutes', 1, 24 * 60, default=None))
+DOCTOR_SCHEMA = Schema(Identifier('id'), Text('specialty'), Number('availableFrom', 0, 24 * 60, default=0.0))
+
+
+def session_list(data, field, limit):
+    items = data.get(field)
+    if not isinstance(items, list) or not 1 <= len(items) <= limit:
+        raise RequestError({field: f'must be a list of 1 to {limit} entries'})
+    return items
+
+
+def service_estimates(scheduling, patients):
+    # Predicted service category and expected minutes of every patient, from one predict_proba
+    MODEL_BATCH_ROWS.observe(len(patients), 'appointment_scheduling')
+    with MODEL_STAGE_SECONDS.time('appointment_scheduling', 'encode'):
+        frame = pd.DataFrame(patients, columns=APPOINTMENT_COLUMNS)
+    with MODEL_STAGE_SECONDS.time('appointment_scheduling', 'predict'):
+        probabilities = model_predict(scheduling, 'appointment_scheduling', scheduling.model, frame, 'predict_proba')
+    model = scheduling.model
+    classes = model.final.classes_ if hasattr(model, 'final') else model.classes_
+    return classes.take(probabilities.argmax(axis=1)), expected_minutes(probabilities, classes)
+
+
+def match_session(scheduling, patients, doctors, session_minutes):
+    categories, minutes = service_estimates(scheduling, patients)
+    priority = np.array([urgency_score[patient['Urgency']] * service_score[category]
+                         for patient, category in zip(patients, categories)], dtype=np.float64)
+    doctor, start, matched = assign([patient['Department'] for patient in patients], priority, minutes,
+                                    [specialty for _, specialty, _ in doctors],
+                                    [available for _, _, available in doctors], session_minutes)
+
+    assigned = doctor >= 0
+    # Waits count from each doctor's availability, so a late-starting roster is not penalized
+    available = np.array([available for _, _, available in doctors], dtype=np.float64)
+    wait = start[assigned] - available[doctor[assigned]]
+    load = np.bincount(doctor[assigned], weights=minutes[assigned], minlength=len(doctors))
+    seen = np.bincount(doctor[assigned], minlength=len(doctors))
+
+    results = [{
+        'doctorId': doctors[d][0] if d >= 0 else None,
+        'specialtyMatch': bool(match),
+        'startMinute': float(t) if d >= 0 else None,
+        'expectedMinutes': float(m),
+        'serviceCategory': category,
+        'priorityScore': int(p)
+    } for d, t, match, m, category, p in zip(doctor.tolist(), start, matched, minutes, categories, priority)]
+    summary = {
+        'assigned': int(assigned.sum()),
+        'unassigned': int((~assigned).sum()),
+        'totalWeightedWait': float(priority[assigned] @ wait),
+        'meanWait': float(wait.mean()) if len(wait) else 0.0,
+        'maxWait': float(wait.max()) if len(wait) else 0.0,
+        'doctors': [{
+            'doctorId': doctor_id,
+            'patients': int(n),
+            'busyMinutes': float(busy),
+            'freeAt': float(available_from + busy)
+        } for (doctor_id, _, available_from), n, busy in zip(doctors, seen, load)]
     }
-    
-    # Create DataFrame
-    input_df = pd.DataFrame([patient_info])
-    
-    # Predict service time category
-    service_category = appointment_scheduling_model.predict(input_df)[0]
-    
-    # Calculate priority score
-    urgency_score = {'Low': 1, 'Medium': 2, 'High': 3}
-    service_score = {'Short': 1, 'Medium': 2, 'Long': 3}
-    priority = urgency_score[data['urgency']] * service_score[service_category]
-    
+    return results, summary
+
+
+@app.route('/api/matchappointments', methods=['POST'])
+def match_appointments():
+    # Assign a clinic session's patients to its doctors, minimizing total priority-weighted wait:
+    # {"patients": [<scheduleappointment records>], "doctors": [{"id", "specialty", "availableFrom"}],
+    #  "sessionMinutes": <optional; patients who cannot start before it stay unassigned>}
+    data = json_body()
+    if not isinstance(data, dict):
+        raise RequestError({}, 'request must be a JSON object')
+    records = session_list(data, 'patients', MAX_SESSION_PATIENTS)
+    doctors, doctor_errors = build_batch(session_list(data, 'doctors', MAX_SESSION_DOCTORS), DOCTOR_SCHEMA.parse)
+    if doctor_errors:
+        raise RequestError({f'doctors[{i}]': error['fields'] or error['error'] for i, error in doctor_errors.items()})
+    if len({doctor_id for doctor_id, _, _ in doctors}) != len(doctors):
+        raise RequestError({'doctors': 'doctor ids must be unique'})
+    (session_minutes,) = SESSION_SCHEMA.parse(data)
+    stage('parse')
+    record_count(len(records))
+
+    scheduling = registry.get('appointment_scheduling')
+    patients, errors = build_batch(records, lambda record: appointment_features(scheduling, record))
+    stage('features')
+    results, summary = ([], None) if not patients else run_inference(match_session, scheduling, patients,
+                                                                        doctors, session_minutes)
+    stage('inference')
+
     return jsonify({
-        'serviceCategory': service_category,
-        'priorityScore': priority
+        'modelVersion': scheduling.version,
+        'results': merge_batch(len(records), errors, results),
+        'session': summary
     })
 
+
+SIMULATION_SCHEMA = Schema(Number('replications', 1, MAX_SIMULATION_REPLICATIONS, integer=True, default=100),
+                           Number('seed', 0, 2 ** 32 - 1, integer=True, default=42))
+SCENARIO_SCHEMA = Schema(
+    Text('name'),
+    Date('startDate'),
+    Number('days', 1, simulation.MAX_DAYS, integer=True, default=7),
+    Choice('triage', ['priority', 'fifo'], default='priority')
+)
+DEFAULT_SIMULATION_STAFF = 3
+parse_holiday = Date('holidays').compile()
+STAFF_CHANGE_SCHEMA = Schema(
+    Choice('department', simulation.FLOW_DEPARTMENTS),
+    Number('fromHour', 0, 23, integer=True),
+    Number('toHour', 1, 24, integer=True),
+    Number('change', -1000, 1000, integer=True)
+)
+
+
+def department_numbers(data, field, departments, default, minimum, maximum, integer):
+    # A number for every department, or a {department: number} dict (others get the default)
+    value = data.get(field, default)
+    try:
+        if not isinstance(value, dict):
+            (number,) = Schema(Number(field, minimum, maximum, integer)).parse({field: value})
+            return dict.fromkeys(departments, number)
+        unknown = [dept for dept in value if dept not in departments]
+        if unknown:
+            raise RequestError({}, f'unknown departments {unknown}; must be among {departments}')
+        fields = Schema(*(Number(dept, minimum, maximum, integer, default=default) for dept in departments))
+        return dict(zip(departments, fields.parse(value)))
+    except RequestError as e:
+        raise RequestError({field: e.fields.get(field) or e.fields or e.message})
+
+
+def parse_scenario(data):
+    # One what-if scenario: {"name", "startDate", "days", "departments", "staff": <n or
+    # {department: n}>, "staffChanges": [{"department", "weekdays", "fromHour", "toHour",
+    # "change"}], "arrivalScale": <x or {department: x}>, "holidays": [dates] or "region", "triage"}
+    name, start_date, days, triage = SCENARIO_SCHEMA.parse(data)
+    departments = data.get('departments', simulation.FLOW_DEPARTMENTS)
+    if (not isinstance(departments, list) or not departments
+            or any(dept not in simulation.FLOW_DEPARTMENTS for dept in departments)):
+        raise RequestError({'departments': f'must be a non-empty list of {simulation.FLOW_DEPARTMENTS}'})
+    departments = list(dict.fromkeys(departments))
+
+    staff = department_numbers(data, 'staff', departments, DEFAULT_SIMULATION_STAFF, 0, 1000, True)
+    arrival_scale = department_numbers(data, 'arrivalScale', departments, 1.0, 0, 100, False)
+
+    changes = data.get('staffChanges', [])
+    if not isinstance(changes, list):
+        raise RequestError({'staffChanges': 'must be a list'})
+    staff_changes = []
+    for i, change in enumerate(changes):
+        try:
+            department, from_hour, to_hour, delta = STAFF_CHANGE_SCHEMA.parse(change)
+        except RequestError as e:
+            raise RequestError({f'staffChanges[{i}]': e.fields or e.message})
+        weekdays = change.get('weekdays', [])
+        if not isinstance(weekdays, list) or any(type(day) is not int or not 0 <= day <= 6 for day in weekdays):
+            raise RequestError({f'staffChanges[{i}]': {'weekdays': 'must be a list of weekdays 0 (Monday) to 6'}})
+        if department not in departments:
+            raise RequestError({f'staffChanges[{i}]': {'department': 'is not simulated in this scenario'}})
+        staff_changes.append((department, weekdays, int(from_hour), int(to_hour), int(delta)))
+
+    # Holidays default to the region's calendar
+    holidays = data.get('holidays')
+    if holidays is None:
+        region = data.get('region')
+        if region is not None and not isinstance(region, str):
+            raise RequestError({'region': 'must be a string'})
+        calendar = holiday_calendar(region)
+        dates = np.datetime64(start_date.date(), 'D') + np.arange(int(days))
+        holidays = [] if calendar is None else dates[calendar.flags(dates) == 1].astype(object).tolist()
+    elif isinstance(holidays, list):
+        try:
+            holidays = [parse_holiday(day) for day in holidays]
+        except (TypeError, ValueError) as e:
+            raise RequestError({'holidays': str(e)})
+    else:
+        raise RequestError({'holidays': 'must be a list of dates'})
+
+    return name, simulation.compile_scenario(start_date, int(days), departments, staff, staff_changes,
+                                             arrival_scale, holidays, triage)
+
+
+@app.route('/api/simulate', methods=['POST'])
+def simulate():
+    # Batch what-if runs of the discrete-event queue simulation (see simulation.py):
+    # {"scenarios": [<parse_scenario>], "replications": <per scenario>, "seed": <optional>}
+    # Every scenario is run with the same seed, so differences between them are not noise
+    # in the arrivals. Returns each department's pooled wait percentiles (minutes) and the
+    # distribution over replications of its waits, queue length and utilization.
+    data = json_body()
+    if not isinstance(data, dict):
+        raise RequestError({}, 'request must be a JSON object')
+    replications, seed = (int(value) for value in SIMULATION_SCHEMA.parse(data))
+    scenarios = []
+    for i, scenario in enumerate(session_list(data, 'scenarios', MAX_SIMULATION_SCENARIOS)):
+        try:
+            scenarios.append(parse_scenario(scenario))
+        except RequestError as e:
+            raise RequestError({f'scenarios[{i}]': e.fields or e.message})
+    stage('parse')
+    record_count(len(scenarios))
+
+    results = [{
+        'name': name,
+        'departments': simulation.run(scenario, replications, seed, SIMULATION_WORKERS)
+    } for name, scenario in scenarios]
+    stage('simulation')
+    return jsonify({'replications': replications, 'seed': seed, 'scenarios': results})
+
+
+# Live per-department queues fed by the scheduling model. The state is held in this
+# process, so queue clients must all reach the same one (serve.py --workers 1).
+patient_queues = PatientQueues()
+metrics.collected('patient_queue_length', 'Patients waiting per department queue', ['department'],
+                  lambda: {(department,): n for department, n in patient_queues.lengths().items()})
+
+
+def default_patient_type(patient):
+    # The waiting-time model's patient type for a scheduling record
+    if patient['Urgency'] == 'High':
+        return 'Emergency'
+    return 'Follow-up' if patient['VisitType'] == 'Follow-up' else 'Routine'
+
+
+def parse_queue_request(scheduling, flow, data):
+    # (scheduling record, patient type or None, service minutes or None)
+    return (appointment_features(scheduling, data), *flow.queue_schema.parse(data))
+
+
+def queue_details(scheduling, patient, patient_type, service_time):
+    # Score a patient with the scheduling model; service time defaults to the expected minutes
+    (category,), (minutes,) = service_estimates(scheduling, [patient])
+    return {
+        'patient': patient,
+        'serviceCategory': str(category),
+        'priorityScore': urgency_score[patient['Urgency']] * service_score[category],
+        'patientType': patient_type or default_patient_type(patient),
+        'serviceTime': float(minutes) if service_time is None else service_time,
+        'enqueuedAt': datetime.now().isoformat(timespec='seconds')
+    }
+
+
+def queue_schema(encoder):
+    # The optional waiting-time inputs of a queue request
+    return Schema(Choice('patientType', encoder.patient_types, default=None),
+                  Number('serviceTime', 0, 24 * 60, default=None))
+
+
+def queue_waiting_times(entries):
+    # Waiting-time estimates for (details, position) pairs, with the patients ahead of each
+    # as its QueueLength; None for departments the waiting-time model does not know
+    flow = registry.get('patient_flow')
+    known = set(flow.encoder.departments)
+    now = datetime.now()
+    rows, slots = [], []
+    for i, (details, position) in enumerate(entries):
+        department = details['patient']['Department']
+        if department in known:
+            slots.append(i)
+            rows.append(parse_waiting_time(flow, {
+                'hour': now.hour, 'dayOfWeek': now.weekday(), 'month': now.month,
+                'queueLength': position - 1, 'serviceTime': details['serviceTime'],
+                'patientType': details['patientType'], 'department': department,
+                'date': now.strftime('%Y-%m-%d')
+            }))
+    estimates = [None] * len(entries)
+    if rows:
+        _, results = run_inference(predict_waiting_times, rows)
+        for i, result in zip(slots, results):
+            estimates[i] = result['waitingTime']
+    return estimates
+
+
+def queue_entry(patient_id, details, position, queue_length, waiting_time):
+    return {
+        'patientId': patient_id,
+        'department': details['patient']['Department'],
+        'priorityScore': details['priorityScore'],
+        'serviceCategory': details['serviceCategory'],
+        'patientType': details['patientType'],
+        'serviceTime': details['serviceTime'],
+        'enqueuedAt': details['enqueuedAt'],
+        'position': position,
+        'queueLength': queue_length,
+        'waitingTime': waiting_time
+    }
+
+
+def queued_patient_id(data):
+    (patient_id,) = PATIENT_ID_SCHEMA.parse(data)
+    # Path lookups see ids as strings, so 17 and "17" name the same patient
+    return str(patient_id)
+
+
+PATIENT_ID_SCHEMA = Schema(Identifier('patientId'))
+
+
+@app.route('/api/queue/enqueue', methods=['POST'])
+def enqueue_patient():
+    # Add a patient to their department's queue:
+    # {"patientId", <scheduleappointment fields>, "patientType"?, "serviceTime"? (minutes)}
+    data = json_body()
+    patient_id = queued_patient_id(data)
+    stage('parse')
+
+    scheduling = registry.get('appointment_scheduling')
+    request_fields = parse_queue_request(scheduling, registry.get('patient_flow'), data)
+    stage('features')
+    details = run_inference(queue_details, scheduling, *request_fields)
+    try:
+        position, queue_length = patient_queues.enqueue(patient_id, details['patient']['Department'],
+                                                        details['priorityScore'], details)
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 409
+    (waiting_time,) = queue_waiting_times([(details, position)])
+    stage('inference')
+
+    return jsonify(dict(queue_entry(patient_id, details, position, queue_length, waiting_time),
+                        modelVersion=scheduling.version))
+
+
+QUEUE_DEPARTMENT_SCHEMA = Schema(Text('department'))
+
+
+@app.route('/api/queue/next', methods=['POST'])
+def next_patient():
+    # Take the highest-priority patient off a department's queue: {"department"}
+    (department,) = QUEUE_DEPARTMENT_SCHEMA.parse(json_body())
+    popped = patient_queues.next(department)
+    remaining = patient_queues.lengths().get(department, 0)
+    if popped is None:
+        return jsonify({'patient': None, 'queueLength': remaining})
+    patient_id, details = popped
+    return jsonify({'patient': queue_entry(patient_id, details, 0, remaining, 0.0), 'queueLength': remaining})
+
+
+def not_waiting(patient_id):
+    return jsonify({'error': f'patient {patient_id!r} is not waiting in any queue'}), 404
+
+
+@app.route('/api/queue/patients/<patient_id>', methods=['GET'])
+def queue_position(patient_id):
+    # Current place in line and waiting-time estimate, from the patients ahead right now
+    try:
+        _, details, position, queue_length = patient_queues.lookup(patient_id)
+    except KeyError:
+        return not_waiting(patient_id)
+    (waiting_time,) = queue_waiting_times([(details, position)])
+    return jsonify(queue_entry(patient_id, details, position, queue_length, waiting_time))
+
+
+@app.route('/api/queue/patients/<patient_id>', methods=['DELETE'])
+def leave_queue(patient_id):
+    try:
+        details = patient_queues.remove(patient_id)
+    except KeyError:
+        return not_waiting(patient_id)
+    return jsonify({'patientId': patient_id, 'department': details['patient']['Department']})
+
+
+REPRIORITIZE_SCHEMA = Schema(Text('urgency'))
+
+
+@app.route('/api/queue/reprioritize', methods=['POST'])
+def reprioritize_patient():
+    # Re-triage a waiting patient with a new urgency: {"patientId", "urgency"}
+    data = json_body()
+    patient_id = queued_patient_id(data)
+    (urgency,) = REPRIORITIZE_SCHEMA.parse(data)
+    try:
+        department, details, _, _ = patient_queues.lookup(patient_id)
+    except KeyError:
+        return not_waiting(patient_id)
+
+    scheduling = registry.get('appointment_scheduling')
+    previous = details['patient']
+    patient = appointment_features(scheduling, {
+        'age': previous['Age'], 'gender': previous['Gender'], 'visitType': previous['VisitType'],
+        'urgency': urgency, 'department': department
+    })
+    updated = run_inference(queue_details, scheduling, patient, details['patientType'], details['serviceTime'])
+    updated['enqueuedAt'] = details['enqueuedAt']
+    try:
+        position, queue_length = patient_queues.reprioritize(patient_id, updated['priorityScore'], updated)
+    except KeyError:
+        # Seen or removed while being re-scored
+        return not_waiting(patient_id)
+    (waiting_time,) = queue_waiting_times([(updated, position)])
+    return jsonify(dict(queue_entry(patient_id, updated, position, queue_length, waiting_time),
+                        modelVersion=scheduling.version))
+
+
+@app.route('/api/queue/departments/<department>', methods=['GET'])
+def department_queue(department):
+    # The whole line in the order patients will be seen, each with a current estimate
+    waiting = patient_queues.listing(department)
+    estimates = queue_waiting_times([(details, position) for position, (_, details) in enumerate(waiting, 1)])
+    return jsonify({
+        'department': department,
+        'queueLength': len(waiting),
+        'patients': [queue_entry(patient_id, details, position, len(waiting), waiting_time)
+                     for position, ((patient_id, details), waiting_time) in enumerate(zip(waiting, estimates), 1)]
+    })
+
+
+def resource_encoders(bed_model, staff_model):
+    # Both resource pipelines are fitted on the same ColumnTransformer, so one encoding serves
+    # both regressors; fall back to one encoder per model if a retrain ever makes them diverge
+    try:
+        shared = ResourceEncoder(shared_preprocessor(bed_model, staff_model))
+        return shared, shared
+    except ValueError:
+        return (ResourceEncoder(bed_model.named_steps['preprocessor']),
+                ResourceEncoder(staff_model.named_steps['preprocessor']))
+
+
+def predict_resource_columns(resources, columns):
+    MODEL_BATCH_ROWS.observe(len(columns['Department']), 'resource_allocation')
+    with MODEL_STAGE_SECONDS.time('resource_allocation', 'encode'):
+        bed_input = resources.bed_encoder.encode_columns(columns)
+        staff_input = (bed_input if resources.staff_encoder is resources.bed_encoder
+                       else resources.staff_encoder.encode_columns(columns))
+
+    # Predict
+    with MODEL_STAGE_SECONDS.time('resource_allocation', 'predict'):
+        bed_occupancy = model_predict(resources, 'resource_allocation_bed', resources.bed_model.final, bed_input)
+        staff_needed = model_predict(resources, 'resource_allocation_staff', resources.staff_model.final, staff_input)
+    return bed_occupancy, staff_needed
+
+
+def resource_results(resources, rows):
+    bed_occupancy, staff_needed = predict_resource_columns(resources, ResourceEncoder.row_columns(rows))
+
+    return [{
+        'bedOccupancyRate': float(beds),
+        'staffNeeded': int(staff)
+    } for beds, staff in zip(bed_occupancy, staff_needed)]
+
+
+def parse_resources(resources, data):
+    (date, department, outpatient_visits, inpatient_admissions, avg_length_of_stay,
+     region) = resources.schema.parse(data)
+    return ResourceEncoder.row(date, department, outpatient_visits, inpatient_admissions, avg_length_of_stay,
+                               is_holiday(date, region))
+
+
+def predict_resource_rows(rows):
+    resources = registry.get('resource_allocation')
+    results = cached_predict(resource_cache, versioned(resources, rows), rows,
+                             lambda missing: resource_results(resources, missing))
+    return resources.version, results
+
+
+resource_batcher = micro_batcher(predict_resource_rows)
+
+
 @app.route('/api/predictresources', methods=['POST'])
 def predict_resources():
-    data = request.json
-    
-    # Parse date
-    date = datetime.strptime(data['date'], '%Y-%m-%d')
-    
-    # Prepare input data
-    input_data = pd.DataFrame({
-        'Month': [date.month],
-        'Year': [date.year],
-        'DayOfWeek': [date.weekday()],
-        'IsHoliday': [0],  # Assume not holiday
-        'Department': [data['department']],
-        'OutpatientVisits': [data['outpatientVisits']],
-        'InpatientAdmissions': [data['inpatientAdmissions']],
-        'StaffAvailable': [20],  # Placeholder
-        'AvgLengthOfStay': [data['avgLengthOfStay']],
-        'Month_sin': [np.sin(2 * np.pi * date.month/12)],
-        'Month_cos': [np.cos(2 * np.pi * date.month/12)],
-        'DayOfWeek_sin': [np.sin(2 * np.pi * date.weekday()/7)],
-        'DayOfWeek_cos': [np.cos(2 * np.pi * date.weekday()/7)]
+    data = json_body()
+    stage('parse')
+
+    row = parse_resources(registry.get('resource_allocation'), data)
+    stage('features')
+    version, result = predict_one(resource_batcher, predict_resource_rows, row)
+    stage('inference')
+
+    return jsonify(dict(result, modelVersion=version))
+
+
+@app.route('/api/predictresources/batch', methods=['POST'])
+def predict_resources_batch():
+    try:
+        records = batch_records(json_body())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    stage('parse')
+    record_count(len(records))
+
+    resources = registry.get('resource_allocation')
+    rows, errors = build_batch(records, lambda record: parse_resources(resources, record))
+    stage('features')
+    version, results = run_inference(predict_resource_rows, rows)
+    stage('inference')
+
+    return jsonify({
+        'modelVersion': version,
+        'results': merge_batch(len(records), errors, results)
     })
-    
-    # Predict
-    bed_occupancy = float(resource_allocation_bed_model.predict(input_data)[0])
-    staff_needed = int(resource_allocation_staff_model.predict(input_data)[0])
-    
+
+
+HORIZON_SCHEMA = Schema(Date('startDate'), Number('days', 1, MAX_HORIZON_DAYS, integer=True),
+                        Text('region', 50, default=None))
+
+
+@app.route('/api/predictresources/horizon', methods=['POST'])
+def predict_resources_horizon():
+    data = json_body()
+    stage('parse')
+
+    resources = registry.get('resource_allocation')
+    start_date, days, region = HORIZON_SCHEMA.parse(data)
+    days = int(days)
+    calendar = holiday_calendar(region)
+    departments = data.get('departments')
+    if not isinstance(departments, list) or not departments:
+        raise RequestError({'departments': 'must be a non-empty list of department names'})
+    unknown = [dept for dept in departments if dept not in resources.departments]
+    if unknown:
+        raise RequestError({'departments': f'unknown {unknown}; must be among {resources.departments}'})
+    departments = list(dict.fromkeys(departments))
+
+    try:
+        dates, columns = ResourceEncoder.horizon_columns(
+            start_date, days, departments,
+            data['outpatientVisits'], data['inpatientAdmissions'], data['avgLengthOfStay'], calendar
+        )
+    except KeyError as e:
+        raise RequestError({e.args[0]: 'is required'})
+    except (TypeError, ValueError) as e:
+        raise RequestError({}, str(e))
+    stage('features')
+    record_count(days * len(departments))
+
+    # One pass over the whole grid, reshaped back to (days, departments)
+    bed_occupancy, staff_needed = run_inference(predict_resource_columns, resources, columns)
+    stage('inference')
+    bed_occupancy = bed_occupancy.reshape(days, len(departments))
+    staff_needed = staff_needed.reshape(days, len(departments)).astype(int)
+
     return jsonify({
-        'bedOccupancyRate': bed_occupancy,
-        'staffNeeded': staff_needed
+        'modelVersion': resources.version,
+        'dates': [str(date) for date in dates],
+        'isHoliday': (calendar.flags(dates) if calendar is not None else np.zeros(days, dtype=int)).tolist(),
+        'forecast': {
+            dept: {
+                'bedOccupancyRate': bed_occupancy[:, j].tolist(),
+                'staffNeeded': staff_needed[:, j].tolist()
+            } for j, dept in enumerate(departments)
+        }
     })
 
+
+@app.route('/api/cachestats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'predictwaitingtime': waiting_time_cache.stats(),
+        'scheduleappointment': appointment_cache.stats(),
+        'predictresources': resource_cache.stats()
+    })
+
+
+@app.route('/api/models', methods=['GET'])
+def model_status():
+    return jsonify(registry.status())
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def admin_allowed():
+    if ADMIN_TOKEN:
+        return request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+@app.route('/api/admin/reload', methods=['POST'])
+def reload_models():
+    # Load, probe and swap in the current files for the named models (default: all of them)
+    if not admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        raise RequestError({}, 'request must be a JSON object')
+    models = data.get('models')
+    if models is not None and (not isinstance(models, list) or any(type(name) is not str for name in models)):
+        raise RequestError({'models': 'must be a list of model names'})
+    names = models or list(registry.status())
+    unknown = [name for name in names if name not in registry.status()]
+    if unknown:
+        return jsonify({'error': f'unknown models: {unknown}'}), 400
+
+    results, failed = {}, False
+    for name in names:
+        try:
+            results[name] = {'version': registry.reload(name)}
+        except ModelUnavailable as e:
+            results[name] = {'error': e.reason, 'version': registry.status()[name]['version']}
+            failed = True
+
+    return jsonify(results), 500 if failed else 200
+
+
+@app.route('/api/admin/reload/holidays', methods=['POST'])
+def reload_holidays():
+    # Recompile changed holiday calendar files; a file with errors leaves the old set in use
+    if not admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+    try:
+        return jsonify(holiday_calendars.reload())
+    except (OSError, ValueError) as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/admin/slowrequests', methods=['GET'])
+def slow_requests():
+    # Stack profiles of the most recent slow requests (needs SLOW_REQUEST_MS)
+    if not admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+    if slow_request_profiler is None:
+        return jsonify({'error': 'slow request profiling is off; set SLOW_REQUEST_MS to enable it'}), 404
+    return jsonify(list(slow_request_profiler.profiles))
+
+
+if PRELOAD_MODELS:
+    registry.load_all()
+
+if MODEL_WATCH_INTERVAL > 0:
+    registry.watch(MODEL_WATCH_INTERVAL, log=app.logger.info)
+
 if __name__ == '__main__':
+    # Spawned simulation workers would re-import this whole app as their __main__
+    SIMULATION_WORKERS = 1
     app.run(port=5328)
@@ -0,0 +1,360 @@
+# python/artifacts.py
+# Pickle-free model artifacts. A trained model (a tree ensemble, optionally behind a
+# ColumnTransformer of StandardScaler / OneHotEncoder blocks) is exported as a directory:
+#
+#   manifest.json   format, sklearn/numpy versions of the export, the source pickle's
+#                   sha256, input feature names, scaler mean/scale, one-hot categories,
+#                   the estimator's constants, and shape/dtype/sha256 of every array
+#   *.npy           the flat tree arrays of flat_trees.FlatForest
+#
+# Loading parses JSON and memory-maps the .npy files (read-only, shared between forked
+# workers), so nothing executes code from the models directory and nothing sklearn-specific
+# is needed to predict. Every check fails with ArtifactError: an unknown format, a missing
+# or altered array, inconsistent shapes, or (at export) a pickle written by another sklearn.
+#   python python/artifacts.py                  export every models/*.pkl
+#   python python/artifacts.py patient_flow_model
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import warnings
+
+import numpy as np
+
+from flat_trees import (CompiledForestClassifier, CompiledForestRegressor, CompiledGradientBoosting,
+                        CompiledHistGradientBoosting, CompiledPipeline, FlatForest, compile_model)
+
+# Bump when the manifest or array layout changes; older artifacts are then refused
+ARTIFACT_FORMAT = 1
+MANIFEST = 'manifest.json'
+FOREST_ARRAYS = ['roots', 'feature', 'threshold', 'children', 'value']
+ESTIMATORS = {cls.__name__: cls for cls in [CompiledGradientBoosting, CompiledHistGradientBoosting,
+                                            CompiledForestRegressor, CompiledForestClassifier]}
+
+
+class ArtifactError(ValueError):
+    pass
+
+
+def sklearn_version():
+    try:
+        import sklearn
+    except ImportError:
+        return None
+    return sklearn.__version__
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def unpickle(path):
+    # The pickled model, refusing one written by a different sklearn version: its fitted
+    # attributes may not mean what this version's code expects
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        with open(path, 'rb') as f:
+            model = pickle.load(f)
+    for warning in caught:
+        if type(warning.message).__name__ == 'InconsistentVersionWarning':
+            raise ArtifactError(f'{path} was pickled with scikit-learn {warning.message.original_sklearn_version} '
+                                f'but {warning.message.current_sklearn_version} is installed; '
+                                f'export it under the version it was trained with')
+        warnings.showwarning(warning.message, warning.category, warning.filename, warning.lineno)
+    return model
+
+
+class NoFallback:
+    # Stands in for the sklearn estimator when there is none: the flat arrays serve every
+    # batch, except rows histogram boosting cannot route (NaN inputs)
+    usable = False
+
+    def predict(self, X):
+        raise ArtifactError('this input needs the sklearn estimator, which is not available')
+
+    predict_proba = predict
+
+
+class ScalerParams:
+    # A fitted StandardScaler's parameters, read by features.ResourceEncoder like the original
+    kind = 'StandardScaler'
+
+    def __init__(self, mean, scale):
+        self.mean_ = np.asarray(mean, dtype=np.float64)
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+        self.with_mean = self.with_std = True
+
+
+class OneHotParams:
+    # A fitted OneHotEncoder's categories; unknown values encode as all zeros
+    kind = 'OneHotEncoder'
+
+    def __init__(self, categories):
+        self.categories_ = [np.asarray(values, dtype=object) for values in categories]
+        self.handle_unknown = 'ignore'
+
+
+class ColumnParams:
+    # A fitted ColumnTransformer as (name, params, columns) blocks, applied in NumPy
+
+    def __init__(self, transformers):
+        self.transformers_ = transformers
+        self._slots = [(params, columns, [{value: i for i, value in enumerate(values)}
+                                          for values in getattr(params, 'categories_', [])])
+                       for _, params, columns in transformers]
+        self.n_features_out = sum(len(columns) if isinstance(params, ScalerParams)
+                                  else sum(len(values) for values in params.categories_)
+                                  for _, params, columns in transformers)
+
+    def transform(self, X):
+        # X: a DataFrame or {column: values}; returns the dense float64 feature matrix
+        n_rows = len(X[self.transformers_[0][2][0]])
+        out = np.zeros((n_rows, self.n_features_out))
+        start = 0
+        for params, columns, slots in self._slots:
+            if isinstance(params, ScalerParams):
+                numeric = np.column_stack([np.asarray(X[column], dtype=np.float64) for column in columns])
+                out[:, start:start + len(columns)] = (numeric - params.mean_) / params.scale_
+                start += len(columns)
+                continue
+            for column, column_slots in zip(columns, slots):
+                cols = np.array([column_slots.get(value, -1) for value in X[column]], dtype=np.intp)
+                hit = np.flatnonzero(cols >= 0)
+                out[hit, start + cols[hit]] = 1
+                start += len(column_slots)
+        return out
+
+
+class ArtifactPipeline:
+    # Loaded counterpart of flat_trees.CompiledPipeline
+
+    def __init__(self, preprocessor, final, feature_names):
+        self.final = final
+        self.named_steps = {'preprocessor': preprocessor}
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+
+    def transform(self, X):
+        return self.named_steps['preprocessor'].transform(X)
+
+    def predict(self, X):
+        return self.final.predict(self.transform(X))
+
+    def predict_proba(self, X):
+        return self.final.predict_proba(self.transform(X))
+
+
+def _describe_preprocessor(pipeline):
+    steps = pipeline.steps[:-1]
+    if len(steps) != 1 or type(steps[0][1]).__name__ != 'ColumnTransformer':
+        raise ArtifactError('only Pipeline(ColumnTransformer, estimator) pipelines can be exported')
+    blocks = []
+    for name, transformer, columns in steps[0][1].transformers_:
+        if isinstance(transformer, str):
+            if transformer == 'drop':
+                continue
+            raise ArtifactError(f'cannot export {transformer!r} block {name}')
+        kind = type(transformer).__name__
+        columns = [str(column) for column in columns]
+        if kind == 'StandardScaler' and transformer.with_mean and transformer.with_std:
+            blocks.append({'name': name, 'kind': kind, 'columns': columns,
+                           'mean': transformer.mean_.tolist(), 'scale': transformer.scale_.tolist()})
+        elif (kind == 'OneHotEncoder' and transformer.handle_unknown == 'ignore' and transformer.drop is None
+              and all(values.dtype == object for values in transformer.categories_)):
+            blocks.append({'name': name, 'kind': kind, 'columns': columns,
+                           'categories': [[str(value) for value in values] for values in transformer.categories_]})
+        else:
+            raise ArtifactError(f'cannot export {kind} block {name}')
+    return blocks
+
+
+def describe_estimator(compiled):
+    # Constants of a compiled tree ensemble; its arrays are those of compiled.forest
+    name = type(compiled).__name__
+    if name not in ESTIMATORS:
+        raise ArtifactError(f'cannot export {name}')
+    forest = compiled.forest
+    described = {
+        'class': name,
+        'n_features_in': int(compiled.n_features_in_),
+        'max_depth': int(forest.max_depth),
+        'input_dtype': np.dtype(forest.dtype).name
+    }
+    if hasattr(compiled, 'baseline'):
+        described['baseline'] = compiled.baseline
+    if hasattr(compiled, 'classes_'):
+        described['classes'] = compiled.classes_.tolist()
+    return described
+
+
+def export(model, directory, source_path=None):
+    # Write `model` (fitted sklearn estimator or pipeline) as an artifact directory, replacing
+    # any previous one in a single rename
+    compiled = compile_model(model)
+    final = compiled.final if isinstance(compiled, CompiledPipeline) else compiled
+    manifest = {
+        'format': ARTIFACT_FORMAT,
+        'sklearn_version': sklearn_version(),
+        'numpy_version': np.__version__,
+        'source_sha256': file_sha256(source_path) if source_path else None,
+        'estimator_type': type(model).__name__,
+        'feature_names': [str(name) for name in getattr(model, 'feature_names_in_', [])] or None,
+        'preprocessor': _describe_preprocessor(model) if isinstance(compiled, CompiledPipeline) else None,
+        'estimator': describe_estimator(final),
+        'arrays': {}
+    }
+
+    tmp_dir = f'{directory}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name in FOREST_ARRAYS:
+        array = np.ascontiguousarray(getattr(final.forest, name))
+        # intp is platform-sized; store indices as int64 so artifacts move between machines
+        if array.dtype == np.intp:
+            array = array.astype(np.int64)
+        path = os.path.join(tmp_dir, f'{name}.npy')
+        np.save(path, array, allow_pickle=False)
+        manifest['arrays'][name] = {'file': f'{name}.npy', 'dtype': array.dtype.str, 'shape': list(array.shape),
+                                    'sha256': file_sha256(path)}
+    with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap directories: move the old one aside first, since a rename cannot replace a non-empty one
+    old_dir = f'{directory}.{os.getpid()}.old'
+    if os.path.exists(directory):
+        os.replace(directory, old_dir)
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ArtifactError(f'cannot read {path}: {e}') from None
+    if manifest.get('format') != ARTIFACT_FORMAT:
+        raise ArtifactError(f'{directory} has artifact format {manifest.get("format")!r}; '
+                            f'this code reads format {ARTIFACT_FORMAT}, so re-export it')
+    return manifest
+
+
+def _load_array(directory, name, spec, verify):
+    path = os.path.join(directory, spec['file'])
+    if os.path.basename(spec['file']) != spec['file']:
+        raise ArtifactError(f'array {name} points outside {directory}')
+    if verify and file_sha256(path) != spec['sha256']:
+        raise ArtifactError(f'{path} does not match its checksum in the manifest')
+    array = np.load(path, mmap_mode='r', allow_pickle=False)
+    if array.dtype.str != spec['dtype'] or list(array.shape) != spec['shape']:
+        raise ArtifactError(f'{path} is {array.dtype.str} {list(array.shape)}; the manifest says '
+                            f'{spec["dtype"]} {spec["shape"]}')
+    return array
+
+
+def build_estimator(spec, arrays, fallback=None):
+    # A compiled estimator from describe_estimator() constants and FOREST_ARRAYS arrays
+    # (used as given: memory-mapped here, shared memory in model_server.py)
+    cls = ESTIMATORS[spec['class']]
+    final = cls.__new__(cls)
+    final.model = fallback if fallback is not None else NoFallback()
+    final.forest = FlatForest.from_arrays(arrays['roots'], arrays['feature'], arrays['threshold'], arrays['children'],
+                                          arrays['value'], spec['max_depth'], np.dtype(spec['input_dtype']))
+    final.n_features_in_ = spec['n_features_in']
+    if 'baseline' in spec:
+        final.baseline = spec['baseline']
+    if 'classes' in spec:
+        final.classes_ = np.asarray(spec['classes'], dtype=object)
+    return final
+
+
+def load(directory, fallback=None, verify=True):
+    # The model an artifact directory holds. fallback: the sklearn estimator (or a lazy
+    # stand-in) to hand large batches to, as compiled models do; default: none.
+    manifest = read_manifest(directory)
+    arrays = {name: _load_array(directory, name, spec, verify) for name, spec in manifest['arrays'].items()}
+    missing = [name for name in FOREST_ARRAYS if name not in arrays]
+    if missing:
+        raise ArtifactError(f'{directory} lacks arrays {missing}')
+
+    spec = manifest['estimator']
+    if spec['class'] not in ESTIMATORS:
+        raise ArtifactError(f'{directory} holds an unknown estimator {spec["class"]!r}')
+    n_nodes = len(arrays['feature'])
+    if (len(arrays['threshold']) != n_nodes or len(arrays['value']) != n_nodes
+            or len(arrays['children']) != 2 * n_nodes or int(arrays['feature'].max(initial=0)) >= spec['n_features_in']
+            or int(arrays['children'].max(initial=0)) >= n_nodes or int(arrays['roots'].max(initial=0)) >= n_nodes):
+        raise ArtifactError(f'{directory} has inconsistent tree arrays')
+
+    final = build_estimator(spec, arrays, fallback)
+
+    feature_names = manifest.get('feature_names')
+    if manifest['preprocessor'] is None:
+        if feature_names is not None:
+            if len(feature_names) != spec['n_features_in']:
+                raise ArtifactError(f'{directory} names {len(feature_names)} features for '
+                                    f'{spec["n_features_in"]} model inputs')
+            final.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        return final
+
+    transformers = []
+    for block in manifest['preprocessor']:
+        if block['kind'] == 'StandardScaler':
+            if not len(block['mean']) == len(block['scale']) == len(block['columns']):
+                raise ArtifactError(f'{directory}: scaler block {block["name"]} does not match its columns')
+            params = ScalerParams(block['mean'], block['scale'])
+        elif block['kind'] == 'OneHotEncoder':
+            if len(block['categories']) != len(block['columns']):
+                raise ArtifactError(f'{directory}: one-hot block {block["name"]} does not match its columns')
+            params = OneHotParams(block['categories'])
+        else:
+            raise ArtifactError(f'{directory} holds an unknown preprocessing block {block["kind"]!r}')
+        transformers.append((block['name'], params, block['columns']))
+    preprocessor = ColumnParams(transformers)
+    if preprocessor.n_features_out != spec['n_features_in']:
+        raise ArtifactError(f'{directory}: preprocessing yields {preprocessor.n_features_out} features, '
+                            f'the estimator takes {spec["n_features_in"]}')
+    return ArtifactPipeline(preprocessor, final, feature_names or [])
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import time
+
+    BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    MODELS_DIR = os.path.join(BASE_DIR, 'models')
+
+    parser = argparse.ArgumentParser(description='Export pickled models as pickle-free artifacts')
+    parser.add_argument('models', nargs='*', help='model names (default: every models/*.pkl)')
+    parser.add_argument('--models-dir', default=MODELS_DIR)
+    args = parser.parse_args()
+
+    names = args.models or sorted(os.path.splitext(name)[0] for name in os.listdir(args.models_dir)
+                                  if name.endswith('.pkl'))
+    failed = False
+    for name in names:
+        source = os.path.join(args.models_dir, f'{name}.pkl')
+        directory = os.path.join(args.models_dir, f'{name}.artifact')
+        try:
+            started = time.perf_counter()
+            export(unpickle(source), directory, source)
+            unpickled = time.perf_counter()
+            unpickle(source)
+            unpickle_seconds = time.perf_counter() - unpickled
+            loaded = time.perf_counter()
+            load(directory)
+            load_seconds = time.perf_counter() - loaded
+        except (ArtifactError, TypeError) as e:
+            print(f'{name}: FAILED, {e}')
+            failed = True
+            continue
+        print(f'{name}: exported to {directory} in {unpickled - started:.2f}s; '
+              f'loads in {load_seconds * 1e3:.1f} ms (unpickling: {unpickle_seconds * 1e3:.1f} ms)')
+    sys.exit(1 if failed else 0)
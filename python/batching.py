@@ -0,0 +1,78 @@
+# python/batching.py
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import queue
+import threading
+import time
+
+
+class MicroBatcher:
+    # Merges single-record calls that arrive within `window` seconds of each other into
+    # one predict_batch(items) call, run on a bounded inference pool. predict_batch must
+    # return one result per item, in order; if it raises, every caller in the batch sees it.
+
+    def __init__(self, predict_batch, workers, window=0.002, max_batch=256):
+        self.predict_batch = predict_batch
+        self.workers = workers
+        self.window = window
+        self.max_batch = max_batch
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        # Threads do not survive fork, so each worker process starts its own dispatcher
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                threading.Thread(target=self._dispatch, name='micro-batcher', daemon=True).start()
+                self._pid = os.getpid()
+
+    def submit(self, item):
+        if self._pid != os.getpid():
+            self._start()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def _dispatch(self):
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            inference_pool(self.workers).submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            results = self.predict_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def inference_pool(workers):
+    # The process's bounded pool that model inference is offloaded to, created after any fork
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+            _pool_pid = os.getpid()
+        return _pool
@@ -0,0 +1,388 @@
+# python/benchmark.py
+# Latency and throughput benchmark of the prediction API on realistic request mixes:
+#   python python/benchmark.py --json bench.json                      # in process, Flask test client
+#   python python/benchmark.py --target server --workers 2 --json bench.json
+#   python python/benchmark.py --baseline bench.json                  # flag regressions against a run
+# Request bodies are drawn from the synthetic generators in temp_py_models/synthesis.py, so
+# the inputs follow the distributions the models were trained on. Every endpoint is replayed
+# one record per request and through its /batch route at each --batch-sizes; each scenario
+# reports p50/p95/p99 latency and requests (and rows) per second. The time split between
+# feature building, preprocessing and predict is measured in process on the same bodies.
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'temp_py_models'))
+from synthesis import appointment_frame, iter_patient_flow, iter_resources  # noqa: E402
+
+ENDPOINTS = ['waitingtime', 'appointment', 'resources']
+# waitingintervals (waiting times with p10 / p50 / p90) needs the quantile models, so it only runs when asked for
+ROUTES = {
+    'waitingtime': '/api/predictwaitingtime',
+    'waitingintervals': '/api/predictwaitingtime',
+    'appointment': '/api/scheduleappointment',
+    'resources': '/api/predictresources'
+}
+QUERIES = {'waitingintervals': '?intervals=1'}
+# Requests sample from at least a year of arrivals / five years of days, so every hour,
+# weekday and month shows up even in short runs
+MIN_FLOW_ROWS = 12 * 365
+MIN_RESOURCE_DAYS = 5 * 365
+
+
+def sample(frame, n, seed):
+    return frame.sample(n, replace=n > len(frame), random_state=seed).reset_index(drop=True)
+
+
+def waiting_time_records(n, seed):
+    frame = sample(pd.concat(iter_patient_flow(max(n, MIN_FLOW_ROWS), seed), ignore_index=True), n, seed)
+    return [{
+        'hour': int(row.Hour),
+        'dayOfWeek': int(row.DayOfWeek),
+        'month': int(row.Month),
+        'queueLength': float(row.QueueLength),
+        'serviceTime': round(float(row.ServiceTime), 2),
+        'patientType': row.PatientType,
+        'department': row.Department
+    } for row in frame.itertuples()]
+
+
+def appointment_records(n, seed):
+    return [{
+        'age': int(row.Age),
+        'gender': row.Gender,
+        'visitType': row.VisitType,
+        'urgency': row.Urgency,
+        'department': row.Department
+    } for row in appointment_frame(n, seed).itertuples()]
+
+
+def resource_records(n, seed):
+    frame = sample(pd.concat(iter_resources(max(n, MIN_RESOURCE_DAYS), seed), ignore_index=True), n, seed)
+    return [{
+        'date': row.Date.strftime('%Y-%m-%d'),
+        'department': row.Department,
+        'outpatientVisits': int(row.OutpatientVisits),
+        'inpatientAdmissions': int(row.InpatientAdmissions),
+        'avgLengthOfStay': round(float(row.AvgLengthOfStay), 2)
+    } for row in frame.itertuples()]
+
+
+RECORDS = {'waitingtime': waiting_time_records, 'waitingintervals': waiting_time_records,
+           'appointment': appointment_records, 'resources': resource_records}
+
+
+def request_bodies(endpoint, batch_size, n_requests, seed):
+    # (path, JSON body) pairs: single records go to the endpoint itself, batches to its /batch route
+    records = RECORDS[endpoint](n_requests * batch_size, seed)
+    query = QUERIES.get(endpoint, '')
+    if batch_size == 1:
+        return [(ROUTES[endpoint] + query, json.dumps(record).encode()) for record in records]
+    return [(ROUTES[endpoint] + '/batch' + query, json.dumps(records[i:i + batch_size]).encode())
+            for i in range(0, len(records), batch_size)]
+
+
+def percentiles(latencies):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+    return {'p50': p50, 'p95': p95, 'p99': p99, 'mean': float(np.mean(latencies)) * 1e3,
+            'max': float(np.max(latencies)) * 1e3}
+
+
+class ClientTarget:
+    # In process through Flask's test client: the cost of the app itself, without a network hop
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def post(self, path, body):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.post(path, data=body, content_type='application/json')
+        return response.status_code, response.get_json(silent=True)
+
+    def get(self, path):
+        return self.app.test_client().get(path).get_json()
+
+    def close(self):
+        pass
+
+
+class ServerTarget:
+    # Over HTTP against a running server: --url, or a python/serve.py started on a free port
+
+    def __init__(self, url=None, serve_args=(), env=None, timeout=60):
+        self.process = None
+        if url is None:
+            with socket.socket() as sock:
+                sock.bind(('127.0.0.1', 0))
+                port = sock.getsockname()[1]
+            self.process = subprocess.Popen(
+                [sys.executable, os.path.join(HERE, 'serve.py'), '--port', str(port), *serve_args],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            url = f'http://127.0.0.1:{port}'
+        self.url = url.rstrip('/')
+        self.wait_ready(timeout)
+
+    def wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.get('/api/models')
+                return
+            except (urllib.error.URLError, ConnectionError):
+                if self.process is not None and self.process.poll() is not None:
+                    raise SystemExit(f'serve.py exited with status {self.process.returncode}')
+                if time.monotonic() > deadline:
+                    self.close()
+                    raise SystemExit(f'no response from {self.url} within {timeout}s')
+                time.sleep(0.2)
+
+    def post(self, path, body):
+        req = urllib.request.Request(self.url + path, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    def get(self, path):
+        with urllib.request.urlopen(self.url + path) as response:
+            return json.loads(response.read())
+
+    def close(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+
+def failed(status, payload):
+    # Batch routes answer 200 with per-record errors, so those count as failures too
+    if status != 200 or payload is None:
+        return True
+    results = payload.get('results') if isinstance(payload, dict) else None
+    return 'error' in payload or any('error' in result for result in results or [])
+
+
+def replay(target, bodies, concurrency, warmup):
+    # The first `warmup` bodies only warm up caches and connections; the rest are timed
+    for path, body in bodies[:warmup]:
+        target.post(path, body)
+    bodies = bodies[warmup:]
+
+    def timed(item):
+        path, body = item
+        started = time.perf_counter()
+        status, payload = target.post(path, body)
+        return time.perf_counter() - started, failed(status, payload)
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        outcomes = [timed(item) for item in bodies]
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            outcomes = list(pool.map(timed, bodies))
+    elapsed = time.perf_counter() - started
+    latencies = np.array([latency for latency, _ in outcomes])
+    return latencies, sum(error for _, error in outcomes), elapsed
+
+
+def pipeline_stages(model):
+    # (preprocess, predict) of a compiled or plain sklearn pipeline
+    if hasattr(model, 'final'):
+        return model.transform, model.final.predict
+    return model[:-1].transform, model[-1].predict
+
+
+def stage_functions(app_module, endpoint):
+    # (build features, preprocess, predict) as app.py runs them for this endpoint, uncached
+    if endpoint == 'waitingtime':
+        flow = app_module.registry.get('patient_flow')
+        return lambda record: app_module.parse_waiting_time(flow, record), flow.encoder.encode, flow.model.predict
+
+    if endpoint == 'waitingintervals':
+        flow = app_module.registry.get('patient_flow')
+        return (lambda record: app_module.parse_waiting_time(flow, record), flow.intervals.encoder.encode,
+                flow.intervals.models.predict)
+
+    if endpoint == 'appointment':
+        scheduling = app_module.registry.get('appointment_scheduling')
+        preprocess, predict = pipeline_stages(scheduling.model)
+        return (lambda record: app_module.appointment_features(scheduling, record),
+                lambda patients: preprocess(pd.DataFrame(patients)), predict)
+
+    resources = app_module.registry.get('resource_allocation')
+    encoders = {id(resources.bed_encoder): resources.bed_encoder, id(resources.staff_encoder): resources.staff_encoder}
+
+    def preprocess(rows):
+        columns = app_module.ResourceEncoder.row_columns(rows)
+        encoded = {key: encoder.encode_columns(columns) for key, encoder in encoders.items()}
+        return encoded[id(resources.bed_encoder)], encoded[id(resources.staff_encoder)]
+
+    def predict(inputs):
+        return resources.bed_model.final.predict(inputs[0]), resources.staff_model.final.predict(inputs[1])
+
+    return lambda record: app_module.parse_resources(resources, record), preprocess, predict
+
+
+def stage_split(app_module, endpoint, bodies):
+    # Median milliseconds per request spent in each stage, over the scenario's own bodies
+    build, preprocess, predict = stage_functions(app_module, endpoint)
+    timings = []
+    for _, body in bodies:
+        records = json.loads(body)
+        records = records if isinstance(records, list) else [records]
+        t0 = time.perf_counter()
+        rows = [build(record) for record in records]
+        t1 = time.perf_counter()
+        X = preprocess(rows)
+        t2 = time.perf_counter()
+        predict(X)
+        t3 = time.perf_counter()
+        timings.append((t1 - t0, t2 - t1, t3 - t2))
+    features_ms, preprocess_ms, predict_ms = np.median(timings, axis=0) * 1e3
+    total = features_ms + preprocess_ms + predict_ms
+    return {
+        'featuresMs': features_ms,
+        'preprocessMs': preprocess_ms,
+        'predictMs': predict_ms,
+        'share': {'features': features_ms / total, 'preprocess': preprocess_ms / total, 'predict': predict_ms / total}
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def scenario_key(result):
+    return result['endpoint'], result['batchSize']
+
+
+def compare(results, baseline, tolerance):
+    # Print latency and throughput changes against a previous run; returns the regressed scenarios
+    previous = {scenario_key(r): r for r in baseline['results']}
+    regressions = []
+    print(f"\n{'vs baseline':<24}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}")
+    for r in results:
+        before = previous.get(scenario_key(r))
+        if before is None:
+            continue
+        changes = [r['latencyMs'][p] / before['latencyMs'][p] - 1 for p in ('p50', 'p95', 'p99')]
+        changes.append(r['requestsPerSecond'] / before['requestsPerSecond'] - 1)
+        regressed = changes[1] > tolerance or changes[3] < -tolerance
+        if regressed:
+            regressions.append(scenario_key(r))
+        print(f"{r['endpoint']:<14}{r['batchSize']:>10}" + ''.join(f'{change:>+9.0%}' for change in changes)
+              + ('  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the prediction API on synthetic request mixes')
+    parser.add_argument('--target', choices=['client', 'server'], default='client',
+                        help='Flask test client in this process, or HTTP against a server')
+    parser.add_argument('--url', help='benchmark this running server instead of starting python/serve.py')
+    parser.add_argument('--workers', type=int, default=1, help='serve.py worker processes')
+    parser.add_argument('--inference-threads', type=int, default=2, help='serve.py inference threads per worker')
+    parser.add_argument('--endpoints', nargs='+', choices=sorted(ROUTES), default=ENDPOINTS)
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 16, 256],
+                        help='records per request; 1 uses the single-record routes')
+    parser.add_argument('--requests', type=int, default=300, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed requests before each scenario')
+    parser.add_argument('--concurrency', type=int, default=1, help='requests in flight at once')
+    parser.add_argument('--no-cache', action='store_true', help='disable the prediction caches')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against the JSON of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative p95 or throughput change counted as a regression')
+    args = parser.parse_args()
+
+    if args.no_cache:
+        os.environ['PREDICTION_CACHE_SIZE'] = '0'
+    # The stage split always runs in this process on the same models the server loads
+    sys.path.insert(0, HERE)
+    import app as app_module
+
+    if args.target == 'client':
+        target = ClientTarget(app_module.app)
+    else:
+        serve_args = ['--workers', str(args.workers), '--inference-threads', str(args.inference_threads)]
+        target = ServerTarget(args.url, serve_args, dict(os.environ))
+
+    results, stages = [], []
+    print(f"{'endpoint':<14}{'batch':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'rows/s':>10}"
+          f"{'errors':>8}{'features':>10}{'preproc':>9}{'predict':>9}")
+    try:
+        for endpoint in args.endpoints:
+            for batch_size in args.batch_sizes:
+                bodies = request_bodies(endpoint, batch_size, args.requests + args.warmup, args.seed)
+                latencies, errors, elapsed = replay(target, bodies, args.concurrency, args.warmup)
+                result = {
+                    'endpoint': endpoint,
+                    'batchSize': batch_size,
+                    'requests': len(latencies),
+                    'errors': errors,
+                    'latencyMs': percentiles(latencies),
+                    'requestsPerSecond': len(latencies) / elapsed,
+                    'rowsPerSecond': len(latencies) * batch_size / elapsed
+                }
+                split = dict(stage_split(app_module, endpoint, bodies[args.warmup:]),
+                             endpoint=endpoint, batchSize=batch_size)
+                results.append(result)
+                stages.append(split)
+                share = split['share']
+                print(f"{endpoint:<14}{batch_size:>6}{result['latencyMs']['p50']:>9.2f}"
+                      f"{result['latencyMs']['p95']:>9.2f}{result['latencyMs']['p99']:>9.2f}"
+                      f"{result['requestsPerSecond']:>9.0f}{result['rowsPerSecond']:>10.0f}{errors:>8}"
+                      f"{share['features']:>10.0%}{share['preprocess']:>9.0%}{share['predict']:>9.0%}")
+        models = target.get('/api/models')
+    finally:
+        target.close()
+
+    run = {
+        'meta': {
+            'startedAt': datetime.now(timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'target': args.target if args.url is None else args.url,
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'models': models,
+            'config': {key: value for key, value in vars(args).items() if key not in ('json', 'baseline')}
+        },
+        'results': results,
+        'stages': stages
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(run, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
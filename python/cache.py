@@ -0,0 +1,71 @@
+# python/cache.py
+from collections import OrderedDict
+import threading
+import time
+
+
+class PredictionCache:
+    # Bounded LRU map from normalized model inputs to finished predictions.
+    # Entries optionally expire after ttl seconds; invalidate() drops everything
+    # and must be called whenever the model behind the cache is reloaded.
+
+    def __init__(self, maxsize=4096, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        # The cached value, or None on a miss
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / lookups if lookups else 0.0
+            }
+
+
+def cached_predict(cache, keys, rows, predict_rows):
+    # Serve what the cache already knows and run one batched predict over the misses,
+    # returning results in the order of rows
+    results = [cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        fresh = predict_rows([rows[i] for i in missing])
+        for i, result in zip(missing, fresh):
+            cache.put(keys[i], result)
+            results[i] = result
+    return results
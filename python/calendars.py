@@ -0,0 +1,103 @@
+# python/calendars.py
+# Public holiday calendars, one text file per region in HOLIDAY_DIR (holidays/<REGION>.txt):
+#
+#   # comment
+#   2024-03-25  Holi              a holiday on that date
+#   --01-26     Republic Day      the same day every year (ISO 8601 recurring date)
+#
+# Each file is compiled into a bitset over every day from FIRST_YEAR to LAST_YEAR, so
+# whether a date is a holiday is one array index, and a whole date array is one gather.
+# reload() recompiles only the files that changed and swaps the set in atomically, so
+# requests never see a half-loaded calendar.
+from calendar import isleap
+from datetime import date, datetime
+import glob
+import os
+import threading
+
+import numpy as np
+
+FIRST_YEAR = 1970
+LAST_YEAR = 2100
+_FIRST_DAY = np.datetime64(f'{FIRST_YEAR}-01-01', 'D')
+_FIRST_ORDINAL = date(FIRST_YEAR, 1, 1).toordinal()
+_N_DAYS = date(LAST_YEAR + 1, 1, 1).toordinal() - _FIRST_ORDINAL
+
+
+class HolidayCalendar:
+
+    def __init__(self, region, days, path=None, mtime=None):
+        # days: the holidays, as datetime64[D]
+        self.region = region
+        self.path = path
+        self.mtime = mtime
+        self.bits = np.zeros(_N_DAYS, dtype=bool)
+        offsets = (np.asarray(days, dtype='datetime64[D]') - _FIRST_DAY).astype(np.int64)
+        self.bits[offsets[(offsets >= 0) & (offsets < _N_DAYS)]] = True
+        self.count = int(self.bits.sum())
+
+    @classmethod
+    def load(cls, path):
+        region = os.path.splitext(os.path.basename(path))[0]
+        days = []
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                entry = line.split('#', 1)[0].strip()
+                if not entry:
+                    continue
+                when = entry.split()[0]
+                try:
+                    if when.startswith('--'):
+                        month, day = (int(part) for part in when[2:].split('-'))
+                        dates = [date(year, month, day) for year in range(FIRST_YEAR, LAST_YEAR + 1)
+                                 if (month, day) != (2, 29) or isleap(year)]
+                    else:
+                        dates = [datetime.strptime(when, '%Y-%m-%d').date()]
+                except ValueError:
+                    raise ValueError(f'{path}:{number}: expected YYYY-MM-DD or --MM-DD, got {when!r}') from None
+                days += dates
+        return cls(region, np.array(days, dtype='datetime64[D]'), path, os.path.getmtime(path))
+
+    def is_holiday(self, day):
+        # 1 if the date (date or datetime) is a holiday, else 0; dates out of range are not
+        offset = day.toordinal() - _FIRST_ORDINAL
+        return int(self.bits[offset]) if 0 <= offset < _N_DAYS else 0
+
+    def flags(self, days):
+        # 0/1 per entry of a datetime64 array
+        offsets = (np.asarray(days, dtype='datetime64[D]') - _FIRST_DAY).astype(np.int64)
+        inside = (offsets >= 0) & (offsets < _N_DAYS)
+        out = np.zeros(offsets.shape, dtype=np.int64)
+        out[inside] = self.bits[offsets[inside]]
+        return out
+
+
+class HolidayCalendars:
+    # Every region's calendar in a directory; get() returns None for unknown regions
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._calendars = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        # Recompile new or modified files and drop deleted ones; returns {region: holidays}.
+        # A file that fails to parse raises ValueError and leaves the current set in place.
+        with self._lock:
+            current = self._calendars
+            calendars = {}
+            for path in sorted(glob.glob(os.path.join(self.directory, '*.txt'))):
+                region = os.path.splitext(os.path.basename(path))[0]
+                calendar = current.get(region)
+                if calendar is None or calendar.path != path or calendar.mtime != os.path.getmtime(path):
+                    calendar = HolidayCalendar.load(path)
+                calendars[region] = calendar
+            self._calendars = calendars
+            return {region: calendar.count for region, calendar in calendars.items()}
+
+    def get(self, region):
+        return self._calendars.get(region)
+
+    def regions(self):
+        return sorted(self._calendars)
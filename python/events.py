@@ -0,0 +1,256 @@
+# python/events.py
+# Live patient-flow inputs from arrival and service-completion events. Events are posted
+# in bulk (JSON lines, a JSON array or CSV), validated column-wise, appended to an on-disk
+# columnar store as one segment file per batch, and folded into per-department rolling
+# aggregates: patients waiting (arrivals minus completions) and the mean service time of
+# the last ROLLING_SERVICE_WINDOW completions. The aggregates are updated incrementally,
+# so reading a department's current values is a dict lookup, never a scan of the history.
+# The store is read back once, at startup, to restore them.
+#
+# Segments are Parquet when pyarrow is installed, otherwise compressed .npz column arrays.
+from collections import deque
+import glob
+import io
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+EVENT_TYPES = ['arrival', 'completion']
+# Request columns every event needs; patientId, patientType and (for completions,
+# required there) serviceTime are optional
+REQUIRED = ['eventType', 'timestamp', 'department']
+
+ROLLING_SERVICE_WINDOW = 50
+# Rejected rows reported back per ingest request
+MAX_REPORTED_ERRORS = 100
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def read_events(body, content_type):
+    # A DataFrame of the raw events in a request body: CSV for text/csv, else JSON lines
+    # (application/x-ndjson, or any body not starting with '[') or a JSON array of objects
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    if 'csv' in (content_type or ''):
+        return pd.read_csv(io.StringIO(text), dtype={'patientId': str})
+    stripped = text.lstrip()
+    if not stripped:
+        return pd.DataFrame(columns=REQUIRED)
+    if stripped.startswith('['):
+        records = json.loads(stripped)
+    else:
+        records = [json.loads(line) for line in stripped.splitlines() if line.strip()]
+    if not all(isinstance(record, dict) for record in records):
+        raise ValueError('every event must be a JSON object')
+    return pd.DataFrame.from_records(records)
+
+
+def validate_events(frame, departments):
+    # (store-column DataFrame of the valid events in timestamp order, {row: problem} of the
+    # rejected ones). Completions must carry serviceTime in minutes.
+    missing = [column for column in REQUIRED if column not in frame.columns]
+    if missing:
+        raise ValueError(f'events need columns {REQUIRED}; missing {missing}')
+    n = len(frame)
+    problems = {}
+    rejected = np.zeros(n, dtype=bool)
+
+    def reject(mask, problem):
+        # Each row reports the first check it fails
+        for i in np.flatnonzero(mask & ~rejected):
+            problems[int(i)] = problem
+        rejected[mask] = True
+
+    event_type = frame['eventType'].astype(str).str.lower()
+    reject(~event_type.isin(EVENT_TYPES).to_numpy(), f'eventType must be one of {EVENT_TYPES}')
+    department = frame['department'].astype(str)
+    reject(~department.isin(departments).to_numpy(), f'department must be one of {sorted(departments)}')
+    timestamp = pd.to_datetime(frame['timestamp'], errors='coerce', utc=True).dt.tz_localize(None)
+    reject(timestamp.isna().to_numpy(), 'timestamp must be an ISO 8601 date-time')
+    if 'serviceTime' in frame.columns:
+        service_time = pd.to_numeric(frame['serviceTime'], errors='coerce').to_numpy(np.float64)
+    else:
+        service_time = np.full(n, np.nan)
+    completion = (event_type == 'completion').to_numpy()
+    reject(completion & ~((service_time >= 0) & (service_time <= 24 * 60)),
+           'completions need a serviceTime between 0 and 1440 minutes')
+
+    events = pd.DataFrame({
+        'timestamp': timestamp,
+        'event_type': event_type,
+        'department': department,
+        'patient_id': frame['patientId'].astype(str) if 'patientId' in frame.columns else '',
+        'patient_type': frame['patientType'].astype(str) if 'patientType' in frame.columns else '',
+        'service_time': np.where(completion, service_time, np.nan)
+    })[~rejected]
+    return events.sort_values('timestamp', kind='stable').reset_index(drop=True), problems
+
+
+class EventStore:
+    # Append-only directory of columnar segments, one per ingested batch
+
+    def __init__(self, directory, file_format=None):
+        self.directory = directory
+        self.format = file_format or ('parquet' if parquet_available() else 'npz')
+        if self.format == 'parquet' and not parquet_available():
+            raise ValueError('the parquet event store needs pyarrow (pip install pyarrow); use npz instead')
+        if self.format not in ('parquet', 'npz'):
+            raise ValueError(f'unknown event store format {self.format!r}')
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, events):
+        # Write the batch to a new segment (atomically, via a rename); names sort by write time
+        if not len(events):
+            return None
+        name = f'events-{time.time_ns():020d}-{os.getpid()}.{self.format}'
+        path = os.path.join(self.directory, name)
+        partial = path + '.partial'
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.Table.from_pandas(events, preserve_index=False), partial)
+        else:
+            with open(partial, 'wb') as f:
+                np.savez_compressed(f, **{
+                    'timestamp': events['timestamp'].to_numpy('datetime64[ns]').view(np.int64),
+                    'event_type': (events['event_type'] == 'completion').to_numpy(np.int8),
+                    'department': events['department'].to_numpy(str),
+                    'patient_id': events['patient_id'].to_numpy(str),
+                    'patient_type': events['patient_type'].to_numpy(str),
+                    'service_time': events['service_time'].to_numpy(np.float32)
+                })
+        os.replace(partial, path)
+        return path
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, 'events-*.parquet'))
+                      + glob.glob(os.path.join(self.directory, 'events-*.npz')),
+                      key=os.path.basename)
+
+    def read(self, path):
+        if path.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            return pq.read_table(path).to_pandas()
+        with np.load(path, allow_pickle=False) as columns:
+            return pd.DataFrame({
+                'timestamp': columns['timestamp'].view('datetime64[ns]'),
+                'event_type': np.array(EVENT_TYPES)[columns['event_type']],
+                'department': columns['department'],
+                'patient_id': columns['patient_id'],
+                'patient_type': columns['patient_type'],
+                'service_time': columns['service_time'].astype(np.float64)
+            })
+
+    def replay(self):
+        # Every stored batch, oldest first
+        for path in self.segments():
+            yield self.read(path)
+
+
+class DepartmentFlow:
+    __slots__ = ('queue_length', 'service_times', 'service_sum', 'last_event')
+
+    def __init__(self, window):
+        self.queue_length = 0
+        self.service_times = deque(maxlen=window)
+        self.service_sum = 0.0
+        self.last_event = None
+
+
+class RollingFlow:
+    # Per-department queue length and trailing mean service time, updated per event
+
+    def __init__(self, window=ROLLING_SERVICE_WINDOW):
+        self.window = window
+        self._departments = {}
+        self._lock = threading.Lock()
+
+    def update(self, events):
+        # Fold a timestamp-ordered batch of store-column events in; O(len(events))
+        with self._lock:
+            for department, group in events.groupby('department', sort=False):
+                flow = self._departments.get(department)
+                if flow is None:
+                    flow = self._departments[department] = DepartmentFlow(self.window)
+                completion = (group['event_type'] == 'completion').to_numpy()
+                arrivals = int((~completion).sum())
+                # A completion whose arrival predates the feed never takes the line below zero
+                flow.queue_length = max(0, flow.queue_length + arrivals - int(completion.sum()))
+                for minutes in group['service_time'].to_numpy()[completion][-self.window:].tolist():
+                    if len(flow.service_times) == self.window:
+                        flow.service_sum -= flow.service_times[0]
+                    flow.service_times.append(minutes)
+                    flow.service_sum += minutes
+                latest = group['timestamp'].iloc[-1]
+                if flow.last_event is None or latest > flow.last_event:
+                    flow.last_event = latest
+
+    def current(self, department):
+        # (queue length, mean service time or None) for a department, or None if no events yet
+        with self._lock:
+            flow = self._departments.get(department)
+            if flow is None:
+                return None
+            n = len(flow.service_times)
+            return flow.queue_length, (flow.service_sum / n if n else None)
+
+    def snapshot(self):
+        with self._lock:
+            return {department: {
+                'queueLength': flow.queue_length,
+                'meanServiceTime': flow.service_sum / len(flow.service_times) if flow.service_times else None,
+                'completionsInWindow': len(flow.service_times),
+                'lastEvent': flow.last_event.isoformat() if flow.last_event is not None else None
+            } for department, flow in self._departments.items()}
+
+
+class LiveFlowInputs:
+    # The store plus its rolling aggregates; fill() completes waiting-time requests
+
+    def __init__(self, store, window=ROLLING_SERVICE_WINDOW):
+        self.store = store
+        self.rolling = RollingFlow(window)
+        self._write_lock = threading.Lock()
+        started = time.perf_counter()
+        self.restored = 0
+        for events in store.replay():
+            self.rolling.update(events)
+            self.restored += len(events)
+        self.restore_seconds = time.perf_counter() - started
+
+    def ingest(self, events):
+        # Persist, then apply, a validated batch; the lock keeps the store and the
+        # aggregates in the same order
+        with self._write_lock:
+            self.store.append(events)
+            self.rolling.update(events)
+
+    def fill(self, data):
+        # A waiting-time request with queueLength / serviceTime taken from the live
+        # aggregates when the client leaves them out (or null); anything else is returned as is
+        if not isinstance(data, dict) or (data.get('queueLength') is not None
+                                          and data.get('serviceTime') is not None):
+            return data
+        department = data.get('department')
+        # Anything but a string is left for the schema to reject
+        current = self.rolling.current(department) if type(department) is str else None
+        if current is None:
+            return data
+        queue_length, service_time = current
+        filled = dict(data)
+        if filled.get('queueLength') is None:
+            filled['queueLength'] = queue_length
+        if service_time is not None and filled.get('serviceTime') is None:
+            filled['serviceTime'] = service_time
+        return filled
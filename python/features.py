@@ -0,0 +1,297 @@
+# python/features.py
+from datetime import datetime
+
+import numpy as np
+
+from schemas import Choice, Date, Number, RequestError, Schema, Text
+
+PATIENT_TYPES = ['Emergency', 'Routine', 'Follow-up']
+DEPARTMENTS = ['General', 'Cardiology', 'Orthopedics', 'Pediatrics', 'OB-GYN']
+
+# Column order the API used to build when a model carries no feature_names_in_
+WAITING_TIME_FEATURES = [
+    'Hour_sin', 'Hour_cos', 'DayOfWeek_sin', 'DayOfWeek_cos', 'Month_sin', 'Month_cos',
+    'IsHoliday', 'QueueLength', 'ServiceTime'
+] + [f'PatientType_{pt}' for pt in PATIENT_TYPES] + [f'Department_{dept}' for dept in DEPARTMENTS]
+
+TIMES_OF_DAY = ['Night', 'Morning', 'Afternoon', 'Evening']
+
+# Cyclic terms for every integer month (1-12) and weekday (0-6), indexed by value
+MONTH_SIN = np.sin(2 * np.pi * np.arange(13)/12)
+MONTH_COS = np.cos(2 * np.pi * np.arange(13)/12)
+DAY_OF_WEEK_SIN = np.sin(2 * np.pi * np.arange(7)/7)
+DAY_OF_WEEK_COS = np.cos(2 * np.pi * np.arange(7)/7)
+
+# Longest forecast horizon the resource models are asked for in one request
+MAX_HORIZON_DAYS = 366
+
+
+def waiting_time_schema(patient_types, departments):
+    # Parses to (hour, dayOfWeek, month, queueLength, serviceTime, patientType, department,
+    # date, region); date and region (None if absent) decide IsHoliday, and a date must
+    # agree with dayOfWeek and month
+    return Schema(
+        Number('hour', 0, 23, integer=True),
+        Number('dayOfWeek', 0, 6, integer=True),
+        Number('month', 1, 12, integer=True),
+        Number('queueLength', 0, 1000),
+        Number('serviceTime', 0, 24 * 60),  # minutes
+        Choice('patientType', patient_types),
+        Choice('department', departments),
+        Date('date', default=None),
+        Text('region', 50, default=None)
+    )
+
+
+def resource_schema(departments):
+    # Parses to (date, department, outpatientVisits, inpatientAdmissions, avgLengthOfStay, region)
+    return Schema(
+        Date('date'),
+        Choice('department', departments),
+        Number('outpatientVisits', 0, 100_000),
+        Number('inpatientAdmissions', 0, 10_000),
+        Number('avgLengthOfStay', 0, 365),  # days
+        Text('region', 50, default=None)
+    )
+
+
+class WaitingTimeEncoder:
+    # Maps waiting-time requests straight into the model's float64 feature matrix.
+    # All column slots are resolved once from the fitted feature names, so encoding
+    # a request is a handful of vectorized writes instead of a DataFrame build.
+
+    def __init__(self, feature_names=None):
+        self.feature_names = list(WAITING_TIME_FEATURES if feature_names is None else feature_names)
+        self.n_features = len(self.feature_names)
+        slots = {name: i for i, name in enumerate(self.feature_names)}
+
+        # (parsed field, period, sin slot, cos slot)
+        self._cyclic = [
+            (field, period, slots.get(f'{name}_sin'), slots.get(f'{name}_cos'))
+            for field, name, period in [(0, 'Hour', 24), (1, 'DayOfWeek', 7), (2, 'Month', 12)]
+        ]
+        self._numeric = [(3, slots.get('QueueLength')), (4, slots.get('ServiceTime'))]
+        self._is_holiday = slots.get('IsHoliday')
+        # The one-hot columns the model was fitted with are also the categories requests may use
+        self._patient_type_slots = {
+            name[len('PatientType_'):]: i for name, i in slots.items() if name.startswith('PatientType_')
+        }
+        self._department_slots = {
+            name[len('Department_'):]: i for name, i in slots.items() if name.startswith('Department_')
+        }
+        self.patient_types = sorted(self._patient_type_slots) or PATIENT_TYPES
+        self.departments = sorted(self._department_slots) or DEPARTMENTS
+        self.schema = waiting_time_schema(self.patient_types, self.departments)
+        # Derived columns only some training runs produce
+        self._is_weekend = slots.get('IsWeekend')
+        self._time_of_day = [slots.get(f'TimeOfDay_{tod}') for tod in TIMES_OF_DAY]
+
+    def parse(self, data):
+        # Validate and coerce a request; raises schemas.RequestError on bad input
+        values = self.schema.parse(data)
+        day = values[7]
+        if day is not None:
+            problems = {}
+            if values[1] != day.weekday():
+                problems['dayOfWeek'] = f'must be {day.weekday()}, the weekday of date'
+            if values[2] != day.month:
+                problems['month'] = f'must be {day.month}, the month of date'
+            if problems:
+                raise RequestError(problems)
+        return values
+
+    def encode(self, rows):
+        # Rows are (hour, dayOfWeek, month, queueLength, serviceTime, patientType, department),
+        # plus an optional trailing 0/1 IsHoliday
+        if not rows:
+            return np.zeros((0, self.n_features))
+        return self.encode_arrays(
+            np.array([row[:5] for row in rows], dtype=np.float64),
+            [row[5] for row in rows],
+            [row[6] for row in rows],
+            np.array([row[7] if len(row) > 7 else 0 for row in rows], dtype=np.float64)
+        )
+
+    def encode_arrays(self, numeric, patient_types, departments, is_holiday=0):
+        # numeric holds hour, dayOfWeek, month, queueLength, serviceTime columns
+        X = np.zeros((len(numeric), self.n_features))
+
+        if self._is_holiday is not None:
+            X[:, self._is_holiday] = is_holiday
+
+        for field, period, sin_slot, cos_slot in self._cyclic:
+            angle = 2 * np.pi * numeric[:, field] / period
+            if sin_slot is not None:
+                X[:, sin_slot] = np.sin(angle)
+            if cos_slot is not None:
+                X[:, cos_slot] = np.cos(angle)
+
+        for field, slot in self._numeric:
+            if slot is not None:
+                X[:, slot] = numeric[:, field]
+
+        # Unknown categories leave their one-hot block all zero
+        for values, category_slots in [(patient_types, self._patient_type_slots),
+                                       (departments, self._department_slots)]:
+            cols = np.array([category_slots.get(value, -1) for value in values])
+            hit = np.flatnonzero(cols >= 0)
+            X[hit, cols[hit]] = 1
+
+        if self._is_weekend is not None:
+            X[:, self._is_weekend] = numeric[:, 1] >= 5
+
+        if any(slot is not None for slot in self._time_of_day):
+            hour = numeric[:, 0]
+            time_of_day = np.searchsorted([6, 12, 18], hour, side='right')
+            for i, slot in enumerate(self._time_of_day):
+                if slot is not None:
+                    X[:, slot] = time_of_day == i
+
+        return X
+
+
+def _same_fit(ours, theirs):
+    # Fitted attributes are arrays, or lists of arrays for OneHotEncoder.categories_
+    if isinstance(ours, list):
+        return len(ours) == len(theirs) and all(np.array_equal(a, b) for a, b in zip(ours, theirs))
+    return np.array_equal(ours, theirs)
+
+
+def shared_preprocessor(*pipelines):
+    # The fitted preprocessing step, provided every pipeline learned exactly the same one
+    first = pipelines[0].named_steps['preprocessor']
+    for pipeline in pipelines[1:]:
+        other = pipeline.named_steps['preprocessor']
+        if len(first.transformers_) != len(other.transformers_):
+            raise ValueError('pipelines use different preprocessors')
+        for (_, ours, our_cols), (_, theirs, their_cols) in zip(first.transformers_, other.transformers_):
+            if list(our_cols) != list(their_cols) or type(ours) is not type(theirs):
+                raise ValueError('pipelines use different preprocessors')
+            for attr in ['mean_', 'scale_', 'categories_']:
+                if hasattr(ours, attr) and not _same_fit(getattr(ours, attr), getattr(theirs, attr, None)):
+                    raise ValueError(f'pipelines were fitted with different {attr}')
+    return first
+
+
+class ResourceEncoder:
+    # Applies the resource models' fitted ColumnTransformer (StandardScaler on the
+    # numeric columns, OneHotEncoder on Department) directly in NumPy, producing the
+    # matrix the regressors consume so it can be computed once and shared.
+
+    def __init__(self, preprocessor):
+        self.blocks = []
+        for name, transformer, columns in preprocessor.transformers_:
+            if isinstance(transformer, str) and transformer == 'drop':
+                continue
+            # Artifact-loaded parameters (artifacts.py) name the transformer they stand for
+            kind = getattr(transformer, 'kind', type(transformer).__name__)
+            if kind == 'StandardScaler':
+                mean = transformer.mean_ if transformer.with_mean else np.zeros(len(columns))
+                scale = transformer.scale_ if transformer.with_std else np.ones(len(columns))
+                self.blocks.append(('num', list(columns), mean, scale))
+            elif kind == 'OneHotEncoder' and len(columns) == 1:
+                slots = {category: i for i, category in enumerate(transformer.categories_[0])}
+                self.blocks.append(('cat', columns[0], slots, len(slots)))
+            else:
+                raise TypeError(f'cannot encode {name} transformer {kind}')
+        self.n_features = sum(len(block[1]) if block[0] == 'num' else block[3] for block in self.blocks)
+        # Fitted categories of each one-hot encoded column
+        self.categories = {block[1]: list(block[2]) for block in self.blocks if block[0] == 'cat'}
+
+    @staticmethod
+    def row(date, department, outpatient_visits, inpatient_admissions, avg_length_of_stay, is_holiday=0):
+        # A parsed resource_schema request (and its date's IsHoliday) as the row tuple
+        # row_columns() takes
+        return (date.year, date.month, date.weekday(), department,
+                outpatient_visits, inpatient_admissions, avg_length_of_stay, is_holiday)
+
+    @staticmethod
+    def columns(year, month, day_of_week, department, outpatient_visits, inpatient_admissions,
+                avg_length_of_stay, is_holiday=0, staff_available=20):
+        # Raw model inputs by training column name, each broadcast to one value per row
+        month = np.asarray(month, dtype=np.intp)
+        day_of_week = np.asarray(day_of_week, dtype=np.intp)
+        n_rows = len(department)
+        raw = {
+            'Month': month,
+            'Year': year,
+            'DayOfWeek': day_of_week,
+            'IsHoliday': is_holiday,
+            'OutpatientVisits': outpatient_visits,
+            'InpatientAdmissions': inpatient_admissions,
+            'StaffAvailable': staff_available,  # Placeholder
+            'AvgLengthOfStay': avg_length_of_stay,
+            'Month_sin': MONTH_SIN[month],
+            'Month_cos': MONTH_COS[month],
+            'DayOfWeek_sin': DAY_OF_WEEK_SIN[day_of_week],
+            'DayOfWeek_cos': DAY_OF_WEEK_COS[day_of_week]
+        }
+        columns = {name: np.broadcast_to(np.asarray(value, dtype=np.float64), (n_rows,)) for name, value in raw.items()}
+        columns['Department'] = department
+        return columns
+
+    def encode_columns(self, columns):
+        n_rows = len(columns['Department'])
+        X = np.zeros((n_rows, self.n_features))
+        start = 0
+        for block in self.blocks:
+            if block[0] == 'num':
+                _, names, mean, scale = block
+                numeric = np.column_stack([columns[name] for name in names])
+                X[:, start:start + len(names)] = (numeric - mean) / scale
+                start += len(names)
+            else:
+                # Unknown categories leave the one-hot block all zero, like handle_unknown='ignore'
+                _, name, slots, width = block
+                cols = np.array([slots.get(value, -1) for value in columns[name]])
+                hit = np.flatnonzero(cols >= 0)
+                X[hit, start + cols[hit]] = 1
+                start += width
+        return X
+
+    @classmethod
+    def row_columns(cls, rows):
+        year, month, day_of_week, department, outpatient, inpatient, length_of_stay, is_holiday = zip(*rows)
+        return cls.columns(year, month, day_of_week, list(department), outpatient, inpatient, length_of_stay,
+                           is_holiday)
+
+    def encode(self, rows):
+        if not rows:
+            return np.zeros((0, self.n_features))
+        return self.encode_columns(self.row_columns(rows))
+
+    @classmethod
+    def horizon_columns(cls, start_date, days, departments, outpatient_visits, inpatient_admissions,
+                        avg_length_of_stay, holidays=None):
+        # The full date x department grid, date-major, built without per-day date parsing.
+        # start_date is a date or YYYY-MM-DD string; visit, admission and stay inputs are
+        # non-negative scalars or one value per day; holidays, if given, is a calendar
+        # whose flags() marks the IsHoliday days.
+        if isinstance(start_date, str):
+            start_date = datetime.strptime(start_date, '%Y-%m-%d')
+        start = np.datetime64(start_date.date() if isinstance(start_date, datetime) else start_date, 'D')
+        dates = start + np.arange(days)
+        n_departments = len(departments)
+
+        def per_row(value, name):
+            value = np.asarray(value, dtype=np.float64)
+            if not (np.isfinite(value).all() and (value >= 0).all()):
+                raise ValueError(f'{name} must be finite and non-negative')
+            if value.ndim == 0:
+                return value
+            if value.shape != (days,):
+                raise ValueError(f'{name} must be a number or a list of {days} values')
+            return np.repeat(value, n_departments)
+
+        grid_dates = np.repeat(dates, n_departments)
+        return dates, cls.columns(
+            grid_dates.astype('datetime64[Y]').astype(np.int64) + 1970,
+            grid_dates.astype('datetime64[M]').astype(np.int64) % 12 + 1,
+            # 1970-01-01 was a Thursday (weekday 3)
+            (grid_dates.astype(np.int64) + 3) % 7,
+            np.tile(np.asarray(departments, dtype=object), days),
+            per_row(outpatient_visits, 'outpatientVisits'),
+            per_row(inpatient_admissions, 'inpatientAdmissions'),
+            per_row(avg_length_of_stay, 'avgLengthOfStay'),
+            0 if holidays is None else holidays.flags(grid_dates)
+        )
@@ -0,0 +1,406 @@
+# python/flat_trees.py
+from types import SimpleNamespace
+
+import numpy as np
+
+# Rows evaluated per traversal pass; keeps the (rows x trees) index arrays small
+CHUNK_SIZE = 4096
+
+# Past this many rows sklearn's compiled per-tree loop beats NumPy traversal, so
+# larger batches go back to the wrapped estimator (measured crossover ~250 rows)
+FLAT_MAX_ROWS = 256
+
+
+def use_fallback(model, X):
+    # Estimators loaded lazily from disk report usable=False once their file is replaced
+    return len(X) > FLAT_MAX_ROWS and getattr(model, 'usable', True)
+
+
+class FlatForest:
+    # Every tree of a fitted ensemble packed into one set of contiguous node arrays.
+    # Leaves point back at themselves, so a batch walks all trees at once for a
+    # fixed number of steps without per-tree Python work.
+
+    def __init__(self, trees, value_scale=1.0, dtype=np.float32):
+        # dtype: what inputs are cast to before comparing, as the source estimator does
+        self.dtype = dtype
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        self.n_trees = len(trees)
+        self.roots = offsets[:-1].astype(np.intp)
+        self.max_depth = max(tree.max_depth for tree in trees)
+
+        features, thresholds, left, right, values = [], [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            is_leaf = tree.children_left == -1
+            own = np.arange(tree.node_count) + offset
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            left.append(np.where(is_leaf, own, tree.children_left + offset))
+            right.append(np.where(is_leaf, own, tree.children_right + offset))
+            # value is (nodes, outputs, classes); classifiers store class fractions
+            value = tree.value[:, 0, :]
+            if value.shape[1] > 1:
+                value = value / value.sum(axis=1, keepdims=True)
+            values.append(value)
+
+        self.feature = np.ascontiguousarray(np.concatenate(features), dtype=np.intp)
+        self.threshold = np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64)
+        self.left = np.ascontiguousarray(np.concatenate(left), dtype=np.intp)
+        self.right = np.ascontiguousarray(np.concatenate(right), dtype=np.intp)
+        # children[2 * node + went_right] so one gather picks the next node
+        self.children = np.ascontiguousarray(np.stack([self.left, self.right], axis=1).ravel())
+        self.value = np.ascontiguousarray(np.concatenate(values) * value_scale, dtype=np.float64)
+
+    @classmethod
+    def from_arrays(cls, roots, feature, threshold, children, value, max_depth, dtype=np.float32):
+        # A forest from the arrays of an exported one (see artifacts.py); left / right are
+        # not kept, children holds both
+        forest = cls.__new__(cls)
+        forest.dtype = dtype
+        forest.roots, forest.feature, forest.threshold = roots, feature, threshold
+        forest.children, forest.value = children, value
+        forest.n_trees = len(roots)
+        forest.max_depth = max_depth
+        return forest
+
+    def leaves(self, X):
+        # sklearn trees compare float32 inputs against float64 thresholds; match that exactly
+        X = np.ascontiguousarray(X, dtype=self.dtype)
+        flat_X = X.ravel()
+        row_start = (np.arange(len(X)) * X.shape[1])[:, None]
+        nodes = np.repeat(self.roots[None, :], len(X), axis=0)
+        for _ in range(self.max_depth):
+            went_right = flat_X.take(row_start + self.feature.take(nodes)) > self.threshold.take(nodes)
+            nodes = self.children.take(2 * nodes + went_right)
+        return nodes
+
+    def sum(self, X):
+        # Per-row sum of leaf values over all trees, shape (rows, outputs)
+        out = np.empty((len(X), self.value.shape[1]))
+        for start in range(0, len(X), CHUNK_SIZE):
+            chunk = X[start:start + CHUNK_SIZE]
+            out[start:start + len(chunk)] = self.value[self.leaves(chunk)].sum(axis=1)
+        return out
+
+
+class CompiledGradientBoosting:
+
+    def __init__(self, model):
+        if model.init_ == 'zero':
+            self.baseline = 0.0
+        elif hasattr(model.init_, 'constant_'):
+            self.baseline = float(np.ravel(model.init_.constant_)[0])
+        else:
+            raise TypeError(f'cannot compile init estimator {model.init_!r}')
+        if model.estimators_.shape[1] != 1:
+            raise TypeError('only single-output gradient boosting regressors can be compiled')
+
+        self.model = model
+        self.forest = FlatForest([est.tree_ for est in model.estimators_[:, 0]], model.learning_rate)
+        self.n_features_in_ = model.n_features_in_
+        if hasattr(model, 'feature_names_in_'):
+            self.feature_names_in_ = model.feature_names_in_
+
+    def predict(self, X):
+        if use_fallback(self.model, X):
+            return self.model.predict(X)
+        return self.baseline + self.forest.sum(np.asarray(X))[:, 0]
+
+
+def hist_trees(model):
+    # The TreePredictors of a fitted HistGradientBoosting model, viewed with the Tree
+    # attributes FlatForest reads
+    trees = []
+    for predictors in model._predictors:
+        nodes = predictors[0].nodes
+        if nodes['is_categorical'].any():
+            raise TypeError('categorical splits cannot be compiled')
+        is_leaf = nodes['is_leaf'].astype(bool)
+        trees.append(SimpleNamespace(
+            node_count=len(nodes),
+            max_depth=int(nodes['depth'].max()),
+            children_left=np.where(is_leaf, -1, nodes['left'].astype(np.intp)),
+            children_right=np.where(is_leaf, -1, nodes['right'].astype(np.intp)),
+            feature=nodes['feature_idx'],
+            threshold=nodes['num_threshold'],
+            value=nodes['value'][:, None, None]
+        ))
+    return trees
+
+
+class CompiledHistGradientBoosting:
+    # Histogram boosting trees split on `x <= num_threshold` in float64 and already carry
+    # the learning rate in their leaf values. Missing values follow a per-node direction
+    # the flat arrays do not encode, so rows with NaN go to the wrapped estimator.
+
+    def __init__(self, model):
+        if type(model._loss.link).__name__ != 'IdentityLink' or model.n_trees_per_iteration_ != 1:
+            raise TypeError('only identity-link histogram boosting regressors can be compiled')
+        self.model = model
+        self.baseline = float(np.ravel(model._baseline_prediction)[0])
+        self.forest = FlatForest(hist_trees(model), 1.0, dtype=np.float64)
+        self.n_features_in_ = model.n_features_in_
+        if hasattr(model, 'feature_names_in_'):
+            self.feature_names_in_ = model.feature_names_in_
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if use_fallback(self.model, X) or np.isnan(X).any():
+            return self.model.predict(X)
+        return self.baseline + self.forest.sum(X)[:, 0]
+
+
+class CompiledForestRegressor:
+
+    def __init__(self, model):
+        self.model = model
+        self.forest = FlatForest([est.tree_ for est in model.estimators_], 1.0 / len(model.estimators_))
+        self.n_features_in_ = model.n_features_in_
+        if hasattr(model, 'feature_names_in_'):
+            self.feature_names_in_ = model.feature_names_in_
+
+    def predict(self, X):
+        if use_fallback(self.model, X):
+            return self.model.predict(X)
+        return self.forest.sum(np.asarray(X))[:, 0]
+
+
+class CompiledForestClassifier:
+
+    def __init__(self, model):
+        if getattr(model, 'n_outputs_', 1) != 1:
+            raise TypeError('only single-output forest classifiers can be compiled')
+        self.model = model
+        self.forest = FlatForest([est.tree_ for est in model.estimators_], 1.0 / len(model.estimators_))
+        self.classes_ = model.classes_
+        self.n_features_in_ = model.n_features_in_
+        if hasattr(model, 'feature_names_in_'):
+            self.feature_names_in_ = model.feature_names_in_
+
+    def predict_proba(self, X):
+        if use_fallback(self.model, X):
+            return self.model.predict_proba(X)
+        return self.forest.sum(np.asarray(X))
+
+    def predict(self, X):
+        return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+
+
+class CompiledPipeline:
+    # Runs the fitted preprocessing steps as-is and hands the result to the compiled ensemble
+
+    def __init__(self, pipeline, final):
+        self.preprocess = pipeline[:-1]
+        self.final = final
+        # Only the preprocessing steps; the fitted final estimator lives on as final.model
+        self.named_steps = self.preprocess.named_steps
+        if hasattr(pipeline, 'feature_names_in_'):
+            self.feature_names_in_ = pipeline.feature_names_in_
+
+    def transform(self, X):
+        Xt = self.preprocess.transform(X)
+        # OneHotEncoder output makes the ColumnTransformer sparse when density is low
+        return Xt.toarray() if hasattr(Xt, 'toarray') else Xt
+
+    def predict(self, X):
+        return self.final.predict(self.transform(X))
+
+    def predict_proba(self, X):
+        return self.final.predict_proba(self.transform(X))
+
+
+def tree_depths(forest):
+    # Depth of every tree of a FlatForest, one level of all trees at a time. Nodes are
+    # numbered per tree in ascending blocks starting at its root.
+    depth = np.zeros(len(forest.feature), dtype=np.intp)
+    level = np.asarray(forest.roots, dtype=np.intp)
+    d = 0
+    while len(level):
+        pairs = forest.children.take(np.stack([2 * level, 2 * level + 1], axis=1)).ravel()
+        # Leaves point back at themselves
+        level = pairs[pairs != np.repeat(level, 2)]
+        d += 1
+        depth[level] = d
+    tree_of_node = np.searchsorted(forest.roots, np.arange(len(depth)), side='right') - 1
+    depths = np.zeros(forest.n_trees, dtype=np.intp)
+    np.maximum.at(depths, tree_of_node, depth)
+    return depths
+
+
+class JointRegressors:
+    # Several compiled single-output regressors that read columns of one shared feature
+    # matrix, walked as one forest: a single traversal yields every model's prediction, so
+    # n models cost one predict's fixed overhead plus their trees. Trees are ordered
+    # deepest first and each step only advances the trees still descending, so shallow
+    # models are not walked to the depth of the deepest one. Anything that cannot be
+    # joined (pipelines, histogram boosting, mixed input dtypes) is predicted model by
+    # model on its columns of the same matrix.
+    JOINABLE = (CompiledGradientBoosting, CompiledForestRegressor)
+    # Rows x trees per traversal pass; the joint forest has several models' trees, and
+    # index arrays past the CPU caches cost more than the extra passes (~32 vs 200 rows)
+    CHUNK_CELLS = 32768
+    # Larger batches go model by model (each then picks flat arrays or sklearn itself); the
+    # joint walk's fixed-cost saving is gone by then (measured crossover ~150 rows, four models)
+    MAX_ROWS = 128
+
+    def __init__(self, models, columns):
+        # columns[k]: for each input feature of models[k], its column in the shared matrix
+        self.models = models
+        self.columns = [np.asarray(cols, dtype=np.intp) for cols in columns]
+        self.forest = None
+        if not (all(isinstance(model, self.JOINABLE) for model in models)
+                and len({np.dtype(model.forest.dtype) for model in models}) == 1):
+            return
+
+        forests = [model.forest for model in models]
+        offsets = np.cumsum([0] + [len(forest.feature) for forest in forests])
+        roots = np.concatenate([forest.roots + offset for forest, offset in zip(forests, offsets)])
+        depths = np.concatenate([tree_depths(forest) for forest in forests])
+        order = np.argsort(-depths, kind='stable')
+        self.forest = FlatForest.from_arrays(
+            roots[order],
+            # Leaves keep feature 0, which maps to some valid column; they never move anyway
+            np.concatenate([cols.take(forest.feature) for forest, cols in zip(forests, self.columns)]),
+            np.concatenate([forest.threshold for forest in forests]),
+            np.concatenate([forest.children + offset for forest, offset in zip(forests, offsets)]),
+            np.concatenate([forest.value[:, 0] for forest in forests]),
+            int(depths.max(initial=0)), forests[0].dtype)
+        # Trees still descending at each step (a prefix, deepest first)
+        self.descending = [int(np.sum(depths > step)) for step in range(self.forest.max_depth)]
+        # (trees, models) 0/1 matrix summing each model's leaf values
+        model_of_tree = np.repeat(np.arange(len(models)), [forest.n_trees for forest in forests])[order]
+        self.membership = np.zeros((len(order), len(models)))
+        self.membership[np.arange(len(order)), model_of_tree] = 1
+        self.baseline = np.array([getattr(model, 'baseline', 0.0) for model in models])
+
+    def leaves(self, X):
+        forest = self.forest
+        X = np.ascontiguousarray(X, dtype=forest.dtype)
+        flat_X = X.ravel()
+        row_start = (np.arange(len(X)) * X.shape[1])[:, None]
+        nodes = np.repeat(forest.roots[None, :], len(X), axis=0)
+        for n_trees in self.descending:
+            current = nodes[:, :n_trees]
+            went_right = flat_X.take(row_start + forest.feature.take(current)) > forest.threshold.take(current)
+            nodes[:, :n_trees] = forest.children.take(2 * current + went_right)
+        return nodes
+
+    def predict(self, X):
+        # (rows, models) predictions
+        X = np.asarray(X)
+        if self.forest is None or len(X) > self.MAX_ROWS:
+            return np.column_stack([model.predict(X[:, cols]) for model, cols in zip(self.models, self.columns)])
+        out = np.empty((len(X), self.membership.shape[1]))
+        chunk_size = max(1, self.CHUNK_CELLS // self.forest.n_trees)
+        for start in range(0, len(X), chunk_size):
+            chunk = X[start:start + chunk_size]
+            out[start:start + len(chunk)] = self.forest.value.take(self.leaves(chunk)) @ self.membership
+        return out + self.baseline
+
+
+def compile_model(model):
+    # Swap a fitted tree ensemble (optionally at the end of a Pipeline) for its flat evaluator
+    if hasattr(model, 'steps'):
+        return CompiledPipeline(model, compile_model(model.steps[-1][1]))
+
+    name = type(model).__name__
+    if name == 'GradientBoostingRegressor':
+        return CompiledGradientBoosting(model)
+    if name == 'HistGradientBoostingRegressor':
+        return CompiledHistGradientBoosting(model)
+    if name in ('RandomForestRegressor', 'ExtraTreesRegressor'):
+        return CompiledForestRegressor(model)
+    if name in ('RandomForestClassifier', 'ExtraTreesClassifier'):
+        return CompiledForestClassifier(model)
+    raise TypeError(f'cannot compile {name}')
+
+
+def check_parity(model, compiled, X, atol=1e-9):
+    # Largest absolute gap between compiled and sklearn predictions on X, checked in
+    # slices small enough that the flat evaluator (not the fallback) is exercised
+    expected = model.predict(X)
+    actual = np.concatenate([
+        compiled.predict(X[start:start + FLAT_MAX_ROWS]) for start in range(0, len(X), FLAT_MAX_ROWS)
+    ])
+    if expected.dtype.kind in 'fi':
+        gap = float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+        return gap, gap <= atol * max(1.0, float(np.max(np.abs(expected))))
+    mismatches = int(np.sum(expected != actual))
+    return mismatches, mismatches == 0
+
+
+if __name__ == '__main__':
+    # Parity check of every compiled model in models/ against sklearn on the training distributions
+    import os
+    import pickle
+    import sys
+    import warnings
+
+    import pandas as pd
+
+    from features import WaitingTimeEncoder
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+    BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    rng = np.random.default_rng(42)
+    n_samples = 5000
+
+    hour = rng.integers(0, 24, n_samples)
+    patient_type = rng.choice(['Emergency', 'Routine', 'Follow-up'], n_samples, p=[0.3, 0.5, 0.2])
+    service_time = np.select(
+        [patient_type == 'Emergency', patient_type == 'Follow-up'],
+        [rng.gamma(3, 5, n_samples), rng.gamma(2, 3, n_samples)],
+        rng.gamma(2.5, 4, n_samples)
+    )
+    flow_rows = list(zip(
+        hour, rng.integers(0, 7, n_samples), rng.integers(1, 13, n_samples),
+        rng.poisson(8, n_samples), service_time, patient_type,
+        rng.choice(['General', 'Cardiology', 'Orthopedics', 'Pediatrics', 'OB-GYN'], n_samples)
+    ))
+
+    date = pd.to_datetime('2019-01-01') + pd.to_timedelta(rng.integers(0, 41 * 30, n_samples), unit='D')
+    resources = pd.DataFrame({
+        'Month_sin': np.sin(2 * np.pi * date.month / 12),
+        'Month_cos': np.cos(2 * np.pi * date.month / 12),
+        'DayOfWeek_sin': np.sin(2 * np.pi * date.dayofweek / 7),
+        'DayOfWeek_cos': np.cos(2 * np.pi * date.dayofweek / 7),
+        'IsHoliday': rng.choice([0, 1], n_samples, p=[0.95, 0.05]),
+        'OutpatientVisits': rng.poisson(235, n_samples),
+        'InpatientAdmissions': rng.poisson(50, n_samples),
+        'StaffAvailable': rng.integers(10, 30, n_samples),
+        'AvgLengthOfStay': rng.gamma(2, 2, n_samples) + 2,
+        'Year': date.year,
+        'Department': rng.choice(['Emergency', 'Surgery', 'Internal Medicine', 'Pediatrics', 'Obstetrics'], n_samples)
+    })
+
+    appointments = pd.DataFrame({
+        'Age': rng.integers(18, 90, n_samples),
+        'Gender': rng.choice(['M', 'F'], n_samples),
+        'VisitType': rng.choice(['New', 'Follow-up'], n_samples),
+        'Urgency': rng.choice(['Low', 'Medium', 'High'], n_samples, p=[0.6, 0.3, 0.1]),
+        'Department': rng.choice(['Cardiology', 'Orthopedics', 'Neurology', 'General'], n_samples)
+    })
+
+    failed = False
+    for name in ['patient_flow_model', 'patient_flow_p10_model', 'patient_flow_p50_model', 'patient_flow_p90_model',
+                 'appointment_scheduling_model', 'resource_allocation_bed_model', 'resource_allocation_staff_model']:
+        path = os.path.join(BASE_DIR, 'models', f'{name}.pkl')
+        if not os.path.exists(path):
+            print(f'{name}: skipped, {path} not found')
+            continue
+        with open(path, 'rb') as f:
+            model = pickle.load(f)
+
+        if name.startswith('patient_flow'):
+            X = WaitingTimeEncoder(getattr(model, 'feature_names_in_', None)).encode(flow_rows)
+        elif name == 'appointment_scheduling_model':
+            X = appointments
+        else:
+            X = resources
+
+        gap, ok = check_parity(model, compile_model(model), X)
+        failed = failed or not ok
+        print(f"{name}: {'ok' if ok else 'MISMATCH'} ({gap})")
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,243 @@
+# python/lookup.py
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+
+from features import WaitingTimeEncoder, PATIENT_TYPES, DEPARTMENTS
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+
+TABLE_FILE = "patient_flow_lookup.npy"
+META_FILE = "patient_flow_lookup.json"
+
+# Rows sent to the model per predict call while filling the table
+BUILD_CHUNK = 500_000
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def feature_thresholds(model, feature):
+    # Every split threshold a fitted tree ensemble uses on one input column, in input units.
+    # Handles bare (hist) gradient boosting / forests and Pipeline(StandardScaler, ensemble);
+    # None for anything else.
+    scale, offset = 1.0, 0.0
+    names = list(getattr(model, 'feature_names_in_', []))
+    if hasattr(model, 'steps'):
+        if len(model.steps) != 2 or type(model.steps[0][1]).__name__ != 'StandardScaler':
+            return None
+        scaler, model = model.steps[0][1], model.steps[1][1]
+        if feature not in names:
+            return None
+        i = names.index(feature)
+        scale, offset = scaler.scale_[i], scaler.mean_[i]
+    if feature not in names:
+        return None
+    i = names.index(feature)
+    if hasattr(model, '_predictors'):
+        # HistGradientBoosting: one TreePredictor per iteration, splits on num_threshold
+        nodes = [predictors[0].nodes for predictors in model._predictors]
+        splits = [n['num_threshold'][(n['feature_idx'] == i) & (n['is_leaf'] == 0)] for n in nodes]
+    elif hasattr(model, 'estimators_'):
+        trees = [est.tree_ for est in np.ravel(model.estimators_)]
+        splits = [tree.threshold[tree.feature == i] for tree in trees]
+    else:
+        return None
+    return np.unique(np.concatenate(splits)) * scale + offset
+
+
+class WaitingTimeLookup:
+    # patient_flow_model evaluated ahead of time over hour x dayOfWeek x month x
+    # patientType x department x queueLength 0..N x a serviceTime grid, for non-holidays.
+    # Lookups index the memory-mapped cube and interpolate linearly in serviceTime;
+    # anything off the grid is reported as unanswered so the caller runs the model.
+    # When N (or the last serviceTime point) lies past the model's last split on that
+    # column, the model is flat beyond it and larger inputs are clamped instead.
+
+    def __init__(self, table, meta):
+        self.table = table
+        self.meta = meta
+        self.max_queue = meta['maxQueue']
+        self.service_grid = np.asarray(meta['serviceGrid'], dtype=np.float64)
+        self.patient_types = {pt: i for i, pt in enumerate(meta['patientTypes'])}
+        self.departments = {dept: i for i, dept in enumerate(meta['departments'])}
+        self.clamp_queue = meta.get('clampQueue', False)
+        self.clamp_service = meta.get('clampService', False)
+
+    @classmethod
+    def load(cls, model_path, models_dir=MODELS_DIR):
+        # None when no table was built or it was built from a different model file
+        meta_path = os.path.join(models_dir, META_FILE)
+        table_path = os.path.join(models_dir, TABLE_FILE)
+        if not (os.path.exists(meta_path) and os.path.exists(table_path)):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('modelSha256') != file_sha256(model_path):
+            return None
+        return cls(np.load(table_path, mmap_mode='r'), meta)
+
+    def predict(self, rows):
+        # (values, answered) for parsed waiting-time rows; values are NaN where not answered
+        numeric = np.array([row[:5] for row in rows], dtype=np.float64)
+        patient_type = np.array([self.patient_types.get(row[5], -1) for row in rows])
+        department = np.array([self.departments.get(row[6], -1) for row in rows])
+        hour, day_of_week, month, queue, service = numeric.T
+        if self.clamp_queue:
+            queue = np.where(queue == np.round(queue), np.minimum(queue, self.max_queue), queue)
+        if self.clamp_service:
+            service = np.minimum(service, self.service_grid[-1])
+
+        integral = np.all(numeric[:, :4] == np.round(numeric[:, :4]), axis=1)
+        # The table holds non-holidays only; rows flagged IsHoliday go to the model
+        holiday = np.array([len(row) > 7 and row[7] == 1 for row in rows], dtype=bool)
+        answered = (
+            integral & ~holiday
+            & (hour >= 0) & (hour <= 23) & (day_of_week >= 0) & (day_of_week <= 6)
+            & (month >= 1) & (month <= 12) & (queue >= 0) & (queue <= self.max_queue)
+            & (service >= self.service_grid[0]) & (service <= self.service_grid[-1])
+            & (patient_type >= 0) & (department >= 0)
+        )
+
+        values = np.full(len(rows), np.nan)
+        hit = np.flatnonzero(answered)
+        if len(hit):
+            s = service[hit]
+            lo = np.clip(np.searchsorted(self.service_grid, s, side='right') - 1, 0, len(self.service_grid) - 2)
+            frac = (s - self.service_grid[lo]) / (self.service_grid[lo + 1] - self.service_grid[lo])
+            index = (
+                hour[hit].astype(np.intp), day_of_week[hit].astype(np.intp), month[hit].astype(np.intp) - 1,
+                patient_type[hit], department[hit], queue[hit].astype(np.intp)
+            )
+            low, high = self.table[index + (lo,)], self.table[index + (lo + 1,)]
+            values[hit] = low + (high - low) * frac
+        return values, answered
+
+
+def grid_rows(encoder, hour, max_queue, service_grid):
+    # Encoded feature matrix for every grid point of one hour, in table order
+    day_of_week, month, patient_type, department, queue, service = (a.ravel() for a in np.meshgrid(
+        np.arange(7), np.arange(1, 13), np.arange(len(PATIENT_TYPES)), np.arange(len(DEPARTMENTS)),
+        np.arange(max_queue + 1), service_grid, indexing='ij'
+    ))
+    numeric = np.column_stack([np.full(len(queue), hour), day_of_week, month, queue, service]).astype(np.float64)
+    return encoder.encode_arrays(
+        numeric, np.array(PATIENT_TYPES, dtype=object)[patient_type], np.array(DEPARTMENTS, dtype=object)[department]
+    )
+
+
+def build(model_path, max_queue=None, service_max=None, service_step=1.0, models_dir=MODELS_DIR,
+          n_check=20000, seed=42):
+    # max_queue / service_max default to just past the model's last split on that column
+    with open(model_path, "rb") as f:
+        model = pickle.load(f)
+    encoder = WaitingTimeEncoder(getattr(model, 'feature_names_in_', None))
+
+    queue_splits = feature_thresholds(model, 'QueueLength')
+    service_splits = feature_thresholds(model, 'ServiceTime')
+    if max_queue is None:
+        max_queue = int(np.floor(queue_splits.max())) + 1 if queue_splits is not None and len(queue_splits) else 40
+    if service_max is None:
+        service_max = (np.ceil(service_splits.max() / service_step) * service_step
+                       if service_splits is not None and len(service_splits) else 60.0)
+    service_grid = np.arange(0, service_max + service_step / 2, service_step)
+
+    shape = (24, 7, 12, len(PATIENT_TYPES), len(DEPARTMENTS), max_queue + 1, len(service_grid))
+    table_path = os.path.join(models_dir, TABLE_FILE)
+    table = np.lib.format.open_memmap(table_path, mode='w+', dtype=np.float32, shape=shape)
+
+    started = time.perf_counter()
+    for hour in range(24):
+        X = grid_rows(encoder, hour, max_queue, service_grid)
+        out = np.empty(len(X))
+        for start in range(0, len(X), BUILD_CHUNK):
+            out[start:start + BUILD_CHUNK] = model.predict(X[start:start + BUILD_CHUNK])
+        table[hour] = out.reshape(shape[1:])
+    table.flush()
+    build_seconds = time.perf_counter() - started
+
+    meta = {
+        'modelSha256': file_sha256(model_path),
+        'maxQueue': max_queue,
+        'serviceGrid': service_grid.tolist(),
+        'patientTypes': PATIENT_TYPES,
+        'departments': DEPARTMENTS,
+        'clampQueue': bool(queue_splits is not None and max_queue > queue_splits.max()),
+        'clampService': bool(service_splits is not None and service_grid[-1] > service_splits.max()),
+        'shape': list(shape),
+        'buildSeconds': round(build_seconds, 1)
+    }
+    lookup = WaitingTimeLookup(np.load(table_path, mmap_mode='r'), meta)
+    meta['error'] = measure_error(model, encoder, lookup, n_check, seed)
+
+    with open(os.path.join(models_dir, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def measure_error(model, encoder, lookup, n_samples, seed):
+    # Off-grid serviceTimes drawn like PatientFlowPrediction.py, table vs live model
+    rng = np.random.default_rng(seed)
+    patient_type = rng.choice(PATIENT_TYPES, n_samples, p=[0.3, 0.5, 0.2])
+    service = np.select(
+        [patient_type == 'Emergency', patient_type == 'Follow-up'],
+        [rng.gamma(3, 5, n_samples), rng.gamma(2, 3, n_samples)],
+        rng.gamma(2.5, 4, n_samples)
+    )
+    rows = list(zip(
+        rng.integers(0, 24, n_samples).astype(float), rng.integers(0, 7, n_samples).astype(float),
+        rng.integers(1, 13, n_samples).astype(float),
+        rng.poisson(8, n_samples).astype(float), service, patient_type, rng.choice(DEPARTMENTS, n_samples)
+    ))
+    live = model.predict(encoder.encode(rows))
+    values, answered = lookup.predict(rows)
+    gap = np.abs(values - live)[answered]
+
+    # The API rounds serviceTime before predicting, so requests usually land on grid points
+    step = lookup.service_grid[1] - lookup.service_grid[0]
+    on_grid = [row[:4] + (round(row[4] / step) * step,) + row[5:] for row in rows]
+    grid_values, grid_answered = lookup.predict(on_grid)
+    grid_gap = np.abs(grid_values - model.predict(encoder.encode(on_grid)))[grid_answered]
+
+    return {
+        'checked': n_samples,
+        'samples': int(answered.sum()),
+        'maxAbs': float(gap.max()),
+        'meanAbs': float(gap.mean()),
+        'p99Abs': float(np.percentile(gap, 99)),
+        'onGridMaxAbs': float(grid_gap.max())
+    }
+
+
+if __name__ == '__main__':
+    import warnings
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+    parser = argparse.ArgumentParser(description='Precompute the waiting-time lookup table next to the models')
+    parser.add_argument('--model', default=os.path.join(MODELS_DIR, 'patient_flow_model.pkl'))
+    parser.add_argument('--max-queue', type=int, default=None,
+                        help='largest queueLength in the table (default: past the model\'s last split)')
+    parser.add_argument('--service-max', type=float, default=None,
+                        help='largest serviceTime in the table (default: past the model\'s last split)')
+    parser.add_argument('--service-step', type=float, default=1.0)
+    args = parser.parse_args()
+
+    meta = build(args.model, args.max_queue, args.service_max, args.service_step)
+    print(f"Lookup table {meta['shape']} built in {meta['buildSeconds']}s")
+    print(f"Answered {meta['error']['samples']} of {meta['error']['checked']} sampled requests from the table")
+    print(f"Error vs live model over {meta['error']['samples']} samples: "
+          f"max {meta['error']['maxAbs']:.3f}, mean {meta['error']['meanAbs']:.3f}, "
+          f"p99 {meta['error']['p99Abs']:.3f} minutes")
+    print(f"Error at grid-aligned serviceTimes: max {meta['error']['onGridMaxAbs']:.2e} minutes")
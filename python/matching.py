@@ -0,0 +1,72 @@
+# python/matching.py
+# Batch doctor-patient matching for a clinic session. Every patient carries a weight (the
+# priority score) and an expected consultation length; the goal is the smallest total
+# weighted wait. Patients are taken in weighted-shortest-processing-time order (weight per
+# expected minute, highest first: Smith's rule, optimal for a single doctor) and each goes
+# to whichever doctor of their specialty frees up first, found with a heap per specialty.
+# Patients whose department no doctor covers go to the first free doctor of any specialty.
+# The loop is O(n log d) for n patients and d doctors.
+import heapq
+
+import numpy as np
+
+# Mean consultation minutes per predicted service category in the training data
+# (ServiceTime binned at 10 and 20 minutes; see temp_py_models/synthesis.py)
+SERVICE_MINUTES = {'Short': 6.4, 'Medium': 15.0, 'Long': 34.1}
+
+
+def expected_minutes(probabilities, classes, class_minutes=SERVICE_MINUTES):
+    # Expected consultation length of each row of class probabilities
+    minutes = np.array([class_minutes[str(c)] for c in classes], dtype=np.float64)
+    return probabilities @ minutes
+
+
+def _first_free(heap, free_at):
+    # Drop entries left behind by earlier assignments; the top is then the earliest free doctor
+    while heap[0][0] != free_at[heap[0][1]]:
+        heapq.heappop(heap)
+    return heap[0]
+
+
+def assign(departments, weights, durations, specialties, available_from=None, session_minutes=None):
+    # departments: each patient's department; weights / durations: per patient.
+    # specialties / available_from: per doctor (minutes from the session start, default 0).
+    # Returns per patient the doctor index (-1 if the session is full), the start minute
+    # (NaN if unassigned) and whether the doctor has the patient's specialty.
+    weights = np.asarray(weights, dtype=np.float64)
+    durations = np.asarray(durations, dtype=np.float64)
+    n_patients, n_doctors = len(weights), len(specialties)
+    free_at = [0.0] * n_doctors if available_from is None else [float(t) for t in available_from]
+
+    by_specialty = {}
+    for j, specialty in enumerate(specialties):
+        by_specialty.setdefault(specialty, []).append((free_at[j], j))
+    everyone = [(free_at[j], j) for j in range(n_doctors)]
+    for heap in by_specialty.values():
+        heapq.heapify(heap)
+    heapq.heapify(everyone)
+
+    # Highest weight per minute first; ties go to the heavier patient, then input order
+    order = np.lexsort((np.arange(n_patients), -weights, -(weights / durations)))
+
+    doctor = np.full(n_patients, -1, dtype=np.int64)
+    start = np.full(n_patients, np.nan)
+    matched = np.zeros(n_patients, dtype=bool)
+    if n_doctors == 0:
+        return doctor, start, matched
+
+    horizon = float('inf') if session_minutes is None else session_minutes
+    for i in order.tolist():
+        own = by_specialty.get(departments[i])
+        heap = own if own is not None else everyone
+        t, j = _first_free(heap, free_at)
+        if t >= horizon:
+            continue
+        doctor[i], start[i], matched[i] = j, t, own is not None
+        free_at[j] = t + durations[i]
+        # The doctor's fresh entry replaces the top of the heap used; its entry in the other
+        # heap is now stale and skipped when it surfaces
+        heapq.heapreplace(heap, (free_at[j], j))
+        other = everyone if own is not None else by_specialty[specialties[j]]
+        heapq.heappush(other, (free_at[j], j))
+    return doctor, start, matched
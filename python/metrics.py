@@ -0,0 +1,239 @@
+# python/metrics.py
+# In-process metrics in the Prometheus text exposition format, cheap enough to leave on:
+# recording is a dict update (plus a bisect for histograms) under a per-metric lock.
+# Each serve.py worker keeps its own counters, so scrape workers individually or sum
+# over them; a scrape through the shared port sees whichever worker answers.
+from bisect import bisect_left
+from collections import Counter as Tally, deque
+import os
+import sys
+import threading
+import time
+
+# Seconds; spans a cached lookup up to a slow batch
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Rows per request or per predict call
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f'{self.name}{_labels(self.labels, key)} {_number(value)}' for key, value in values]
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f'{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, key)} {cumulative}')
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'label_values', 'started')
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+class Collected:
+    # Values read from `collect()` at scrape time (a dict of label values -> number), for
+    # state that is already tracked elsewhere, such as the prediction caches' hit counts
+
+    def __init__(self, name, documentation, labels, collect, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines += [f'{self.name}{_labels(self.labels, key)} {_number(value)}'
+                  for key, value in sorted(self.collect().items())]
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def collected(self, name, documentation, labels, collect, kind='gauge'):
+        return self._add(Collected(name, documentation, labels, collect, kind))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+class StageTimer:
+    # Splits one request's wall time into consecutive named stages: mark(stage) charges the
+    # time since the previous mark (or the start) to `stage`
+
+    __slots__ = ('started', 'last', 'stages')
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.stages = []
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+
+
+class SlowRequestProfiler:
+    # Sampling profiler for slow requests. While requests are in flight a background thread
+    # samples their threads' Python stacks every `interval` seconds; when a request ends
+    # after more than `threshold` seconds its samples are summarized (as collapsed stacks,
+    # most frequent first) and handed to on_slow. Faster requests just drop theirs.
+    # Work handed to the inference pool shows up as the request waiting on its future.
+
+    def __init__(self, threshold, interval=0.005, keep=50, depth=40, on_slow=None):
+        self.threshold = threshold
+        self.interval = interval
+        self.depth = depth
+        self.on_slow = on_slow
+        self.profiles = deque(maxlen=keep)
+        self._active = {}
+        self._busy = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _start(self):
+        # Like the micro-batcher, the sampler thread is started per process, after any fork
+        with self._lock:
+            if self._pid != os.getpid():
+                self._active = {}
+                threading.Thread(target=self._sample, name='slow-request-profiler', daemon=True).start()
+                self._pid = os.getpid()
+
+    def begin(self):
+        if self._pid != os.getpid():
+            self._start()
+        with self._lock:
+            self._active[threading.get_ident()] = Tally()
+            self._busy.set()
+
+    def end(self, duration, description):
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+            if not self._active:
+                self._busy.clear()
+        if samples is None or duration < self.threshold:
+            return None
+
+        profile = {
+            'request': description,
+            'durationMs': round(duration * 1e3, 2),
+            'samples': sum(samples.values()),
+            'intervalMs': self.interval * 1e3,
+            'stacks': [{'stack': stack, 'samples': count} for stack, count in samples.most_common(20)]
+        }
+        self.profiles.append(profile)
+        if self.on_slow is not None:
+            self.on_slow(profile)
+        return profile
+
+    def _stack(self, frame):
+        names = []
+        while frame is not None and len(names) < self.depth:
+            code = frame.f_code
+            names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _sample(self):
+        while True:
+            self._busy.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[self._stack(frame)] += 1
@@ -0,0 +1,534 @@
+# python/model_server.py
+# Multi-process inference: one process per core runs the tree ensembles, while the serving
+# process keeps parsing and encoding requests. Encoded feature blocks travel through
+# multiprocessing.shared_memory instead of being pickled: each worker owns a few
+# input/output buffer slots, a block is copied into a free slot, and only
+# (slot, model, rows, columns) goes down the worker's pipe. Batches are cut into blocks of
+# at most the flat evaluator's crossover size (flat_trees.FLAT_MAX_ROWS), and blocks go
+# to the workers round-robin, so one large batch is spread over every core.
+#
+# Models are shared the same way. The first predict of a model version packs its flat tree
+# arrays into one shared-memory block that every worker maps read-only, so N workers hold
+# one copy. Workers are spawned and import nothing but NumPy and the flat evaluators:
+# no Flask app, no encoders, no pickles. The two newest versions of each model stay
+# published, and an older one is dropped only once no predict is using it. Spawning
+# re-imports the serving entry point's main module, so it must be import-safe (serve.py is).
+#   python python/model_server.py --max-workers 4     throughput from 1 to 4 workers
+import atexit
+from concurrent.futures import Future, wait
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from artifacts import ESTIMATORS, FOREST_ARRAYS, build_estimator, describe_estimator
+from flat_trees import FLAT_MAX_ROWS, FlatForest, JointRegressors
+
+# Input / output buffer slots per worker, and the bytes of each buffer
+SLOTS_PER_WORKER = 4
+SLOT_BYTES = 1 << 20
+# Shared-memory arrays start on cache-line boundaries
+ALIGNMENT = 64
+# A dead inference process is replaced after RESTART_DELAY seconds, doubled for each death
+# within RESTART_WINDOW seconds; one that dies more than MAX_RESTARTS times in the window
+# (say, on loading a corrupt model) stays down and the others take its blocks
+RESTART_DELAY = 0.1
+RESTART_WINDOW = 60
+MAX_RESTARTS = 5
+
+
+def pack(arrays):
+    # One shared-memory block holding every array; returns (block, {name: (offset, dtype, shape)})
+    layout, size = {}, 0
+    for name, array in arrays.items():
+        size = -(-size // ALIGNMENT) * ALIGNMENT
+        layout[name] = (size, array.dtype.str, array.shape)
+        size += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for name, array in arrays.items():
+        offset, dtype, shape = layout[name]
+        np.ndarray(shape, dtype, buffer=block.buf, offset=offset)[...] = array
+    return block, layout
+
+
+def unpack(block, layout):
+    views = {}
+    for name, (offset, dtype, shape) in layout.items():
+        view = np.ndarray(shape, dtype, buffer=block.buf, offset=offset)
+        view.flags.writeable = False
+        views[name] = view
+    return views
+
+
+def forest_arrays(forest):
+    # intp like the in-process forest, so both index the same way
+    return {name: np.ascontiguousarray(getattr(forest, name)) for name in FOREST_ARRAYS}
+
+
+def serves(model):
+    # Whether the workers can run this (final) estimator: a flat tree evaluator
+    if isinstance(model, JointRegressors):
+        return model.forest is not None
+    return isinstance(model, tuple(ESTIMATORS.values()))
+
+
+def final_step(model, X):
+    # (final estimator, its input) of a compiled pipeline, or of a bare estimator
+    if hasattr(model, 'final'):
+        return model.final, model.transform(X)
+    return model, X
+
+
+def describe(model):
+    # (constants, arrays) a worker rebuilds the evaluator from
+    if isinstance(model, JointRegressors):
+        forest = model.forest
+        arrays = dict(forest_arrays(forest), membership=model.membership, baseline=model.baseline,
+                      descending=np.asarray(model.descending, dtype=np.intp))
+        return {'class': 'JointRegressors', 'max_depth': forest.max_depth,
+                'input_dtype': np.dtype(forest.dtype).name}, arrays
+    return describe_estimator(model), forest_arrays(model.forest)
+
+
+def rebuild(spec, arrays):
+    if spec['class'] != 'JointRegressors':
+        # No sklearn fallback: blocks never exceed the flat evaluator's crossover
+        return build_estimator(spec, arrays)
+    joint = JointRegressors.__new__(JointRegressors)
+    joint.forest = FlatForest.from_arrays(arrays['roots'], arrays['feature'], arrays['threshold'],
+                                          arrays['children'], arrays['value'], spec['max_depth'],
+                                          np.dtype(spec['input_dtype']))
+    joint.membership, joint.baseline = arrays['membership'], arrays['baseline']
+    joint.descending = arrays['descending'].tolist()
+    joint.models, joint.columns = [], []
+    return joint
+
+
+def block_rows(model):
+    return JointRegressors.MAX_ROWS if isinstance(model, JointRegressors) else FLAT_MAX_ROWS
+
+
+def run_block(models, slots, slot, key, method, n_rows, n_columns):
+    # Predict one block from its input slot into its output slot; returns the output shape
+    inputs, outputs = slots[slot]
+    X = np.ndarray((n_rows, n_columns), np.float64, buffer=inputs.buf)
+    result = np.ascontiguousarray(getattr(models[key][0], method)(X), dtype=np.float64)
+    if result.nbytes > outputs.size:
+        raise ValueError(f'{result.nbytes} output bytes do not fit a {outputs.size}-byte slot')
+    np.ndarray(result.shape, np.float64, buffer=outputs.buf)[...] = result
+    return result.shape
+
+
+def worker_main(conn, slot_names):
+    # One inference process: serves ('predict', slot, key, method, rows, columns) messages
+    # until ('stop',)
+    # Spawned workers share the serving process's resource tracker, which unlinks every
+    # block once the serving process is gone, even if it dies without cleaning up
+    slots = [(shared_memory.SharedMemory(name=inputs), shared_memory.SharedMemory(name=outputs))
+             for inputs, outputs in slot_names]
+    # A fresh process's allocator maps and unmaps the tree walk's large temporaries on every
+    # predict (twice the walk's cost, measured); freeing one large block first lets glibc
+    # raise its mmap threshold and keep them on the heap, as a long-lived process does
+    np.ones(4 * SLOT_BYTES, np.uint8)
+    models = {}
+    failed = {}  # key -> why its model could not be loaded, answered to each of its predicts
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            # The serving process is gone
+            break
+        kind = message[0]
+        if kind == 'predict':
+            if message[2] in failed:
+                conn.send(('error', message[1], failed[message[2]]))
+                continue
+            try:
+                conn.send(('done', message[1], run_block(models, slots, *message[1:])))
+            except Exception as e:
+                conn.send(('error', message[1], f'{type(e).__name__}: {e}'))
+        elif kind == 'load':
+            _, key, spec, name, layout = message
+            try:
+                block = shared_memory.SharedMemory(name=name)
+                models[key] = (rebuild(spec, unpack(block, layout)), block)
+            except Exception as e:
+                failed[key] = f'cannot load {key[0]} {key[1]}: {type(e).__name__}: {e}'
+        elif kind == 'drop':
+            _, key, name = message
+            failed.pop(key, None)
+            model, block = models.pop(key, (None, None))
+            # The evaluator's views must go before the block can be unmapped
+            del model
+            if block is not None:
+                block.close()
+            conn.send(('dropped', name))
+        else:
+            break
+
+
+class Worker:
+    # The serving process's end of one inference process. The buffer slots outlive the
+    # process: a replacement for a dead one is handed the same slots.
+
+    def __init__(self, context, index):
+        self.index = index
+        self.slots = []
+        for _ in range(SLOTS_PER_WORKER):
+            self.slots.append((shared_memory.SharedMemory(create=True, size=SLOT_BYTES),
+                               shared_memory.SharedMemory(create=True, size=SLOT_BYTES)))
+        self.free = queue.SimpleQueue()
+        for slot in range(SLOTS_PER_WORKER):
+            self.free.put(slot)
+        self.pending = {}
+        self.send_lock = threading.Lock()
+        self.deaths = []  # time.monotonic() of recent exits
+        self.spawn(context)
+
+    def spawn(self, context):
+        # Start the process; the caller holds send_lock or nobody else can send yet
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=worker_main, args=(child, [(i.name, o.name) for i, o in self.slots]),
+            name=f'inference-{self.index}', daemon=True)
+        self.process.start()
+        child.close()
+        self.alive = True
+
+    def send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+
+    def close(self):
+        for inputs, outputs in self.slots:
+            inputs.close()
+            inputs.unlink()
+            outputs.close()
+            outputs.unlink()
+
+
+class ModelServer:
+    # Dispatcher over `workers` inference processes (started on first use, once per
+    # serving process). predict() is thread-safe and blocks until every block is back.
+    # An inference process that dies fails the blocks it held and is replaced.
+
+    def __init__(self, workers):
+        self.n_workers = workers if workers > 0 else os.cpu_count() or 1
+        self._workers = None
+        self._context = None
+        self._pid = None
+        self._closing = False
+        self._lock = threading.Lock()
+        self._published = {}  # key -> (block, spec, layout)
+        self._users = {}  # key -> predicts in flight
+        self._versions = {}  # model name -> published keys, oldest first
+        self._dropping = {}  # block name -> [block, indexes of the workers yet to release it]
+        self._next = itertools.count()
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._context = multiprocessing.get_context('spawn')
+            self._workers = [Worker(self._context, i) for i in range(self.n_workers)]
+            self._published, self._users, self._versions, self._dropping = {}, {}, {}, {}
+            self._closing = False
+            for worker in self._workers:
+                self._start_receiver(worker)
+            self._pid = os.getpid()
+            atexit.register(self.close)
+
+    def _start_receiver(self, worker):
+        threading.Thread(target=self._receive, args=(worker, worker.conn), name='model-server-receiver',
+                         daemon=True).start()
+
+    def _receive(self, worker, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                self._exited(worker)
+                return
+            kind = message[0]
+            if kind == 'dropped':
+                with self._lock:
+                    self._released(message[1], worker.index)
+                continue
+            slot = message[1]
+            future = worker.pending.pop(slot)
+            if kind == 'done':
+                # Copied out before the slot is reused, so no caller holds a slot while waiting
+                shape = message[2]
+                result = np.ndarray(shape, np.float64, buffer=worker.slots[slot][1].buf).copy()
+                worker.free.put(slot)
+                future.set_result(result)
+            else:
+                worker.free.put(slot)
+                future.set_exception(RuntimeError(message[2]))
+
+    def _exited(self, worker):
+        # Fail the blocks the process held, give their slots back, and (with backoff, up to
+        # MAX_RESTARTS) start a replacement that loads every published model before
+        # anything else reaches it
+        worker.process.join(timeout=1)
+        error = RuntimeError(f'inference process {worker.process.name} exited '
+                             f'(exit code {worker.process.exitcode})')
+        with self._lock, worker.send_lock:
+            worker.alive = False
+            worker.conn.close()
+            pending, worker.pending = worker.pending, {}
+            for slot in pending:
+                worker.free.put(slot)
+            for name in list(self._dropping):
+                self._released(name, worker.index)
+        for future in pending.values():
+            future.set_exception(error)
+        now = time.monotonic()
+        worker.deaths = [t for t in worker.deaths if now - t < RESTART_WINDOW] + [now]
+        if len(worker.deaths) > MAX_RESTARTS:
+            return
+        time.sleep(RESTART_DELAY * 2 ** (len(worker.deaths) - 1))
+        with self._lock, worker.send_lock:
+            if self._closing:
+                return
+            worker.spawn(self._context)
+            for key, (block, spec, layout) in self._published.items():
+                worker.conn.send(('load', key, spec, block.name, layout))
+            self._start_receiver(worker)
+
+    def _broadcast(self, message):
+        # Returns the indexes of the workers it reached
+        reached = set()
+        for worker in self._workers:
+            try:
+                worker.send(message)
+                reached.add(worker.index)
+            except OSError:
+                # A dead process; its replacement is sent the published models instead
+                pass
+        return reached
+
+    def _acquire(self, key, model):
+        # key: (model name, version); publishes it to every worker on first use and counts
+        # the predict as one of its users, so the version is not dropped under it
+        with self._lock:
+            if key not in self._published:
+                spec, arrays = describe(model)
+                block, layout = pack(arrays)
+                self._published[key] = (block, spec, layout)
+                # Sent before any block of this key on every pipe, so workers load it first
+                self._broadcast(('load', key, spec, block.name, layout))
+                self._versions.setdefault(key[0], []).append(key)
+            self._users[key] = self._users.get(key, 0) + 1
+            self._collect(key[0])
+
+    def _release(self, key):
+        with self._lock:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+            self._collect(key[0])
+
+    def _collect(self, name):
+        # Drop the versions older than the two newest that no predict is using
+        versions = self._versions[name]
+        for stale in versions[:-2]:
+            if stale in self._users:
+                continue
+            versions.remove(stale)
+            block = self._published.pop(stale)[0]
+            self._dropping[block.name] = [block, self._broadcast(('drop', stale, block.name))]
+            self._released(block.name, None)
+
+    def _released(self, name, index):
+        # Worker `index` released a dropped block; the last one to do so frees its memory
+        entry = self._dropping.get(name)
+        if entry is None:
+            return
+        entry[1].discard(index)
+        if not entry[1]:
+            del self._dropping[name]
+            entry[0].close()
+            entry[0].unlink()
+
+    def _submit(self, key, method, X):
+        workers = [worker for worker in self._workers if worker.alive]
+        if not workers:
+            raise RuntimeError('every inference process has exited')
+        worker = workers[next(self._next) % len(workers)]
+        # Slots always come back: with the result, the error, or when the process dies
+        slot = worker.free.get()
+        inputs, outputs = worker.slots[slot]
+        np.ndarray(X.shape, np.float64, buffer=inputs.buf)[...] = X
+        future = Future()
+        with worker.send_lock:
+            worker.pending[slot] = future
+            try:
+                worker.conn.send(('predict', slot, key, method, X.shape[0], X.shape[1]))
+            except OSError:
+                # The process is gone; its receiver fails its blocks and replaces it
+                worker.pending.pop(slot, None)
+                worker.free.put(slot)
+                raise RuntimeError(f'inference process {worker.process.name} exited') from None
+        return future
+
+    def predict(self, key, model, X, method='predict'):
+        # model.<method>(X) for a flat evaluator (see serves()) and a numeric method
+        # (predict, or predict_proba of classifiers), computed by the workers
+        if self._pid != os.getpid():
+            self.start()
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        if not len(X):
+            return getattr(model, method)(X)
+        self._acquire(key, model)
+        futures = []
+        try:
+            rows = max(1, min(block_rows(model), SLOT_BYTES // (8 * max(X.shape[1], 1))))
+            for start in range(0, len(X), rows):
+                futures.append(self._submit(key, method, X[start:start + rows]))
+            return np.concatenate([future.result() for future in futures])
+        finally:
+            # Blocks still in flight keep their version loaded
+            wait(futures)
+            self._release(key)
+
+    def close(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._closing = True
+            self._broadcast(('stop',))
+            for worker in self._workers:
+                worker.process.join(timeout=5)
+                worker.close()
+            blocks = [block for block, _, _ in self._published.values()]
+            for block in blocks + [entry[0] for entry in self._dropping.values()]:
+                block.close()
+                block.unlink()
+            self._published, self._users, self._dropping = {}, {}, {}
+            self._pid = None
+
+
+def benchmark_jobs(app, endpoint, records, batch_size):
+    # [(model name, final estimator, encoded block, method)] per batch, encoded the way the
+    # endpoint's batch route does it, so the timed part is the model call alone
+    import pandas as pd
+
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+    if endpoint in ('waitingtime', 'waitingintervals'):
+        flow = app.registry.get('patient_flow')
+        jobs = []
+        for batch in batches:
+            rows = [app.parse_waiting_time(flow, record) for record in batch]
+            if endpoint == 'waitingtime':
+                jobs.append([('patient_flow', *final_step(flow.model, flow.encoder.encode(rows)), 'predict')])
+            else:
+                jobs.append([('patient_flow_intervals', flow.intervals.models,
+                              flow.intervals.encoder.encode(rows), 'predict')])
+        return jobs
+    if endpoint == 'appointment':
+        scheduling = app.registry.get('appointment_scheduling')
+        return [[('appointment_scheduling',
+                  *final_step(scheduling.model,
+                              pd.DataFrame([app.appointment_features(scheduling, record) for record in batch])),
+                  'predict_proba')] for batch in batches]
+    resources = app.registry.get('resource_allocation')
+    jobs = []
+    for batch in batches:
+        columns = app.ResourceEncoder.row_columns([app.parse_resources(resources, record) for record in batch])
+        jobs.append([('resource_allocation_bed', resources.bed_model.final,
+                      resources.bed_encoder.encode_columns(columns), 'predict'),
+                     ('resource_allocation_staff', resources.staff_model.final,
+                      resources.staff_encoder.encode_columns(columns), 'predict')])
+    return jobs
+
+
+def run_jobs(predict, jobs, threads):
+    # Every batch's model calls from `threads` client threads; returns (seconds, outputs)
+    from concurrent.futures import ThreadPoolExecutor
+
+    def run(batch):
+        return [predict(name, model, X, method) for name, model, X, method in batch]
+
+    started = time.perf_counter()
+    if threads <= 1:
+        outputs = [run(batch) for batch in jobs]
+    else:
+        with ThreadPoolExecutor(threads) as pool:
+            outputs = list(pool.map(run, jobs))
+    return time.perf_counter() - started, outputs
+
+
+def main():
+    import argparse
+    import json
+    import sys
+    import warnings
+
+    parser = argparse.ArgumentParser(description='Throughput of the model server from 1 to N inference processes')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--endpoints', nargs='+', default=['waitingtime', 'appointment', 'resources'],
+                        choices=['waitingtime', 'waitingintervals', 'appointment', 'resources'])
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--batches', type=int, default=64, help='timed batches per endpoint and worker count')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+    from benchmark import RECORDS
+
+    def in_process(name, model, X, method):
+        return getattr(model, method)(X)
+
+    if args.max_workers > (os.cpu_count() or 1):
+        print(f'note: {os.cpu_count()} cores; workers beyond that share them and cannot scale')
+    results = []
+    for endpoint in args.endpoints:
+        records = RECORDS[endpoint](args.batch_size * args.batches, args.seed)
+        jobs = benchmark_jobs(app, endpoint, records, args.batch_size)
+        n_rows = len(records)
+        run_jobs(in_process, jobs[:2], 1)
+        seconds, expected = run_jobs(in_process, jobs, 1)
+        baseline = n_rows / seconds
+        print(f'{endpoint}: {args.batches} batches of {args.batch_size}')
+        print(f'  in process     {baseline:>10.0f} rows/s')
+        results.append({'endpoint': endpoint, 'workers': 0, 'rowsPerSecond': baseline})
+        for n_workers in range(1, args.max_workers + 1):
+            server = ModelServer(n_workers)
+            try:
+                def served(name, model, X, method):
+                    return server.predict((name, 'benchmark'), model, X, method)
+
+                # Publishes the models and warms every worker before timing
+                run_jobs(served, jobs[:2 * n_workers], 2 * n_workers)
+                # Two client threads per worker keep every worker's queue non-empty
+                seconds, outputs = run_jobs(served, jobs, 2 * n_workers)
+            finally:
+                server.close()
+            for got, want in zip(outputs, expected):
+                for a, b in zip(got, want):
+                    if not np.allclose(a, b, rtol=1e-9, atol=1e-9):
+                        raise SystemExit(f'{endpoint}: the model server disagrees with in-process predictions')
+            rate = n_rows / seconds
+            one = one if n_workers > 1 else rate
+            print(f'  {n_workers:>2} worker{"s" if n_workers > 1 else " "}     {rate:>10.0f} rows/s'
+                  f'  {rate / baseline:5.2f}x in process  {rate / one / n_workers:6.1%} scaling efficiency')
+            results.append({'endpoint': endpoint, 'workers': n_workers, 'rowsPerSecond': rate,
+                            'speedup': rate / baseline, 'efficiency': rate / one / n_workers})
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'cpuCount': os.cpu_count(), 'batchSize': args.batch_size, 'batches': args.batches,
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+# python/queues.py
+# Live per-department patient queues. Each department keeps a binary heap ordered by
+# priority score (highest first, then arrival) for O(log n) push, pop, removal and
+# reprioritization (removed or moved entries are marked dead and skipped when they
+# surface), plus one Fenwick tree per priority score over arrival numbers, so a patient's
+# position in line is also O(log n) instead of a re-sort of the whole list.
+import heapq
+import threading
+
+
+class RankIndex:
+    # Fenwick tree of 0/1 flags over arrival numbers 0, 1, 2, ...; grows by doubling
+
+    def __init__(self, capacity=64):
+        self.tree = [0] * (capacity + 1)
+
+    def add(self, i, delta, live=None):
+        # live() lists every index currently set, to rebuild from when i is past the end
+        if i + 1 >= len(self.tree):
+            self._rebuild(max(2 * (len(self.tree) - 1), i + 1), live() if live else [])
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i):
+        # How many flags are set below index i
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def _rebuild(self, capacity, live):
+        self.tree = [0] * (capacity + 1)
+        for i in live:
+            self.add(i, 1)
+
+
+class DepartmentQueue:
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}  # patient id -> heap entry [-score, arrival, patient id, alive]
+        self._ranks = {}  # score -> RankIndex over the arrivals waiting at that score
+        self._counts = {}  # score -> patients waiting at that score
+        self._arrivals = 0
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, patient_id):
+        return patient_id in self._entries
+
+    def push(self, patient_id, score):
+        if patient_id in self._entries:
+            raise KeyError(f'{patient_id!r} is already queued')
+        self._add(patient_id, score, self._arrivals)
+        self._arrivals += 1
+
+    def pop(self):
+        # (patient id, score) of the next patient, or None when nobody is waiting
+        while self._heap:
+            neg_score, _, patient_id, alive = heapq.heappop(self._heap)
+            if alive:
+                self._discard(patient_id, mark=False)
+                return patient_id, -neg_score
+            self._dead -= 1
+        return None
+
+    def remove(self, patient_id):
+        self._discard(patient_id)
+
+    def reprioritize(self, patient_id, score):
+        # Keeps the original arrival, so the patient goes ahead of later arrivals at the new score
+        arrival = self._entries[patient_id][1]
+        self._discard(patient_id, renumber=False)
+        self._add(patient_id, score, arrival)
+
+    def score(self, patient_id):
+        return -self._entries[patient_id][0]
+
+    def position(self, patient_id):
+        # 1-based place in line: everyone at a higher score, then earlier arrivals at this one
+        neg_score, arrival = self._entries[patient_id][:2]
+        ahead = sum(count for score, count in self._counts.items() if score > -neg_score)
+        return ahead + self._ranks[-neg_score].prefix(arrival) + 1
+
+    def ordered(self):
+        # Waiting patient ids, next patient first
+        return [entry[2] for entry in sorted(self._entries.values())]
+
+    def _add(self, patient_id, score, arrival):
+        entry = [-score, arrival, patient_id, True]
+        self._entries[patient_id] = entry
+        heapq.heappush(self._heap, entry)
+        if score not in self._ranks:
+            self._ranks[score] = RankIndex()
+        self._ranks[score].add(arrival, 1, lambda: self._live_arrivals(score, patient_id))
+        self._counts[score] = self._counts.get(score, 0) + 1
+
+    def _discard(self, patient_id, mark=True, renumber=True):
+        # renumber=False when the patient is re-added at once with the same arrival number
+        entry = self._entries.pop(patient_id)
+        score = -entry[0]
+        self._ranks[score].add(entry[1], -1)
+        self._counts[score] -= 1
+        if mark:
+            entry[3] = False
+            self._dead += 1
+        if not self._entries and renumber:
+            # Empty line: start numbering arrivals afresh so the rank trees stay small
+            self._heap, self._ranks, self._counts, self._arrivals, self._dead = [], {}, {}, 0, 0
+        elif self._dead > len(self._entries):
+            # More dead entries than live ones: rebuild the heap from the live ones
+            self._heap = [entry for entry in self._heap if entry[3]]
+            heapq.heapify(self._heap)
+            self._dead = 0
+
+    def _live_arrivals(self, score, exclude):
+        return [entry[1] for patient_id, entry in self._entries.items()
+                if -entry[0] == score and patient_id != exclude]
+
+
+class PatientQueues:
+    # Every department's queue plus the details of each waiting patient, behind one lock.
+    # The state lives in this process only: run queue clients against a single worker.
+
+    def __init__(self):
+        self._queues = {}
+        self._patients = {}  # patient id -> (department, details)
+        self._lock = threading.Lock()
+
+    def enqueue(self, patient_id, department, score, details):
+        with self._lock:
+            if patient_id in self._patients:
+                raise KeyError(f'patient {patient_id!r} is already queued in {self._patients[patient_id][0]}')
+            queue = self._queues.setdefault(department, DepartmentQueue())
+            queue.push(patient_id, score)
+            self._patients[patient_id] = (department, details)
+            return queue.position(patient_id), len(queue)
+
+    def next(self, department):
+        # (patient id, details) of the next patient in the department, or None
+        with self._lock:
+            queue = self._queues.get(department)
+            popped = queue.pop() if queue is not None else None
+            if popped is None:
+                return None
+            department, details = self._patients.pop(popped[0])
+            return popped[0], details
+
+    def remove(self, patient_id):
+        with self._lock:
+            department, details = self._patients.pop(patient_id)
+            self._queues[department].remove(patient_id)
+            return details
+
+    def reprioritize(self, patient_id, score, details):
+        with self._lock:
+            department, _ = self._patients[patient_id]
+            self._queues[department].reprioritize(patient_id, score)
+            self._patients[patient_id] = (department, details)
+            return self._queues[department].position(patient_id), len(self._queues[department])
+
+    def lookup(self, patient_id):
+        # (department, details, position, queue length); KeyError if the patient is not waiting
+        with self._lock:
+            department, details = self._patients[patient_id]
+            queue = self._queues[department]
+            return department, details, queue.position(patient_id), len(queue)
+
+    def listing(self, department):
+        # [(patient id, details)] in the order they will be seen
+        with self._lock:
+            queue = self._queues.get(department)
+            if queue is None:
+                return []
+            return [(patient_id, self._patients[patient_id][1]) for patient_id in queue.ordered()]
+
+    def lengths(self):
+        with self._lock:
+            return {department: len(queue) for department, queue in self._queues.items()}
@@ -0,0 +1,236 @@
+# python/registry.py
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+import artifacts
+
+# Seconds before a model that failed to load is tried again
+RETRY_SECONDS = 30
+
+
+class ModelUnavailable(Exception):
+
+    def __init__(self, name, reason):
+        super().__init__(f'model {name} is unavailable: {reason}')
+        self.name = name
+        self.reason = reason
+
+
+class LazyEstimator:
+    # Picklable stand-in for the sklearn estimator behind a compiled model. The flat
+    # arrays serve small batches; the original is only unpickled for a large batch.
+
+    def __init__(self, path, final_step=False, source_mtime=None):
+        self.path = path
+        self.final_step = final_step
+        self.source_mtime = source_mtime
+        self._model = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'path': self.path, 'final_step': self.final_step, 'source_mtime': self.source_mtime}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['final_step'], state.get('source_mtime'))
+
+    @property
+    def usable(self):
+        # False once the pickle has been replaced by a retrain the compiled arrays don't match
+        if self._model is not None or self.source_mtime is None:
+            return True
+        try:
+            return os.path.getmtime(self.path) == self.source_mtime
+        except OSError:
+            return False
+
+    def load(self):
+        with self._lock:
+            if self._model is None:
+                with open(self.path, 'rb') as f:
+                    model = pickle.load(f)
+                self._model = model.steps[-1][1] if self.final_step else model
+        return self._model
+
+    def predict(self, X):
+        return self.load().predict(X)
+
+    def predict_proba(self, X):
+        return self.load().predict_proba(X)
+
+
+def files_sha256(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def load_compiled(pickle_path, artifact_dir, allow_pickle=True):
+    # Compiled model for a pickle, kept next to it as a pickle-free artifact (artifacts.py)
+    # whose arrays are memory-mapped read-only, so every forked worker shares the same
+    # pages. The pickle is only unpickled to (re)build a missing or stale artifact, or for
+    # the sklearn fallback on large batches. With allow_pickle=False, or no pickle at all,
+    # the artifact is loaded on its own and the flat arrays serve every batch.
+    if not allow_pickle or not os.path.exists(pickle_path):
+        return artifacts.load(artifact_dir)
+
+    source_mtime = os.path.getmtime(pickle_path)
+    source_sha256 = files_sha256([pickle_path])
+    manifest = None
+    if os.path.exists(os.path.join(artifact_dir, artifacts.MANIFEST)):
+        try:
+            manifest = artifacts.read_manifest(artifact_dir)
+        except artifacts.ArtifactError:
+            manifest = None  # an older format: rebuild it
+    if manifest is None or manifest['source_sha256'] != source_sha256:
+        model = artifacts.unpickle(pickle_path)
+        try:
+            manifest = artifacts.export(model, artifact_dir, pickle_path)
+        except (TypeError, artifacts.ArtifactError):
+            # Nothing to flatten (e.g. histogram boosting with categorical splits); serve the estimator as it is
+            return model
+
+    # The sklearn estimator is only a safe fallback under the version that exported the arrays
+    fallback = None
+    if manifest['sklearn_version'] == artifacts.sklearn_version():
+        fallback = LazyEstimator(pickle_path, manifest['preprocessor'] is not None, source_mtime)
+    return artifacts.load(artifact_dir, fallback)
+
+
+class ModelRegistry:
+    # Named, versioned loaders. Each entry loads on first use, and a loader that fails
+    # (missing file, bad pickle, failed probe) only makes its own name unavailable; it is
+    # retried after RETRY_SECONDS. reload() builds the replacement on the caller's thread
+    # and swaps it in with one assignment, so a request that already fetched an entry
+    # finishes on that version. Every entry carries .version, a digest of its source files.
+
+    def __init__(self):
+        self._loaders = {}
+        self._files = {}
+        self._on_load = {}
+        self._entries = {}
+        self._mtimes = {}
+        self._failures = {}
+        self._locks = {}
+        self._watching = None  # (interval, log) once watch() is called
+        self._watcher_pid = None
+        self._watcher_lock = threading.Lock()
+
+    def register(self, name, loader, files, on_load=None):
+        self._loaders[name] = loader
+        self._files[name] = list(files)
+        self._on_load[name] = on_load
+        self._locks[name] = threading.Lock()
+
+    def _mtimes_of(self, name):
+        return [os.path.getmtime(path) for path in self._files[name]]
+
+    def _load(self, name):
+        # Caller holds the name's lock
+        try:
+            mtimes = self._mtimes_of(name)
+            version = files_sha256(self._files[name])[:12]
+            entry = self._loaders[name]()
+            entry.version = version
+        except Exception as e:
+            reason = f'{type(e).__name__}: {e}'
+            self._failures[name] = (time.monotonic(), reason)
+            raise ModelUnavailable(name, reason) from e
+        self._failures.pop(name, None)
+        self._mtimes[name] = mtimes
+        self._entries[name] = entry
+        if self._on_load[name] is not None:
+            self._on_load[name]()
+        return entry
+
+    def get(self, name):
+        if self._watching is not None and self._watcher_pid != os.getpid():
+            self._start_watcher()
+        entry = self._entries.get(name)
+        if entry is not None:
+            return entry
+
+        with self._locks[name]:
+            if name in self._entries:
+                return self._entries[name]
+            failure = self._failures.get(name)
+            if failure is not None and time.monotonic() - failure[0] < RETRY_SECONDS:
+                raise ModelUnavailable(name, failure[1])
+            return self._load(name)
+
+    def reload(self, name):
+        # Load, validate and swap in a new version; on failure the old version keeps serving
+        with self._locks[name]:
+            previous = self._entries.get(name)
+            try:
+                return self._load(name).version
+            except ModelUnavailable:
+                if previous is not None:
+                    self._failures.pop(name, None)
+                raise
+
+    def changed(self):
+        # Loaded names whose source files were modified since they were loaded
+        changed = []
+        for name in list(self._entries):
+            try:
+                if self._mtimes_of(name) != self._mtimes.get(name):
+                    changed.append(name)
+            except OSError:
+                pass  # mid-replace or deleted; keep serving what is loaded
+        return changed
+
+    def watch(self, interval, log=None):
+        # Poll source files from a daemon thread and hot-reload whatever changed
+        self._watching = (interval, log)
+        self._start_watcher()
+
+    def _start_watcher(self):
+        # Threads do not survive fork, so each worker process starts its own watcher on first get()
+        with self._watcher_lock:
+            if self._watcher_pid != os.getpid():
+                threading.Thread(target=self._watch_files, args=self._watching, name='model-watcher',
+                                 daemon=True).start()
+                self._watcher_pid = os.getpid()
+
+    def _watch_files(self, interval, log):
+        while True:
+            time.sleep(interval)
+            for name in self.changed():
+                try:
+                    version = self.reload(name)
+                    if log is not None:
+                        log(f'reloaded {name} as version {version}')
+                except ModelUnavailable as e:
+                    # Remember the bad files so they are not reloaded every poll
+                    try:
+                        self._mtimes[name] = self._mtimes_of(name)
+                    except OSError:
+                        pass
+                    if log is not None:
+                        log(f'kept previous {name}: {e.reason}')
+
+    def load_all(self):
+        # Warm every model, e.g. before forking workers; failures stay per model
+        for name in self._loaders:
+            try:
+                self.get(name)
+            except ModelUnavailable:
+                pass
+
+    def status(self):
+        status = {}
+        for name in self._loaders:
+            entry = self._entries.get(name)
+            failure = self._failures.get(name)
+            status[name] = {
+                'state': 'loaded' if entry is not None else 'unavailable' if failure else 'not loaded',
+                'version': getattr(entry, 'version', None),
+                'error': failure[1] if failure else None
+            }
+        return status
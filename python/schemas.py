@@ -0,0 +1,180 @@
+# python/schemas.py
+# Declarative request schemas. A Schema is compiled once (per model load, since the
+# allowed categories come from the fitted encoders) into one coercion function per field;
+# parse() runs them over a request body and reports every bad field at once, so invalid
+# requests are rejected before any pandas or model work.
+from datetime import datetime
+import math
+
+MISSING = object()
+
+
+class RequestError(ValueError):
+    # An invalid request body; `fields` maps each offending field to what is wrong with it
+
+    def __init__(self, fields, message='invalid request'):
+        self.fields = fields
+        self.message = message
+        details = '; '.join(f'{name}: {problem}' for name, problem in fields.items())
+        super().__init__(f'{message}: {details}' if details else message)
+
+    def body(self):
+        return {'error': self.message, 'fields': self.fields}
+
+
+def _bounds(minimum, maximum):
+    if minimum is not None and maximum is not None:
+        return f'must be between {minimum:g} and {maximum:g}'
+    return f'must be at least {minimum:g}' if minimum is not None else f'must be at most {maximum:g}'
+
+
+class Number:
+    # A finite number (or numeric string), optionally whole and bounded; parsed as float
+
+    def __init__(self, name, minimum=None, maximum=None, integer=False, default=MISSING):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.integer = integer
+        self.default = default
+
+    def compile(self):
+        low = -math.inf if self.minimum is None else self.minimum
+        high = math.inf if self.maximum is None else self.maximum
+        integer = self.integer
+        out_of_range = _bounds(self.minimum, self.maximum) if (self.minimum, self.maximum) != (None, None) else None
+
+        def coerce(value):
+            kind = type(value)
+            if kind is float or kind is int:
+                number = float(value)
+            elif kind is str:
+                try:
+                    number = float(value)
+                except ValueError:
+                    raise ValueError('must be a number') from None
+            else:
+                # bool is an int subclass but never a meaningful quantity here
+                raise TypeError('must be a number')
+            if not math.isfinite(number):
+                raise ValueError('must be a finite number')
+            if integer and not number.is_integer():
+                raise ValueError('must be a whole number')
+            if not low <= number <= high:
+                raise ValueError(out_of_range)
+            return number
+
+        return coerce
+
+
+class Identifier:
+    # A non-empty string or a whole number, kept as given (record ids echoed back to the client)
+
+    def __init__(self, name):
+        self.name = name
+        self.default = MISSING
+
+    def compile(self):
+        def coerce(value):
+            kind = type(value)
+            if kind is int or (kind is str and value):
+                return value
+            raise TypeError('must be a non-empty string or a whole number')
+
+        return coerce
+
+
+class Text:
+    # A non-empty string of at most max_length characters
+
+    def __init__(self, name, max_length=200, default=MISSING):
+        self.name = name
+        self.max_length = max_length
+        self.default = default
+
+    def compile(self):
+        max_length = self.max_length
+        invalid = f'must be a non-empty string of at most {max_length} characters'
+
+        def coerce(value):
+            if type(value) is not str or not 0 < len(value) <= max_length:
+                raise TypeError(invalid)
+            return value
+
+        return coerce
+
+
+class Choice:
+    # One of a fixed set of strings (they also become cache keys)
+
+    def __init__(self, name, choices, default=MISSING):
+        self.name = name
+        self.choices = list(choices)
+        self.default = default
+
+    def compile(self):
+        allowed = frozenset(self.choices)
+        unknown = f'must be one of {sorted(allowed)}'
+
+        def coerce(value):
+            if type(value) is not str:
+                raise TypeError('must be a string')
+            if value not in allowed:
+                raise ValueError(unknown)
+            return value
+
+        return coerce
+
+
+class Date:
+    # A calendar date string; parsed as datetime
+
+    def __init__(self, name, format='%Y-%m-%d', default=MISSING):
+        self.name = name
+        self.format = format
+        self.default = default
+
+    def compile(self):
+        date_format = self.format
+        invalid = f'must be a date formatted {date_format}'
+
+        def coerce(value):
+            if type(value) is not str:
+                raise TypeError(invalid)
+            try:
+                return datetime.strptime(value, date_format)
+            except ValueError:
+                raise ValueError(invalid) from None
+
+        return coerce
+
+
+class Schema:
+    # parse(data) returns the coerced field values as a tuple, in declaration order;
+    # fields with a default are optional, and null counts as absent
+
+    def __init__(self, *fields):
+        self._compiled = [(field.name, field.compile(), field.default) for field in fields]
+
+    def parse(self, data):
+        if not isinstance(data, dict):
+            raise RequestError({}, 'request must be a JSON object')
+        values = []
+        problems = None
+        for name, coerce, default in self._compiled:
+            value = data.get(name)
+            if value is None:
+                if default is not MISSING:
+                    values.append(default)
+                    continue
+                problems = problems or {}
+                problems[name] = 'is required'
+                continue
+            try:
+                values.append(coerce(value))
+            except (TypeError, ValueError) as e:
+                problems = problems or {}
+                problems[name] = str(e)
+        if problems:
+            raise RequestError(problems)
+        return tuple(values)
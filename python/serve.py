@@ -0,0 +1,96 @@
+# python/serve.py
+# Production serving mode for the prediction API:
+#   python python/serve.py --workers 4 --threads 16 --inference-threads 4
+#   python python/serve.py --model-server 4 --threads 16 --inference-threads 8
+# Pre-forks worker processes that accept on one shared listening socket, so throughput
+# scales with cores; each worker serves requests on a thread pool, offloads inference to a
+# bounded pool and micro-batches concurrent single-record calls (see app.py / batching.py).
+# With --model-server, one process serves HTTP and hands model calls to N inference processes
+# (see model_server.py), so the patient queues and live inputs are not split across workers.
+# Each worker watches the model files itself (MODEL_WATCH_INTERVAL); /api/admin/reload only
+# reaches the worker that accepted the request.
+import argparse
+import os
+import signal
+import socket
+import sys
+
+
+def serve_worker(app, sock, host, port, threads):
+    try:
+        from waitress import serve
+        serve(app, sockets=[sock], threads=threads)
+    except ImportError:
+        # werkzeug's threaded server has no thread cap; the inference pool still bounds model work
+        from werkzeug.serving import make_server
+        make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the prediction API on multiple cores')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5328)
+    parser.add_argument('--workers', type=int,
+                        help='worker processes (default: one per core, or one with --model-server); '
+                             '/api/admin/reload only reloads the worker that answers it, so set '
+                             'MODEL_WATCH_INTERVAL to reload new model files in every worker')
+    parser.add_argument('--threads', type=int, default=16, help='request threads per worker')
+    parser.add_argument('--inference-threads', type=int, default=2,
+                        help='inference threads per worker; NumPy releases the GIL while predicting')
+    parser.add_argument('--batch-window-ms', type=float, default=2.0,
+                        help='how long a single-record request waits for others to batch with (0 disables)')
+    parser.add_argument('--model-server', type=int, default=0, metavar='N',
+                        help='run inference in N shared-memory worker processes (-1: one per core)')
+    args = parser.parse_args()
+    if args.model_server:
+        if args.workers is not None and args.workers > 1:
+            parser.error('--model-server serves from one process; drop --workers')
+        args.workers = 1
+    elif args.workers is None:
+        args.workers = os.cpu_count() or 1
+
+    # app.py reads its serving configuration at import
+    os.environ['INFERENCE_THREADS'] = str(args.inference_threads)
+    os.environ['MICRO_BATCH_WINDOW_MS'] = str(args.batch_window_ms)
+    os.environ['MODEL_SERVER_WORKERS'] = str(args.model_server)
+    os.environ['SERVE_WORKERS'] = str(args.workers)
+    # Load (and compile) every model once in the parent so forked workers share the pages
+    os.environ.setdefault('PRELOAD_MODELS', '1')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app
+
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    sock.set_inheritable(True)
+
+    if args.workers <= 1 or not hasattr(os, 'fork'):
+        # Exit through atexit, which stops the inference processes and frees their shared memory
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        serve_worker(app, sock, args.host, args.port, args.threads)
+        return
+
+    children = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            serve_worker(app, sock, args.host, args.port, args.threads)
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    print(f'Serving on http://{args.host}:{args.port} with {args.workers} workers')
+    for pid in children:
+        os.waitpid(pid, 0)
+
+
+if __name__ == '__main__':
+    main()
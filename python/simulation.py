@@ -0,0 +1,281 @@
+# python/simulation.py
+# Discrete-event simulation of the department queues, for what-if capacity planning:
+#   python python/simulation.py --days 7 --replications 1000 --staff 3 \
+#       --change Cardiology:0:8-12:-2          # Cardiology loses two staff on Monday mornings
+#
+# Arrivals, patient mix and service times follow temp_py_models/synthesis.py, the data
+# the patient-flow model is trained on: each department's arrivals are Poisson with the
+# hourly rate the synthetic queue-length means give for that hour, weekday, month and
+# holiday flag; patient types are drawn with PATIENT_TYPE_P and consultations last a
+# gamma(SERVICE_SHAPE, SERVICE_SCALE) number of minutes by type. Waiting patients are
+# seen in triage order as in AppointmentSchedulingOptimization.py (urgency score x
+# service score, highest first, first come first served within a score), or strictly
+# first come first served.
+#
+# Each department is an independent multi-server queue whose staffing may change by the
+# hour. Its events (arrivals, consultation ends, staffing changes) are taken from a heap
+# event calendar; replications are independent, seeded by (seed, replication, department),
+# and run in chunks over a process pool, so results do not depend on the number of workers,
+# and scenarios run with one seed see the same arrivals wherever their rates agree.
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'temp_py_models'))
+from synthesis import (FLOW_DEPARTMENTS, PATIENT_TYPES, PATIENT_TYPE_P, SERVICE_SCALE,  # noqa: E402
+                       SERVICE_SHAPE, queue_means)
+
+# Triage inputs per PATIENT_TYPES entry (Emergency, Routine, Follow-up): the urgency each
+# type is triaged as, and the AppointmentSchedulingOptimization.py scores
+URGENCY_BY_TYPE = ['High', 'Medium', 'Low']
+URGENCY_SCORE = {'Low': 1, 'Medium': 2, 'High': 3}
+# Service categories are the training labels: under 10, 10 to 20, over 20 minutes
+SERVICE_BINS = [10, 20]
+SERVICE_SCORE = np.array([1, 2, 3])
+
+# Waits are also tallied per minute up to this many minutes, for pooled percentiles
+WAIT_HISTOGRAM_MINUTES = 24 * 60
+# Quantiles reported for the per-replication statistics, and for the pooled waits
+REPLICATION_QUANTILES = [0.05, 0.5, 0.95]
+WAIT_QUANTILES = [0.5, 0.9, 0.95, 0.99]
+STATISTICS = ['arrivals', 'served', 'meanWait', 'p95Wait', 'maxWait', 'meanQueueLength', 'utilization']
+
+MAX_DAYS = 28
+# Runs of fewer replication x department x days than this (about 0.1 ms each) stay in the
+# calling process: shipping them to the pool would cost more than it saves
+MIN_PARALLEL_WORK = 2000
+
+
+def triage_priority(patient_type, service_time):
+    # Higher is seen first
+    category = np.searchsorted(SERVICE_BINS, service_time, side='right')
+    urgency = np.array([URGENCY_SCORE[u] for u in URGENCY_BY_TYPE])[patient_type]
+    return urgency * SERVICE_SCORE[category]
+
+
+def compile_scenario(start_date, days, departments, staff, staff_changes=(), arrival_scale=1.0,
+                     holidays=(), triage='priority'):
+    # Hourly arrival rates and staffing, shape (departments, hours), for simulate_department.
+    # staff: {department: staff on duty}; staff_changes: (department, weekdays, first hour,
+    # end hour, change) tuples, weekdays Monday=0 (empty for every day); arrival_scale: a
+    # multiplier for every department or a {department: multiplier} dict.
+    hours = pd.date_range(pd.Timestamp(start_date), periods=days * 24, freq='h')
+    dates = hours.normalize()
+    holiday = np.isin(dates, pd.DatetimeIndex([pd.Timestamp(day) for day in holidays])).astype(np.int64)
+    base_rate = queue_means(hours.hour.to_numpy(), hours.dayofweek.to_numpy(), hours.month.to_numpy(), holiday)
+
+    scale = np.array([arrival_scale.get(dept, 1.0) if isinstance(arrival_scale, dict) else arrival_scale
+                      for dept in departments], dtype=np.float64)
+    rates = scale[:, None] * base_rate[None, :].astype(np.float64)
+    capacity = np.array([[staff[dept]] * len(hours) for dept in departments], dtype=np.int64)
+    hour, weekday = hours.hour.to_numpy(), hours.dayofweek.to_numpy()
+    for dept, weekdays, first_hour, end_hour, change in staff_changes:
+        when = (hour >= first_hour) & (hour < end_hour)
+        if weekdays:
+            when &= np.isin(weekday, list(weekdays))
+        capacity[departments.index(dept), when] += change
+    return {
+        'departments': list(departments),
+        'rates': rates,
+        'capacity': np.maximum(capacity, 0),
+        'triage': triage
+    }
+
+
+def simulate_department(rng, rates, capacity, triage=True):
+    # One replication of one department over len(rates) hours. Returns the per-patient
+    # waits (minutes; patients still waiting when the calendar runs dry are censored at
+    # the last event), their service times, and the staffed minutes.
+    n_hours = len(rates)
+    counts = rng.poisson(rates)
+    n = int(counts.sum())
+    arrival = np.sort((np.repeat(np.arange(n_hours), counts) + rng.random(n)) * 60)
+    patient_type = rng.choice(len(PATIENT_TYPES), n, p=PATIENT_TYPE_P)
+    service = rng.gamma(SERVICE_SHAPE[patient_type], SERVICE_SCALE[patient_type])
+    # Waiting heap key: higher priority first, then arrival order
+    key = -triage_priority(patient_type, service) if triage else np.zeros(n, dtype=np.int64)
+
+    arrival_list, service_list, key_list = arrival.tolist(), service.tolist(), key.tolist()
+    changes = [(h * 60.0, int(capacity[h])) for h in range(1, n_hours) if capacity[h] != capacity[h - 1]]
+    waits = [math.nan] * n
+
+    calendar = []  # (minute, event, value): consultation ends (0) and staffing changes (1)
+    for minute, staff in changes:
+        heapq.heappush(calendar, (minute, 1, staff))
+    waiting = []
+    on_duty, busy, t, i = int(capacity[0]), 0, 0.0, 0
+    inf = math.inf
+    while True:
+        next_arrival = arrival_list[i] if i < n else inf
+        if calendar and calendar[0][0] <= next_arrival:
+            t, event, value = heapq.heappop(calendar)
+            if event == 0:
+                busy -= 1
+            else:
+                on_duty = value
+        elif i < n:
+            t = next_arrival
+            if busy < on_duty and not waiting:
+                # Nobody ahead and a free clinician: straight in
+                waits[i] = 0.0
+                busy += 1
+                heapq.heappush(calendar, (t + service_list[i], 0, 0))
+                i += 1
+                continue
+            heapq.heappush(waiting, (key_list[i], i))
+            i += 1
+        else:
+            break
+        while waiting and busy < on_duty:
+            _, j = heapq.heappop(waiting)
+            waits[j] = t - arrival_list[j]
+            busy += 1
+            heapq.heappush(calendar, (t + service_list[j], 0, 0))
+
+    waits = np.array(waits)
+    unserved = np.isnan(waits)
+    waits[unserved] = t - arrival[unserved]
+    return waits, service, unserved, float(capacity.sum()) * 60
+
+
+def replicate(scenario, seed, replications):
+    # Statistics of replications [first, last) of a scenario, per department: each
+    # STATISTICS entry per replication, plus the waits of every patient as a per-minute tally
+    first, last = replications
+    triage = scenario['triage'] == 'priority'
+    n_hours = scenario['rates'].shape[1]
+    results = []
+    for d, dept in enumerate(scenario['departments']):
+        stream = zlib.crc32(dept.encode())
+        stats = np.zeros((last - first, len(STATISTICS)))
+        tally = np.zeros(WAIT_HISTOGRAM_MINUTES + 1, dtype=np.int64)
+        for r in range(first, last):
+            rng = np.random.default_rng([seed, r, stream])
+            waits, service, unserved, staffed = simulate_department(
+                rng, scenario['rates'][d], scenario['capacity'][d], triage)
+            served = ~unserved
+            stats[r - first] = [
+                len(waits),
+                served.sum(),
+                waits.mean() if len(waits) else 0.0,
+                np.percentile(waits, 95) if len(waits) else 0.0,
+                waits.max() if len(waits) else 0.0,
+                # Little's law: time-average patients waiting
+                waits.sum() / (n_hours * 60),
+                service[served].sum() / staffed if staffed else 0.0
+            ]
+            tally += np.bincount(np.minimum(waits, WAIT_HISTOGRAM_MINUTES).astype(np.int64),
+                                 minlength=WAIT_HISTOGRAM_MINUTES + 1)
+        results.append((stats, tally))
+    return results
+
+
+def summarize(departments, chunks):
+    # Merge replicate() chunks into per-department distributions
+    summary = {}
+    for d, dept in enumerate(departments):
+        stats = np.concatenate([chunk[d][0] for chunk in chunks])
+        tally = np.sum([chunk[d][1] for chunk in chunks], axis=0)
+        quantiles = np.quantile(stats, REPLICATION_QUANTILES, axis=0)
+        cumulative = np.cumsum(tally)
+        pooled = {f'p{round(q * 100)}': float(np.searchsorted(cumulative, q * cumulative[-1]))
+                  for q in WAIT_QUANTILES} if cumulative[-1] else {f'p{round(q * 100)}': 0.0 for q in WAIT_QUANTILES}
+        summary[dept] = {
+            'waitMinutes': pooled,
+            'replications': {
+                name: dict({'mean': float(stats[:, k].mean())},
+                           **{f'p{round(q * 100)}': float(quantiles[i, k]) for i, q in enumerate(REPLICATION_QUANTILES)})
+                for k, name in enumerate(STATISTICS)
+            }
+        }
+    return summary
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def process_pool(workers):
+    # A pool of `workers` processes, created once per serving process. Workers are spawned,
+    # not forked, so they never inherit a threaded server's locks.
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def run(scenario, replications, seed=42, workers=None):
+    # Distributions of `replications` runs of a compiled scenario; workers=1 runs in this process
+    workers = workers or os.cpu_count() or 1
+    n_departments, n_hours = scenario['rates'].shape
+    if replications * n_departments * n_hours / 24 < MIN_PARALLEL_WORK:
+        workers = 1
+    n_chunks = min(replications, workers * 4) if workers > 1 else 1
+    bounds = np.linspace(0, replications, n_chunks + 1).astype(int)
+    spans = [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+    if workers <= 1:
+        chunks = [replicate(scenario, seed, span) for span in spans]
+    else:
+        pool = process_pool(workers)
+        chunks = list(pool.map(replicate, [scenario] * len(spans), [seed] * len(spans), spans))
+    return summarize(scenario['departments'], chunks)
+
+
+def parse_change(text):
+    # DEPARTMENT:WEEKDAYS:FIRST-END:CHANGE, e.g. Cardiology:0:8-12:-2 or General::0-6:+1
+    department, weekdays, hours, change = text.rsplit(':', 3)
+    first_hour, end_hour = (int(h) for h in hours.split('-'))
+    return department, [int(day) for day in weekdays.split(',') if day], first_hour, end_hour, int(change)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description='Simulate the department queues under a staffing scenario')
+    parser.add_argument('--start-date', default='2024-01-01')
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--departments', nargs='+', default=FLOW_DEPARTMENTS)
+    parser.add_argument('--staff', type=int, default=3, help='staff on duty per department')
+    parser.add_argument('--change', action='append', default=[], type=parse_change,
+                        help='staffing change DEPARTMENT:WEEKDAYS:FIRST-END:CHANGE (repeatable)')
+    parser.add_argument('--arrival-scale', type=float, default=1.0)
+    parser.add_argument('--holiday', action='append', default=[], help='YYYY-MM-DD (repeatable)')
+    parser.add_argument('--triage', choices=['priority', 'fifo'], default='priority')
+    parser.add_argument('--replications', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    scenario = compile_scenario(args.start_date, args.days, args.departments,
+                                {dept: args.staff for dept in args.departments}, args.change,
+                                args.arrival_scale, args.holiday, args.triage)
+    started = time.perf_counter()
+    summary = run(scenario, args.replications, args.seed, args.workers)
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.replications} replications of {args.days} days x {len(args.departments)} departments "
+          f"in {elapsed:.1f}s")
+    print(f"{'department':<14}{'arrivals':>9}{'p50 wait':>10}{'p95 wait':>10}{'p99 wait':>10}"
+          f"{'p95 of rep p95':>16}{'queue':>8}{'util':>7}")
+    for dept, result in summary.items():
+        reps, waits = result['replications'], result['waitMinutes']
+        print(f"{dept:<14}{reps['arrivals']['mean']:>9.0f}{waits['p50']:>10.0f}{waits['p95']:>10.0f}"
+              f"{waits['p99']:>10.0f}{reps['p95Wait']['p95']:>16.1f}{reps['meanQueueLength']['mean']:>8.2f}"
+              f"{reps['utilization']['mean']:>7.0%}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'seconds': elapsed, 'departments': summary}, f, indent=2)
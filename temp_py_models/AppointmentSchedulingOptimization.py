@@ -1,5 +1,4 @@
 import pandas as pd
-import numpy as np
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
@@ -8,32 +7,17 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 import pickle
 
+from synthesis import appointment_frame
+
 # Download and prepare dataset from NCBI
 # Using the Hangu dataset which contains consultation service time with patient characteristics
 url = "https://www.mdpi.com/2306-5729/8/3/47/s1"
 # Note: This is a placeholder. In a real implementation, you would download the dataset from the URL
 
 # For demonstration, we'll create a synthetic dataset based on the paper's description
-np.random.seed(42)
+# (urgent visits get longer service times; see synthesis.py)
 n_samples = 1000
-
-# Generate synthetic data based on the Hangu dataset description
-data = {
-    'PatientID': range(1, n_samples + 1),
-    'Age': np.random.randint(18, 90, n_samples),
-    'Gender': np.random.choice(['M', 'F'], n_samples),
-    'VisitType': np.random.choice(['New', 'Follow-up'], n_samples),
-    'Urgency': np.random.choice(['Low', 'Medium', 'High'], n_samples, p=[0.6, 0.3, 0.1]),
-    'Department': np.random.choice(['Cardiology', 'Orthopedics', 'Neurology', 'General'], n_samples),
-    'ServiceTime': np.random.gamma(shape=2, scale=10, size=n_samples),  # Service time in minutes
-    'DoctorID': np.random.randint(1, 21, n_samples)  # 20 doctors
-}
-
-df = pd.DataFrame(data)
-
-# Add some correlation between urgency and service time
-df.loc[df['Urgency'] == 'High', 'ServiceTime'] += 15
-df.loc[df['Urgency'] == 'Medium', 'ServiceTime'] += 5
+df = appointment_frame(n_samples, seed=42)
 
 # Feature engineering
 X = df.drop(['PatientID', 'ServiceTime', 'DoctorID'], axis=1)
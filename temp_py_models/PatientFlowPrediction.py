@@ -6,107 +6,14 @@ from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
 import matplotlib.pyplot as plt
-from datetime import datetime, timedelta
 import pickle
 
+from synthesis import patient_flow_frame
+
 # Create synthetic dataset based on real hospital patterns from research papers
-np.random.seed(42)
+# (queue, service and waiting-time rules live in synthesis.py; same seed, same data)
 n_samples = 2000  # Increased sample size for better generalization
-
-# Generate dates spanning a year with more granular time intervals
-start_date = datetime(2024, 1, 1)
-dates = [start_date + timedelta(hours=i*2) for i in range(n_samples)]
-
-# Generate synthetic data based on patterns described in research papers
-data = {
-    'ArrivalTime': dates,
-    'DayOfWeek': [d.weekday() for d in dates],
-    'Hour': [d.hour for d in dates],
-    'Month': [d.month for d in dates],
-    'IsHoliday': np.random.choice([0, 1], n_samples, p=[0.95, 0.05]),
-    'PatientType': np.random.choice(['Emergency', 'Routine', 'Follow-up'], n_samples, p=[0.3, 0.5, 0.2]),
-    'Department': np.random.choice(['General', 'Cardiology', 'Orthopedics', 'Pediatrics', 'OB-GYN'], n_samples),
-    'QueueLength': np.zeros(n_samples),
-    'ServiceTime': np.zeros(n_samples)
-}
-
-# Create realistic queue lengths based on time patterns and research findings
-for i in range(n_samples):
-    base_queue = 3  # Base queue length
-    
-    # Add time-of-day effect (based on hospital traffic patterns)
-    hour = data['Hour'][i]
-    if 8 <= hour <= 11:  # Morning rush (based on research showing peak morning hours)
-        base_queue += 6
-    elif 13 <= hour <= 16:  # Afternoon rush
-        base_queue += 5
-    elif 17 <= hour <= 19:  # Evening moderate
-        base_queue += 3
-    elif 0 <= hour <= 5:  # Night hours (reduced traffic)
-        base_queue -= 2
-    
-    # Add day-of-week effect (based on research showing Monday and Friday peaks)
-    day = data['DayOfWeek'][i]
-    if day == 0:  # Monday
-        base_queue += 4
-    elif day == 4:  # Friday
-        base_queue += 3
-    elif day == 6:  # Sunday
-        base_queue -= 1
-    
-    # Add seasonal effect (based on research showing winter months have higher hospital visits)
-    month = data['Month'][i]
-    if month in [1, 2, 12]:  # Winter months
-        base_queue += 2
-    elif month in [6, 7, 8]:  # Summer months
-        base_queue -= 1
-    
-    # Add holiday effect
-    if data['IsHoliday'][i] == 1:
-        base_queue += 3
-    
-    # Add randomness with realistic constraints
-    base_queue = max(1, base_queue)  
-    data['QueueLength'][i] = max(0, int(np.random.poisson(base_queue)))
-    
-    # Generate service time (time with doctor) based on patient type
-    if data['PatientType'][i] == 'Emergency':
-        service_time = np.random.gamma(shape=3, scale=5)  # Higher variability for emergencies
-    elif data['PatientType'][i] == 'Follow-up':
-        service_time = np.random.gamma(shape=2, scale=3)  # More predictable for follow-ups
-    else:  # Routine
-        service_time = np.random.gamma(shape=2.5, scale=4)
-        
-    data['ServiceTime'][i] = service_time
-
-# Generate waiting times based on queue length, patient type, and other factors
-data['WaitingTime'] = np.zeros(n_samples)
-for i in range(n_samples):
-    # Base waiting time proportional to queue length and service time
-    base_wait = data['QueueLength'][i] * 7  # 7 minutes per person in queue
-    
-    # Adjust for patient type (based on triage principles)
-    if data['PatientType'][i] == 'Emergency':
-        base_wait *= 0.4  # Emergency patients get higher priority
-    elif data['PatientType'][i] == 'Follow-up':
-        base_wait *= 0.75  # Follow-ups are usually faster
-    
-    # Add department effect (some departments have longer wait times)
-    if data['Department'][i] == 'Cardiology':
-        base_wait *= 1.2
-    elif data['Department'][i] == 'Orthopedics':
-        base_wait *= 1.1
-    
-    # Add time-of-day effect on efficiency
-    hour = data['Hour'][i]
-    if 0 <= hour <= 5:  # Night shift (less staff)
-        base_wait *= 1.3
-    
-    # Add randomness to represent variability in service time
-    data['WaitingTime'][i] = max(0, base_wait + np.random.normal(0, 8))
-
-# Create DataFrame
-df = pd.DataFrame(data)
+df = patient_flow_frame(n_samples, seed=42)
 
 # Additional feature engineering based on research
 df['Hour_sin'] = np.sin(2 * np.pi * df['Hour']/24)
@@ -265,3 +172,19 @@ with open(model_filename, 'wb') as file:
     pickle.dump(pipeline, file)
 
 print(f"Model saved to {model_filename}")
+
+# Quantile models for the waiting-time intervals python/app.py serves (?intervals=1): the
+# 10th, 50th and 90th percentile of the waiting time for the same inputs. Plain estimators
+# on this script's 22 features, which add IsWeekend and TimeOfDay_* to the shipped point
+# model's 17; the server encodes the union of both models' features once and each model
+# reads its own columns of it (flat_trees.JointRegressors).
+for alpha in [0.1, 0.5, 0.9]:
+    quantile_model = GradientBoostingRegressor(loss='quantile', alpha=alpha, n_estimators=200, max_depth=3,
+                                               learning_rate=0.05, min_samples_split=5, min_samples_leaf=30,
+                                               random_state=42)
+    quantile_model.fit(X_train, y_train)
+    coverage = np.mean(y_test <= quantile_model.predict(X_test))
+    model_filename = f'patient_flow_p{round(alpha * 100)}_model.pkl'
+    with open(model_filename, 'wb') as file:
+        pickle.dump(quantile_model, file)
+    print(f"Quantile {alpha}: {coverage:.1%} of test waiting times at or below it; saved to {model_filename}")
@@ -11,48 +11,13 @@ import io
 import matplotlib.pyplot as plt
 import pickle
 
+from synthesis import resource_frame
+
 # We'll use data described in the NCBI article about patient flow visualization and prediction
 # For demonstration, we'll create a synthetic dataset based on the paper's description
-np.random.seed(42)
+# (one row per day from 2019-01-01, with beds occupied from a 7-day admissions window; see synthesis.py)
 n_samples = 500
-
-# Generate dates for 41 months (as mentioned in the paper)
-start_date = pd.to_datetime('2019-01-01')
-dates = [start_date + pd.Timedelta(days=i) for i in range(41*30)]
-dates = dates[:n_samples]
-
-# Generate synthetic data based on the paper's description
-data = {
-    'Date': dates,
-    'Month': [d.month for d in dates],
-    'Year': [d.year for d in dates],
-    'DayOfWeek': [d.dayofweek for d in dates],
-    'IsHoliday': np.random.choice([0, 1], n_samples, p=[0.95, 0.05]),
-    'Department': np.random.choice(['Emergency', 'Surgery', 'Internal Medicine', 'Pediatrics', 'Obstetrics'], n_samples),
-    'OutpatientVisits': np.random.poisson(lam=235, size=n_samples),  # Based on mean mentioned in the paper
-    'InpatientAdmissions': np.random.poisson(lam=50, size=n_samples),
-    'StaffAvailable': np.random.randint(10, 30, n_samples),
-    'BedsTotal': np.random.choice([100, 150, 200, 250, 300], n_samples),
-    'BedsOccupied': np.zeros(n_samples),
-    'AvgLengthOfStay': np.random.gamma(shape=2, scale=2, size=n_samples) + 2  # in days
-}
-
-df = pd.DataFrame(data)
-
-# Create realistic bed occupancy based on admissions and length of stay
-for i in range(n_samples):
-    if i < 7:
-        df.loc[i, 'BedsOccupied'] = df.loc[i, 'InpatientAdmissions'] * 0.8
-    else:
-        # Bed occupancy depends on previous admissions and average length of stay
-        prev_admissions = sum(df.loc[max(0, i-7):i-1, 'InpatientAdmissions']) * 0.8
-        df.loc[i, 'BedsOccupied'] = min(
-            prev_admissions * df.loc[i, 'AvgLengthOfStay'] / 7,
-            df.loc[i, 'BedsTotal'] * 0.95  # Max occupancy is 95% of total beds
-        )
-
-# Calculate bed occupancy rate
-df['BedOccupancyRate'] = df['BedsOccupied'] / df['BedsTotal']
+df = resource_frame(n_samples, seed=42)
 
 # Feature engineering
 df['Month_sin'] = np.sin(2 * np.pi * df['Month']/12)
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+import warnings
+
+import numpy as np
+from sklearn.model_selection import train_test_split
+
+from train import MODELS, REGRESSORS, evaluate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+from flat_trees import compile_model  # noqa: E402
+
+# Side-by-side comparison of the regression backends on the same data and split:
+#   python temp_py_models/compare_backends.py --n-samples 50000 --json backends.json
+# Reports fit time, single-row latency (whole pipeline; final estimator alone; and that
+# estimator compiled by flat_trees, as python/app.py serves it), batch throughput of the
+# whole pipeline, pickle size and test MAE/RMSE/R² per model and backend.
+
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+REGRESSION_MODELS = [name for name, spec in MODELS.items() if spec['task'] == 'regression']
+
+
+def median_latency_ms(predict, rows, repeats):
+    # Median wall time of predicting one row at a time, in milliseconds
+    timings = []
+    for i in range(repeats):
+        row = rows[i % len(rows):i % len(rows) + 1]
+        started = time.perf_counter()
+        predict(row)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings)) * 1e3
+
+
+def throughput(predict, X, batch_rows):
+    # Rows per second predicting X in batches of batch_rows
+    started = time.perf_counter()
+    for start in range(0, len(X), batch_rows):
+        predict(X[start:start + batch_rows])
+    return len(X) / (time.perf_counter() - started)
+
+
+def compare(name, backend, n_samples, seed, args):
+    spec = MODELS[name]
+    X, y = spec['data'](n_samples, seed)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    model = spec['pipeline'](None, backend)
+    model.set_params(**spec['backends'][backend]['params'])
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+
+    # The backends differ only in the final estimator, so latency is also timed on rows that
+    # are already preprocessed: sklearn's predict, and the flat arrays python/app.py serves
+    final, compiled = model.steps[-1][1], compile_model(model.steps[-1][1])
+    Xt_test = model[:-1].transform(X_test)
+    Xt_test = Xt_test.toarray() if hasattr(Xt_test, 'toarray') else np.asarray(Xt_test)
+    # Repeat the test rows to a fixed batch workload, so throughput is comparable across sizes
+    batch = X_test.iloc[np.arange(args.batch_total) % len(X_test)]
+    return {
+        'model': name,
+        'backend': backend,
+        'trainRows': len(X_train),
+        'fitSeconds': fit_seconds,
+        'singleRowMs': median_latency_ms(model.predict, X_test, args.repeats),
+        'estimatorSingleRowMs': median_latency_ms(final.predict, Xt_test, args.repeats),
+        'servedSingleRowMs': median_latency_ms(compiled.predict, Xt_test, args.repeats),
+        'batchRowsPerSecond': throughput(model.predict, batch, args.batch_rows),
+        'sizeBytes': len(pickle.dumps(model)),
+        'test': evaluate('regression', y_test, model.predict(X_test))
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the regression backends of train.py')
+    parser.add_argument('--models', nargs='+', choices=REGRESSION_MODELS, default=REGRESSION_MODELS)
+    parser.add_argument('--backends', nargs='+', choices=sorted(REGRESSORS), default=sorted(REGRESSORS))
+    parser.add_argument('--n-samples', type=int, default=None, help='rows to generate (default: per model)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeats', type=int, default=300, help='single-row predictions timed')
+    parser.add_argument('--batch-rows', type=int, default=10_000)
+    parser.add_argument('--batch-total', type=int, default=100_000, help='rows predicted for throughput')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'model':<26}{'backend':<9}{'fit s':>8}{'1-row ms':>10}{'model ms':>10}{'served ms':>11}{'rows/s':>11}"
+          f"{'size KB':>9}{'MAE':>9}{'RMSE':>9}{'R²':>8}")
+    for name in args.models:
+        for backend in args.backends:
+            r = compare(name, backend, args.n_samples or MODELS[name]['n_samples'], args.seed, args)
+            results.append(r)
+            print(f"{name:<26}{backend:<9}{r['fitSeconds']:>8.2f}{r['singleRowMs']:>10.3f}{r['estimatorSingleRowMs']:>10.3f}"
+                  f"{r['servedSingleRowMs']:>11.3f}{r['batchRowsPerSecond']:>11.0f}{r['sizeBytes'] / 1024:>9.0f}"
+                  f"{r['test']['mae']:>9.4f}{r['test']['rmse']:>9.4f}{r['test']['r2']:>8.4f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'cpus': os.cpu_count(), 'results': results}, f, indent=2)
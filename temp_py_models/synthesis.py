@@ -0,0 +1,291 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Synthetic training data for the patient-flow, resource-allocation and appointment models.
+#
+# patient_flow_frame / resource_frame / appointment_frame reproduce the datasets the training
+# scripts have always trained on, value for value, for a given seed.
+# iter_patient_flow / iter_resources stream the same distributions in chunks for datasets
+# too large to hold in memory; every BLOCK_ROWS rows draw from their own stream seeded from
+# (seed, block), so the output for a seed does not depend on the chunk size.
+
+PATIENT_TYPES = ['Emergency', 'Routine', 'Follow-up']
+PATIENT_TYPE_P = [0.3, 0.5, 0.2]
+FLOW_DEPARTMENTS = ['General', 'Cardiology', 'Orthopedics', 'Pediatrics', 'OB-GYN']
+RESOURCE_DEPARTMENTS = ['Emergency', 'Surgery', 'Internal Medicine', 'Pediatrics', 'Obstetrics']
+BED_SIZES = [100, 150, 200, 250, 300]
+URGENCIES = ['Low', 'Medium', 'High']
+URGENCY_P = [0.6, 0.3, 0.1]
+URGENCY_EXTRA_MINUTES = {'Low': 0, 'Medium': 5, 'High': 15}
+APPOINTMENT_DEPARTMENTS = ['Cardiology', 'Orthopedics', 'Neurology', 'General']
+
+FLOW_START = pd.Timestamp(2024, 1, 1)
+RESOURCE_START = pd.Timestamp(2019, 1, 1)
+
+# Rows per independently seeded block in the streaming generators
+BLOCK_ROWS = 1 << 16
+
+
+def _by_hour():
+    effect = np.zeros(24, dtype=np.int64)
+    effect[8:12] = 6   # Morning rush
+    effect[13:17] = 5  # Afternoon rush
+    effect[17:20] = 3  # Evening moderate
+    effect[0:6] = -2   # Night hours (reduced traffic)
+    return effect
+
+
+# Queue-length effects, indexed by hour, weekday (Monday=0) and month (January=1)
+QUEUE_HOUR_EFFECT = _by_hour()
+QUEUE_DAY_EFFECT = np.array([4, 0, 0, 0, 3, 0, -1])
+QUEUE_MONTH_EFFECT = np.array([0, 2, 2, 0, 0, 0, -1, -1, -1, 0, 0, 0, 2])
+QUEUE_BASE = 3
+QUEUE_HOLIDAY_EFFECT = 3
+
+# Gamma service time and waiting-time multiplier per PATIENT_TYPES entry
+SERVICE_SHAPE = np.array([3.0, 2.5, 2.0])
+SERVICE_SCALE = np.array([5.0, 4.0, 3.0])
+WAIT_TYPE_FACTOR = np.array([0.4, 1.0, 0.75])
+# Waiting-time multiplier per FLOW_DEPARTMENTS entry, and for night shifts (00-05h)
+WAIT_DEPARTMENT_FACTOR = np.array([1.0, 1.2, 1.1, 1.0, 1.0])
+WAIT_NIGHT_FACTOR = 1.3
+MINUTES_PER_QUEUED_PATIENT = 7
+
+
+def queue_means(hour, day_of_week, month, is_holiday):
+    base = (QUEUE_BASE + QUEUE_HOUR_EFFECT[hour] + QUEUE_DAY_EFFECT[day_of_week]
+            + QUEUE_MONTH_EFFECT[month] + QUEUE_HOLIDAY_EFFECT * is_holiday)
+    return np.maximum(1, base)
+
+
+def waiting_times(queue_length, patient_type, department, hour, noise):
+    # patient_type / department are indices into PATIENT_TYPES / FLOW_DEPARTMENTS
+    wait = queue_length * MINUTES_PER_QUEUED_PATIENT
+    wait = wait * WAIT_TYPE_FACTOR[patient_type]
+    wait = wait * WAIT_DEPARTMENT_FACTOR[department]
+    wait = wait * np.where(hour <= 5, WAIT_NIGHT_FACTOR, 1.0)
+    return np.maximum(0, wait + noise)
+
+
+def _flow_frame(start, hour, day_of_week, month, is_holiday, patient_type, department,
+                queue_length, service_time, wait_noise):
+    frame = pd.DataFrame({
+        'ArrivalTime': start,
+        'DayOfWeek': day_of_week,
+        'Hour': hour,
+        'Month': month,
+        'IsHoliday': is_holiday,
+        'PatientType': np.array(PATIENT_TYPES, dtype=object)[patient_type],
+        'Department': np.array(FLOW_DEPARTMENTS, dtype=object)[department],
+        'QueueLength': queue_length,
+        'ServiceTime': service_time
+    })
+    frame['WaitingTime'] = waiting_times(queue_length, patient_type, department, hour, wait_noise)
+    return frame
+
+
+def _flow_calendar(offset, n, unit='ns'):
+    # Arrivals every two hours from FLOW_START. Streams use second resolution, since
+    # nanoseconds only reach the year 2262 and millions of arrivals run past it.
+    start = FLOW_START.as_unit(unit) + np.timedelta64(2 * offset, 'h')
+    arrivals = pd.date_range(start, periods=n, freq='2h', unit=unit)
+    return arrivals, arrivals.hour.to_numpy(), arrivals.dayofweek.to_numpy(), arrivals.month.to_numpy()
+
+
+def patient_flow_frame(n_samples, seed=42):
+    # The dataset PatientFlowPrediction.py trains on. The legacy generator draws each row's
+    # queue length and service time alternately from one RandomState, and how many numbers a
+    # Poisson or gamma draw consumes depends on the value, so those two draws stay per row to
+    # keep the data identical; everything else is computed over whole columns.
+    rng = np.random.RandomState(seed)
+    arrivals, hour, day_of_week, month = _flow_calendar(0, n_samples)
+    is_holiday = rng.choice([0, 1], n_samples, p=[0.95, 0.05])
+    # Choosing indices consumes the stream exactly like choosing from the label lists did
+    patient_type = rng.choice(len(PATIENT_TYPES), n_samples, p=PATIENT_TYPE_P)
+    department = rng.choice(len(FLOW_DEPARTMENTS), n_samples)
+
+    lam = queue_means(hour, day_of_week, month, is_holiday)
+    shape, scale = SERVICE_SHAPE[patient_type], SERVICE_SCALE[patient_type]
+    queue_length = np.empty(n_samples)
+    service_time = np.empty(n_samples)
+    poisson, gamma = rng.poisson, rng.gamma
+    for i in range(n_samples):
+        queue_length[i] = poisson(lam[i])
+        service_time[i] = gamma(shape[i], scale[i])
+
+    wait_noise = rng.normal(0, 8, n_samples)
+    return _flow_frame(arrivals, hour, day_of_week, month, is_holiday, patient_type, department,
+                       queue_length, service_time, wait_noise)
+
+
+def _block_rng(seed, block):
+    return np.random.default_rng([seed, block])
+
+
+def _blocks(n_samples, chunk_size):
+    # (first row, row count) of each block, grouped into chunks of whole blocks
+    per_chunk = max(1, -(-chunk_size // BLOCK_ROWS))
+    blocks = [(start, min(BLOCK_ROWS, n_samples - start)) for start in range(0, n_samples, BLOCK_ROWS)]
+    for i in range(0, len(blocks), per_chunk):
+        yield blocks[i:i + per_chunk]
+
+
+def patient_flow_block(seed, start, n):
+    rng = _block_rng(seed, start // BLOCK_ROWS)
+    arrivals, hour, day_of_week, month = _flow_calendar(start, n, unit='s')
+    is_holiday = (rng.random(n) < 0.05).astype(np.int64)
+    patient_type = rng.choice(len(PATIENT_TYPES), n, p=PATIENT_TYPE_P)
+    department = rng.integers(0, len(FLOW_DEPARTMENTS), n)
+    queue_length = rng.poisson(queue_means(hour, day_of_week, month, is_holiday)).astype(np.float64)
+    service_time = rng.gamma(SERVICE_SHAPE[patient_type], SERVICE_SCALE[patient_type])
+    wait_noise = rng.normal(0, 8, n)
+    return _flow_frame(arrivals, hour, day_of_week, month, is_holiday, patient_type, department,
+                       queue_length, service_time, wait_noise)
+
+
+def iter_patient_flow(n_samples, seed=42, chunk_size=1_000_000):
+    # DataFrames of about chunk_size rows (rounded up to whole blocks) covering n_samples arrivals
+    for blocks in _blocks(n_samples, chunk_size):
+        yield pd.concat([patient_flow_block(seed, start, n) for start, n in blocks], ignore_index=True)
+
+
+def beds_occupied(admissions, length_of_stay, beds_total, previous=None):
+    # 80% of the admissions over the previous seven days, times the stay in weeks, capped at
+    # 95% of the beds. `previous` holds the admissions of the rows just before this slice, so
+    # a stream can carry the window across chunks; rows with under seven predecessors fall
+    # back to 80% of their own admissions.
+    previous = np.zeros(0, dtype=np.int64) if previous is None else np.asarray(previous)[-7:]
+    padded = np.concatenate([previous, admissions])
+    totals = np.concatenate([[0], np.cumsum(padded)])
+    end = np.arange(len(previous), len(padded))
+    window = totals[end] - totals[np.maximum(end - 7, 0)]
+    occupied = np.minimum(window * 0.8 * length_of_stay / 7, beds_total * 0.95)
+    return np.where(end < 7, admissions * 0.8, occupied)
+
+
+def _resource_frame(dates, is_holiday, department, outpatient, inpatient, staff, beds_total,
+                    length_of_stay, beds):
+    return pd.DataFrame({
+        'Date': dates,
+        'Month': dates.month,
+        'Year': dates.year,
+        'DayOfWeek': dates.dayofweek,
+        'IsHoliday': is_holiday,
+        'Department': department,
+        'OutpatientVisits': outpatient,
+        'InpatientAdmissions': inpatient,
+        'StaffAvailable': staff,
+        'BedsTotal': beds_total,
+        'BedsOccupied': beds,
+        'AvgLengthOfStay': length_of_stay,
+        'BedOccupancyRate': beds / beds_total
+    })
+
+
+def resource_frame(n_samples, seed=42):
+    # The dataset ResourceAllocationOptimization.py trains on: one row per day from RESOURCE_START
+    rng = np.random.RandomState(seed)
+    dates = pd.date_range(RESOURCE_START, periods=n_samples, freq='D')
+    is_holiday = rng.choice([0, 1], n_samples, p=[0.95, 0.05])
+    department = rng.choice(RESOURCE_DEPARTMENTS, n_samples)
+    outpatient = rng.poisson(lam=235, size=n_samples)
+    inpatient = rng.poisson(lam=50, size=n_samples)
+    staff = rng.randint(10, 30, n_samples)
+    beds_total = rng.choice(BED_SIZES, n_samples)
+    length_of_stay = rng.gamma(shape=2, scale=2, size=n_samples) + 2
+    beds = beds_occupied(inpatient, length_of_stay, beds_total)
+    return _resource_frame(dates, is_holiday, department, outpatient, inpatient, staff, beds_total,
+                           length_of_stay, beds)
+
+
+def iter_resources(n_samples, seed=42, chunk_size=1_000_000):
+    # DataFrames of about chunk_size days (rounded up to whole blocks) covering n_samples days
+    previous = np.zeros(0, dtype=np.int64)
+    for blocks in _blocks(n_samples, chunk_size):
+        frames = []
+        for start, n in blocks:
+            rng = _block_rng(seed, start // BLOCK_ROWS)
+            # Second resolution, as for arrivals: a long stream of days runs past the year 2262
+            dates = pd.date_range(RESOURCE_START.as_unit('s') + np.timedelta64(start, 'D'), periods=n,
+                                  freq='D', unit='s')
+            is_holiday = (rng.random(n) < 0.05).astype(np.int64)
+            department = np.array(RESOURCE_DEPARTMENTS, dtype=object)[rng.integers(0, len(RESOURCE_DEPARTMENTS), n)]
+            outpatient = rng.poisson(235, n)
+            inpatient = rng.poisson(50, n)
+            staff = rng.integers(10, 30, n)
+            beds_total = rng.choice(BED_SIZES, n)
+            length_of_stay = rng.gamma(2, 2, n) + 2
+            beds = beds_occupied(inpatient, length_of_stay, beds_total, previous)
+            previous = np.concatenate([previous, inpatient])[-7:]
+            frames.append(_resource_frame(dates, is_holiday, department, outpatient, inpatient, staff,
+                                          beds_total, length_of_stay, beds))
+        yield pd.concat(frames, ignore_index=True)
+
+
+def appointment_frame(n_samples, seed=42):
+    # The dataset AppointmentSchedulingOptimization.py trains on (shaped after the Hangu dataset)
+    rng = np.random.RandomState(seed)
+    frame = pd.DataFrame({
+        'PatientID': range(1, n_samples + 1),
+        'Age': rng.randint(18, 90, n_samples),
+        'Gender': rng.choice(['M', 'F'], n_samples),
+        'VisitType': rng.choice(['New', 'Follow-up'], n_samples),
+        'Urgency': rng.choice(URGENCIES, n_samples, p=URGENCY_P),
+        'Department': rng.choice(APPOINTMENT_DEPARTMENTS, n_samples),
+        'ServiceTime': rng.gamma(shape=2, scale=10, size=n_samples),  # minutes
+        'DoctorID': rng.randint(1, 21, n_samples)  # 20 doctors
+    })
+    # Urgent visits take longer
+    frame['ServiceTime'] += frame['Urgency'].map(URGENCY_EXTRA_MINUTES)
+    return frame
+
+
+def write_chunks(chunks, path):
+    # Write a stream of DataFrames to one .csv or .parquet file (Parquet needs pyarrow);
+    # returns the number of rows written
+    rows = 0
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit('Writing Parquet needs pyarrow (pip install pyarrow); use a .csv path instead')
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        rows += len(chunk)
+    return rows
+
+
+GENERATORS = {
+    'patient_flow': iter_patient_flow,
+    'resources': iter_resources
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stream a synthetic training dataset to disk')
+    parser.add_argument('dataset', choices=sorted(GENERATORS))
+    parser.add_argument('rows', type=int)
+    parser.add_argument('output', help='.csv or .parquet file')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    written = write_chunks(GENERATORS[args.dataset](args.rows, args.seed, args.chunk_size), args.output)
+    print(f'Wrote {written} rows to {os.path.abspath(args.output)}')
@@ -0,0 +1,468 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor, RandomForestClassifier
+from sklearn.metrics import (accuracy_score, classification_report, make_scorer, mean_absolute_error,
+                             mean_pinball_loss, mean_squared_error, r2_score)
+from sklearn.model_selection import GridSearchCV, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from synthesis import appointment_frame, patient_flow_frame, resource_frame
+
+# One entry point for training every model the API serves:
+#   python temp_py_models/train.py all --search --n-jobs -1
+# Each model is trained from its entry in MODELS (optionally overridden by --config JSON),
+# evaluated on a held-out split, and written to models/<name>_model.pkl with a metrics file
+# beside it; every run is also kept under models/history/. Without --search the default
+# backend reproduces what the standalone training scripts produce; --backend hgb trains the
+# regressors with histogram gradient boosting instead (compare_backends.py measures both).
+# patient_flow_p10 / _p50 / _p90 are the quantile models behind the waiting-time intervals.
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+MODELS_DIR = os.path.join(BASE_DIR, 'models')
+CACHE_DIR = os.path.join(BASE_DIR, '.train_cache')
+
+
+def patient_flow_data(n_samples, seed):
+    df = patient_flow_frame(n_samples, seed)
+    df['Hour_sin'] = np.sin(2 * np.pi * df['Hour']/24)
+    df['Hour_cos'] = np.cos(2 * np.pi * df['Hour']/24)
+    df['DayOfWeek_sin'] = np.sin(2 * np.pi * df['DayOfWeek']/7)
+    df['DayOfWeek_cos'] = np.cos(2 * np.pi * df['DayOfWeek']/7)
+    df['Month_sin'] = np.sin(2 * np.pi * df['Month']/12)
+    df['Month_cos'] = np.cos(2 * np.pi * df['Month']/12)
+    df['IsWeekend'] = (df['DayOfWeek'] >= 5).astype(int)
+    df['TimeOfDay'] = pd.cut(df['Hour'], [0, 6, 12, 18, 24], right=False,
+                             labels=['Night', 'Morning', 'Afternoon', 'Evening']).astype(str)
+    df = pd.get_dummies(df, columns=['PatientType', 'Department', 'TimeOfDay'], drop_first=False)
+
+    features = ['Hour_sin', 'Hour_cos', 'DayOfWeek_sin', 'DayOfWeek_cos',
+                'Month_sin', 'Month_cos', 'IsHoliday', 'IsWeekend', 'QueueLength', 'ServiceTime'] + \
+               [col for col in df.columns if col.startswith(('PatientType_', 'Department_', 'TimeOfDay_'))]
+    return df[features], df['WaitingTime']
+
+
+RESOURCE_NUMERIC = ['Month_sin', 'Month_cos', 'DayOfWeek_sin', 'DayOfWeek_cos', 'IsHoliday',
+                    'OutpatientVisits', 'InpatientAdmissions', 'StaffAvailable', 'AvgLengthOfStay', 'Year']
+
+
+def resource_data(n_samples, seed, target):
+    df = resource_frame(n_samples, seed)
+    df['Month_sin'] = np.sin(2 * np.pi * df['Month']/12)
+    df['Month_cos'] = np.cos(2 * np.pi * df['Month']/12)
+    df['DayOfWeek_sin'] = np.sin(2 * np.pi * df['DayOfWeek']/7)
+    df['DayOfWeek_cos'] = np.cos(2 * np.pi * df['DayOfWeek']/7)
+    if target == 'beds':
+        y = df['BedOccupancyRate']
+    else:
+        y = df['StaffAvailable'] * (df['OutpatientVisits'] / df['OutpatientVisits'].mean())  # Synthetic staff needs
+    return df[RESOURCE_NUMERIC + ['Department']], y
+
+
+def resource_bed_data(n_samples, seed):
+    return resource_data(n_samples, seed, 'beds')
+
+
+def resource_staff_data(n_samples, seed):
+    return resource_data(n_samples, seed, 'staff')
+
+
+def appointment_data(n_samples, seed):
+    df = appointment_frame(n_samples, seed)
+    X = df.drop(['PatientID', 'ServiceTime', 'DoctorID'], axis=1)
+    y = pd.cut(df['ServiceTime'], bins=[0, 10, 20, 100], labels=['Short', 'Medium', 'Long'])
+    return X, y
+
+
+def gradient_boosting(**params):
+    return GradientBoostingRegressor(random_state=42, **params)
+
+
+def hist_gradient_boosting(**params):
+    # Bins features into at most 255 buckets and fits/predicts on every core (OpenMP)
+    return HistGradientBoostingRegressor(random_state=42, early_stopping=False, **params)
+
+
+# Final estimators a regression model can be trained with; 'gbr' is what the scripts use
+REGRESSORS = {
+    'gbr': gradient_boosting,
+    'hgb': hist_gradient_boosting
+}
+
+
+def patient_flow_pipeline(memory, backend='gbr'):
+    return Pipeline([
+        ('scaler', StandardScaler()),
+        ('model', REGRESSORS[backend]())
+    ], memory=memory)
+
+
+def patient_flow_quantile_pipeline(alpha):
+    # No scaler: the trees do not need one, and python/app.py evaluates these models on the
+    # same encoded feature matrix as the point model
+    def pipeline(memory, backend='gbr'):
+        return Pipeline([
+            ('model', gradient_boosting(loss='quantile', alpha=alpha))
+        ], memory=memory)
+
+    return pipeline
+
+
+def resource_pipeline(memory, backend='gbr'):
+    preprocessor = ColumnTransformer(transformers=[
+        ('num', StandardScaler(), RESOURCE_NUMERIC),
+        ('cat', OneHotEncoder(handle_unknown='ignore'), ['Department'])
+    ])
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('regressor', REGRESSORS[backend](**({'n_estimators': 100} if backend == 'gbr' else {})))
+    ], memory=memory)
+
+
+def appointment_pipeline(memory, backend='rf'):
+    preprocessor = ColumnTransformer(transformers=[
+        ('num', StandardScaler(), ['Age']),
+        ('cat', OneHotEncoder(handle_unknown='ignore'), ['Gender', 'VisitType', 'Urgency', 'Department'])
+    ])
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('classifier', RandomForestClassifier(n_estimators=100, random_state=42))
+    ], memory=memory)
+
+
+# The histogram backend mirrors the exact one: same iterations, depth and leaf size
+RESOURCE_BACKENDS = {
+    'gbr': {
+        'params': {},
+        'grid': {
+            'regressor__n_estimators': [100, 200],
+            'regressor__max_depth': [2, 3, 4],
+            'regressor__learning_rate': [0.05, 0.1]
+        }
+    },
+    'hgb': {
+        'params': {
+            'regressor__max_iter': 100,
+            'regressor__max_depth': 3,
+            'regressor__max_leaf_nodes': None,
+            'regressor__min_samples_leaf': 1
+        },
+        'grid': {
+            'regressor__max_iter': [100, 200],
+            'regressor__max_depth': [2, 3, 4],
+            'regressor__learning_rate': [0.05, 0.1]
+        }
+    }
+}
+
+def patient_flow_quantile(alpha):
+    # Same data as patient_flow; shallower trees with larger leaves keep the tails from
+    # chasing single rows (deeper ones cover ~67% of held-out waits between p10 and p90)
+    return {
+        'data': patient_flow_data,
+        'pipeline': patient_flow_quantile_pipeline(alpha),
+        'task': 'quantile',
+        'alpha': alpha,
+        'n_samples': 2000,
+        'backends': {
+            'gbr': {
+                'params': {
+                    'model__n_estimators': 200,
+                    'model__max_depth': 3,
+                    'model__learning_rate': 0.05,
+                    'model__min_samples_split': 5,
+                    'model__min_samples_leaf': 30
+                },
+                'grid': {
+                    'model__n_estimators': [100, 200, 400],
+                    'model__max_depth': [3, 4, 5],
+                    'model__learning_rate': [0.05, 0.1],
+                    'model__min_samples_leaf': [10, 30, 60]
+                }
+            }
+        }
+    }
+
+
+# data(n_samples, seed) -> (X, y); pipeline(memory, backend) -> unfitted Pipeline. The first
+# backend is the default; its `params` are what the standalone scripts train with, and
+# `grid` is what --search explores around them.
+MODELS = {
+    'patient_flow': {
+        'data': patient_flow_data,
+        'pipeline': patient_flow_pipeline,
+        'task': 'regression',
+        'n_samples': 2000,
+        'backends': {
+            'gbr': {
+                'params': {
+                    'model__n_estimators': 200,
+                    'model__max_depth': 5,
+                    'model__learning_rate': 0.1,
+                    'model__min_samples_split': 5,
+                    'model__min_samples_leaf': 2
+                },
+                'grid': {
+                    'model__n_estimators': [100, 200, 400],
+                    'model__max_depth': [3, 5, 7],
+                    'model__learning_rate': [0.05, 0.1],
+                    'model__min_samples_leaf': [2, 10]
+                }
+            },
+            'hgb': {
+                'params': {
+                    'model__max_iter': 200,
+                    'model__max_depth': 5,
+                    'model__max_leaf_nodes': None,
+                    'model__learning_rate': 0.1,
+                    'model__min_samples_leaf': 2
+                },
+                'grid': {
+                    'model__max_iter': [100, 200, 400],
+                    'model__max_depth': [3, 5, 7],
+                    'model__learning_rate': [0.05, 0.1],
+                    'model__min_samples_leaf': [2, 20]
+                }
+            }
+        }
+    },
+    'patient_flow_p10': patient_flow_quantile(0.1),
+    'patient_flow_p50': patient_flow_quantile(0.5),
+    'patient_flow_p90': patient_flow_quantile(0.9),
+    'resource_allocation_bed': {
+        'data': resource_bed_data,
+        'pipeline': resource_pipeline,
+        'task': 'regression',
+        'n_samples': 500,
+        'backends': RESOURCE_BACKENDS
+    },
+    'resource_allocation_staff': {
+        'data': resource_staff_data,
+        'pipeline': resource_pipeline,
+        'task': 'regression',
+        'n_samples': 500,
+        'backends': RESOURCE_BACKENDS
+    },
+    'appointment_scheduling': {
+        'data': appointment_data,
+        'pipeline': appointment_pipeline,
+        'task': 'classification',
+        'n_samples': 1000,
+        'backends': {
+            'rf': {
+                'params': {},
+                'grid': {
+                    'classifier__n_estimators': [100, 300],
+                    'classifier__max_depth': [None, 8, 16],
+                    'classifier__min_samples_leaf': [1, 5]
+                }
+            }
+        }
+    }
+}
+
+
+def backend_of(spec, requested):
+    # The requested backend when the model has it, else the model's default
+    return requested if requested in spec['backends'] else next(iter(spec['backends']))
+
+
+def load_config(path):
+    # {"patient_flow": {"n_samples": 100000, "backend": "hgb", "params": {...}, "grid": {...}}, ...}
+    # params and grid replace those of the backend the model is trained with
+    with open(path) as f:
+        overrides = json.load(f)
+    unknown = set(overrides) - set(MODELS)
+    if unknown:
+        raise SystemExit(f'Unknown models in {path}: {", ".join(sorted(unknown))}')
+    allowed = {'n_samples', 'seed', 'backend', 'params', 'grid', 'test_size'}
+    for name, override in overrides.items():
+        bad = set(override) - allowed
+        if bad:
+            raise SystemExit(f'Unknown settings for {name} in {path}: {", ".join(sorted(bad))}')
+    return overrides
+
+
+def evaluate(task, y_test, y_pred, alpha=None):
+    if task == 'quantile':
+        # coverage: share of held-out targets at or below the prediction, ideally alpha
+        return {
+            'alpha': alpha,
+            'coverage': float(np.mean(np.asarray(y_test) <= y_pred)),
+            'pinball': mean_pinball_loss(y_test, y_pred, alpha=alpha),
+            'mae': mean_absolute_error(y_test, y_pred)
+        }
+    if task == 'classification':
+        return {
+            'accuracy': accuracy_score(y_test, y_pred),
+            'report': classification_report(y_test, y_pred, output_dict=True, zero_division=0)
+        }
+    mse = mean_squared_error(y_test, y_pred)
+    return {
+        'mse': mse,
+        'rmse': float(np.sqrt(mse)),
+        'mae': mean_absolute_error(y_test, y_pred),
+        'r2': r2_score(y_test, y_pred)
+    }
+
+
+def plot(name, task, model, X_test, y_test, y_pred, out_dir):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    if task == 'regression':
+        plt.figure(figsize=(10, 6))
+        plt.scatter(y_test, y_pred, alpha=0.5)
+        plt.plot([0, max(y_test)], [0, max(y_test)], 'r--')
+        plt.xlabel('Actual')
+        plt.ylabel('Predicted')
+        plt.title(f'{name}: actual vs predicted')
+        plt.savefig(os.path.join(out_dir, f'{name}_predictions.png'))
+        plt.close()
+
+    final = model.steps[-1][1]
+    if hasattr(final, 'feature_importances_'):
+        names = model[:-1].get_feature_names_out() if len(model.steps) > 1 else X_test.columns
+        importance = pd.Series(final.feature_importances_, index=names).sort_values(ascending=False).head(15)
+        plt.figure(figsize=(12, 8))
+        plt.barh(importance.index, importance.values)
+        plt.xlabel('Importance')
+        plt.title(f'{name}: top features by importance')
+        plt.gca().invert_yaxis()
+        plt.tight_layout()
+        plt.savefig(os.path.join(out_dir, f'{name}_feature_importance.png'))
+        plt.close()
+
+
+def save(name, model, metrics, out_dir):
+    # Write the pickle under history/ keyed by its digest, then swap it in as <name>_model.pkl
+    # with one rename so a running server's hot reload never reads a partial file
+    blob = pickle.dumps(model)
+    version = hashlib.sha256(blob).hexdigest()[:12]
+    metrics['version'] = version
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    history = os.path.join(out_dir, 'history')
+    os.makedirs(history, exist_ok=True)
+
+    versioned = os.path.join(history, f'{name}_model-{stamp}-{version}')
+    with open(f'{versioned}.pkl', 'wb') as f:
+        f.write(blob)
+    with open(f'{versioned}.metrics.json', 'w') as f:
+        json.dump(metrics, f, indent=2, default=str)
+
+    live = os.path.join(out_dir, f'{name}_model')
+    with open(f'{live}.metrics.json', 'w') as f:
+        json.dump(metrics, f, indent=2, default=str)
+    tmp = f'{live}.pkl.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(blob)
+    os.replace(tmp, f'{live}.pkl')
+    return version
+
+
+def train(name, spec, args, memory):
+    started = time.perf_counter()
+    n_samples = args.n_samples or spec['n_samples']
+    seed = spec.get('seed', args.seed)
+    X, y = memory.cache(spec['data'])(n_samples, seed) if memory is not None else spec['data'](n_samples, seed)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=spec.get('test_size', 0.2), random_state=42)
+
+    backend = backend_of(spec, spec.get('backend', args.backend))
+    params = spec.get('params', spec['backends'][backend]['params'])
+    grid = spec.get('grid', spec['backends'][backend]['grid'])
+    model = spec['pipeline'](memory, backend)
+    model.set_params(**params)
+    search = None
+    if args.search:
+        # Fitted preprocessing is cached in `memory`, so every candidate of a fold reuses it
+        scoring = {
+            'regression': 'neg_mean_absolute_error',
+            'classification': 'accuracy',
+            'quantile': make_scorer(mean_pinball_loss, alpha=spec.get('alpha'), greater_is_better=False)
+        }[spec['task']]
+        search = GridSearchCV(model, grid, cv=args.cv, n_jobs=args.n_jobs, scoring=scoring)
+        search.fit(X_train, y_train)
+        model = search.best_estimator_
+    else:
+        model.fit(X_train, y_train)
+    # The cache directory is a build-time detail; the served pickle must not refer to it
+    model.set_params(memory=None)
+
+    y_pred = model.predict(X_test)
+    metrics = {
+        'model': name,
+        'trainedAt': datetime.now(timezone.utc).isoformat(),
+        'sklearnVersion': sklearn.__version__,
+        'nSamples': n_samples,
+        'seed': seed,
+        'backend': backend,
+        'params': {k: v for k, v in model.get_params().items() if k.startswith(model.steps[-1][0] + '__')},
+        'test': evaluate(spec['task'], y_test, y_pred, spec.get('alpha'))
+    }
+    if search is not None:
+        metrics['search'] = {
+            'grid': grid,
+            'cv': args.cv,
+            'candidates': len(search.cv_results_['params']),
+            'bestParams': search.best_params_,
+            'bestScore': search.best_score_
+        }
+    metrics['trainSeconds'] = round(time.perf_counter() - started, 2)
+
+    if args.plot:
+        plot(name, spec['task'], model, X_test, y_test, y_pred, args.output_dir)
+    return model, metrics
+
+
+def summary(metrics):
+    test = metrics['test']
+    if 'accuracy' in test:
+        return f"accuracy {test['accuracy']:.4f}"
+    if 'coverage' in test:
+        return f"coverage {test['coverage']:.3f} (target {test['alpha']}), pinball loss {test['pinball']:.4f}"
+    return f"MAE {test['mae']:.4f}, RMSE {test['rmse']:.4f}, R² {test['r2']:.4f}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the models served by python/app.py')
+    parser.add_argument('models', nargs='+', choices=sorted(MODELS) + ['all'])
+    parser.add_argument('--config', help='JSON file overriding n_samples, seed, params or grid per model')
+    parser.add_argument('--backend', choices=sorted(REGRESSORS), default='gbr',
+                        help='final estimator for the regression models (python/app.py serves either)')
+    parser.add_argument('--search', action='store_true', help='grid-search hyperparameters with cross-validation')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='parallel search jobs (-1: every core)')
+    parser.add_argument('--cv', type=int, default=5)
+    parser.add_argument('--n-samples', type=int, default=None, help='rows to generate (default: per model)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--plot', action='store_true', help='also save evaluation plots (needs matplotlib)')
+    parser.add_argument('--output-dir', default=MODELS_DIR)
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help="where generated data and fitted preprocessing are cached ('' disables)")
+    args = parser.parse_args()
+
+    names = sorted(MODELS) if 'all' in args.models else list(dict.fromkeys(args.models))
+    overrides = load_config(args.config) if args.config else {}
+    memory = joblib.Memory(args.cache_dir, verbose=0) if args.cache_dir else None
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    for name in names:
+        spec = dict(MODELS[name], **overrides.get(name, {}))
+        model, metrics = train(name, spec, args, memory)
+        if len(model.steps) == 1:
+            # Nothing but the estimator; saved bare, like the shipped patient-flow model
+            model = model.steps[-1][1]
+        version = save(name, model, metrics, args.output_dir)
+        print(f"{name} ({metrics['backend']}): {summary(metrics)} in {metrics['trainSeconds']}s -> {name}_model.pkl (version {version})")
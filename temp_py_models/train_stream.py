@@ -0,0 +1,205 @@
+import argparse
+import os
+import resource
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import HistGradientBoostingRegressor
+
+from synthesis import FLOW_DEPARTMENTS, PATIENT_TYPES
+from train import MODELS_DIR, evaluate, save, summary
+
+# Out-of-core training of the patient-flow model from arrival logs too large for memory:
+#   python temp_py_models/train_stream.py arrivals.parquet --chunk-size 1000000
+#
+# The log is read one chunk at a time and boosted chunk by chunk: the first chunk fits a
+# histogram gradient-boosting model, and every later chunk fits a few more trees to the
+# residuals the model so far leaves on that chunk, which are appended to it. That is
+# gradient boosting where each stage sees a different slice of the data (as with
+# subsample < 1), and peak memory is set by the chunk size whatever the log's length.
+#
+# The result is a plain HistGradientBoostingRegressor over the feature layout of the
+# shipped patient_flow_model.pkl, so python/app.py serves it unchanged.
+
+INPUT_COLUMNS = ['PatientType', 'Department', 'QueueLength', 'ServiceTime', 'WaitingTime']
+FEATURES = [
+    'Hour_sin', 'Hour_cos', 'DayOfWeek_sin', 'DayOfWeek_cos', 'Month_sin', 'Month_cos', 'IsHoliday',
+    'QueueLength', 'ServiceTime'
+] + [f'PatientType_{pt}' for pt in sorted(PATIENT_TYPES)] + [f'Department_{d}' for d in sorted(FLOW_DEPARTMENTS)]
+
+# Rows kept for evaluation: every HOLDOUT_EVERY-th row, reservoir-sampled down to HOLDOUT_ROWS
+HOLDOUT_EVERY = 10
+HOLDOUT_ROWS = 200_000
+
+
+def count_rows(path):
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(path, 'rb') as f:
+        return sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 24), b'')) - 1
+
+
+def read_chunks(path, chunk_size):
+    # DataFrames of at most chunk_size rows; Parquet needs pyarrow
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit('Reading Parquet needs pyarrow (pip install pyarrow); convert the log to CSV instead')
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def calendar(chunk):
+    # hour, dayOfWeek (Monday=0) and month columns, from explicit columns or ArrivalTime
+    if {'Hour', 'DayOfWeek', 'Month'} <= set(chunk.columns):
+        return (chunk['Hour'].to_numpy(np.int64), chunk['DayOfWeek'].to_numpy(np.int64),
+                chunk['Month'].to_numpy(np.int64))
+    arrival = pd.to_datetime(chunk['ArrivalTime'])
+    return arrival.dt.hour.to_numpy(np.int64), arrival.dt.dayofweek.to_numpy(np.int64), arrival.dt.month.to_numpy(np.int64)
+
+
+def index_of(values, labels):
+    codes = pd.Categorical(values, categories=labels).codes.astype(np.int64)
+    if (codes < 0).any():
+        unknown = sorted(set(pd.Series(values)[codes < 0].astype(str)))
+        raise ValueError(f'unknown categories {unknown}; expected {labels}')
+    return codes
+
+
+def chunk_features(chunk):
+    # (X, y) for a chunk of the log, X in the column order of FEATURES
+    missing = set(INPUT_COLUMNS) - set(chunk.columns)
+    if missing:
+        raise ValueError(f'input is missing columns {sorted(missing)}')
+    hour, day, month = calendar(chunk)
+    angles = {'Hour': 2 * np.pi * hour / 24, 'DayOfWeek': 2 * np.pi * day / 7, 'Month': 2 * np.pi * month / 12}
+    columns = {}
+    for name, angle in angles.items():
+        columns[f'{name}_sin'] = np.sin(angle)
+        columns[f'{name}_cos'] = np.cos(angle)
+    columns['IsHoliday'] = chunk['IsHoliday'].to_numpy(np.float64) if 'IsHoliday' in chunk else 0.0
+    columns['QueueLength'] = chunk['QueueLength'].to_numpy(np.float64)
+    columns['ServiceTime'] = chunk['ServiceTime'].to_numpy(np.float64)
+    patient_type = index_of(chunk['PatientType'], PATIENT_TYPES)
+    department = index_of(chunk['Department'], FLOW_DEPARTMENTS)
+    for i, pt in enumerate(PATIENT_TYPES):
+        columns[f'PatientType_{pt}'] = (patient_type == i).astype(np.float64)
+    for i, dept in enumerate(FLOW_DEPARTMENTS):
+        columns[f'Department_{dept}'] = (department == i).astype(np.float64)
+    X = pd.DataFrame(columns, columns=FEATURES, index=chunk.index)
+    return X, chunk['WaitingTime'].to_numpy(np.float64)
+
+
+class Reservoir:
+    # Uniform sample of at most `size` rows of a stream of arrays (Algorithm R, vectorized per chunk)
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.seen = 0
+        self.items = None
+
+    def add(self, items):
+        fill = min(len(items), self.size - (0 if self.items is None else len(self.items)))
+        head, rest = items[:fill], items[fill:]
+        self.items = head.copy() if self.items is None else np.concatenate([self.items, head])
+        self.seen += fill
+        if len(rest) == 0:
+            return
+        # The k-th item seen replaces a random slot with probability size / k
+        slots = self.rng.integers(0, self.seen + np.arange(1, len(rest) + 1))
+        keep = np.flatnonzero(slots < self.size)[::-1]
+        # Later rows win when several land on one slot, as in the sequential algorithm
+        slots, first = np.unique(slots[keep], return_index=True)
+        self.items[slots] = rest[keep[first]]
+        self.seen += len(rest)
+
+
+def append_stage(model, stage):
+    # Add a model fitted to `model`'s residuals onto it, as further boosting iterations.
+    # Prediction walks the trees on raw feature values, so trees binned on different chunks
+    # combine; the stage's own baseline (its mean residual) is folded into its first tree.
+    predictors = stage._predictors
+    first = predictors[0][0]
+    first.nodes['value'][first.nodes['is_leaf'].astype(bool)] += stage._baseline_prediction.ravel()[0]
+    model._predictors.extend(predictors)
+    model.max_iter = model.n_iter_
+
+
+def train(path, chunk_size, params, trees_per_chunk, seed):
+    model = None
+    holdout = Reservoir(HOLDOUT_ROWS, np.random.default_rng(seed))
+    rows = 0
+    for i, chunk in enumerate(read_chunks(path, chunk_size)):
+        X, y = chunk_features(chunk)
+        held = (np.arange(rows, rows + len(chunk)) % HOLDOUT_EVERY) == 0
+        rows += len(chunk)
+        holdout.add(np.column_stack([X.to_numpy()[held], y[held]]))
+        X, y = X[~held], y[~held]
+        if len(y) == 0:
+            continue
+
+        stage = HistGradientBoostingRegressor(**dict(params, max_iter=trees_per_chunk, random_state=seed + i))
+        if model is None:
+            model = stage.fit(X, y)
+        else:
+            append_stage(model, stage.fit(X, y - model.predict(X)))
+    if model is None:
+        raise SystemExit(f'{path} has no rows')
+    return model, rows, pd.DataFrame(holdout.items, columns=FEATURES + ['WaitingTime'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Train patient_flow_model.pkl out of core from a CSV or Parquet arrival log')
+    parser.add_argument('data', help='CSV/Parquet with PatientType, Department, QueueLength, ServiceTime, '
+                                     'WaitingTime and either ArrivalTime or Hour/DayOfWeek/Month (IsHoliday optional)')
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help='rows in memory at once')
+    parser.add_argument('--max-iter', type=int, default=300,
+                        help='boosting iterations in total, spread evenly over the chunks (at least one each)')
+    parser.add_argument('--learning-rate', type=float, default=0.1)
+    parser.add_argument('--max-leaf-nodes', type=int, default=31)
+    parser.add_argument('--min-samples-leaf', type=int, default=20)
+    parser.add_argument('--l2-regularization', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output-dir', default=MODELS_DIR)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    chunks = max(1, -(-count_rows(args.data) // args.chunk_size))
+    trees_per_chunk = max(1, -(-args.max_iter // chunks))
+    params = {
+        'learning_rate': args.learning_rate, 'max_leaf_nodes': args.max_leaf_nodes,
+        'min_samples_leaf': args.min_samples_leaf, 'l2_regularization': args.l2_regularization,
+        'early_stopping': False
+    }
+    model, rows, holdout = train(args.data, args.chunk_size, params, trees_per_chunk, args.seed)
+    y_pred = model.predict(holdout[FEATURES])
+
+    metrics = {
+        'model': 'patient_flow',
+        'trainedAt': datetime.now(timezone.utc).isoformat(),
+        'sklearnVersion': sklearn.__version__,
+        'source': os.path.abspath(args.data),
+        'rows': rows,
+        'chunkSize': args.chunk_size,
+        'treesPerChunk': trees_per_chunk,
+        'iterations': model.n_iter_,
+        'params': params,
+        'test': evaluate('regression', holdout['WaitingTime'], y_pred),
+        'holdoutRows': len(holdout),
+        'trainSeconds': round(time.perf_counter() - started, 2),
+        'peakRssMB': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+    version = save('patient_flow', model, metrics, args.output_dir)
+    print(f"patient_flow: {rows} rows in {chunks} chunks, {model.n_iter_} iterations, {summary(metrics)} "
+          f"in {metrics['trainSeconds']}s, peak RSS {metrics['peakRssMB']} MB "
+          f"-> patient_flow_model.pkl (version {version})")